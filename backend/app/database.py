@@ -1,31 +1,322 @@
 """
 Database connection and session management.
 Provides SQLAlchemy engine and session factory.
+
+The engine is created on first use rather than at import time, so importing
+the app (and cold starts that never touch the database before the first
+request) don't pay for loading the DB driver and building the pool.
+
+Read-only dashboard and export queries can be routed to an optional read
+replica (replica_database_url), falling back to the primary when the
+replica is unreachable or lags by more than replica_max_lag. A read that
+fails on the replica anyway is retried once on the primary.
+
+With a sqlite:/// DATABASE_URL the service runs as a single embedded node:
+connections use WAL with tuned pragmas, and metric inserts are funnelled
+through one writer thread so request threads never contend for SQLite's
+single write lock.
 """
 
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import Callable, Generator, Optional, TypeVar
+import logging
+import threading
+import time
 from .config import get_settings
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
-# Create SQLAlchemy engine
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10
-)
+T = TypeVar("T")
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+_writer: Optional[ThreadPoolExecutor] = None
+_writer_lock = threading.Lock()
+
+_replica_engine: Optional[Engine] = None
+_replica_lock = threading.Lock()
+_replica_state = {"usable": False, "checked_at": 0.0, "lag": None}
+
+# Postgres replication lag in seconds; 0 when caught up with the primary's WAL
+# (replay timestamps alone would report an idle primary as lag)
+_REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def is_sqlite() -> bool:
+    """Check whether the primary database is an embedded SQLite file."""
+    return settings.database_url.startswith("sqlite")
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Configure every new SQLite connection for concurrent readers and cheap commits."""
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL lets readers run alongside the writer; NORMAL only fsyncs at
+        # checkpoints, which is still crash-safe (not power-loss-safe) in WAL mode
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kb)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def get_engine() -> Engine:
+    """
+    Get the SQLAlchemy engine, creating it on first call.
+
+    Returns:
+        Process-wide Engine
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from sqlalchemy import create_engine
+
+                if is_sqlite():
+                    # Connections are shared across the threadpool; SQLite's
+                    # own locking (and busy_timeout) keeps that safe
+                    _engine = create_engine(
+                        settings.database_url,
+                        connect_args={"check_same_thread": False}
+                    )
+                    event.listen(_engine, "connect", _set_sqlite_pragmas)
+                else:
+                    _engine = create_engine(
+                        settings.database_url,
+                        pool_pre_ping=True,
+                        pool_size=5,
+                        max_overflow=10
+                    )
+    return _engine
+
+
+def _get_writer() -> Optional[ThreadPoolExecutor]:
+    """Get the single metric writer thread, or None unless running on SQLite with it enabled."""
+    global _writer
+    if not is_sqlite() or not settings.sqlite_single_writer:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+    return _writer
+
+
+def run_write(db: Session, func: Callable[[Session], T]) -> T:
+    """
+    Run a write transaction, serialized through the writer thread on SQLite.
+
+    SQLite allows one writer at a time, so concurrent transactions would
+    otherwise queue on busy_timeout (or fail with "database is locked").
+    On the writer thread `func` gets a fresh session; on other databases it
+    runs inline with the caller's session.
+
+    Args:
+        db: Caller's session
+        func: Callable performing and committing the write
+
+    Returns:
+        Whatever func returns (its exceptions propagate to the caller)
+    """
+    writer = _get_writer()
+    if writer is None:
+        return func(db)
+
+    def job() -> T:
+        session = SessionLocal()
+        try:
+            return func(session)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    return writer.submit(job).result()
+
+
+def close_writer() -> None:
+    """Finish queued writes and stop the writer thread (on shutdown)."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.shutdown(wait=True)
+            _writer = None
+
+
+def get_replica_engine() -> Optional[Engine]:
+    """
+    Get the read replica engine, creating it on first call.
+
+    Returns:
+        Replica Engine, or None if no replica is configured
+    """
+    global _replica_engine
+    if not settings.replica_database_url:
+        return None
+    if _replica_engine is None:
+        with _replica_lock:
+            if _replica_engine is None:
+                from sqlalchemy import create_engine
+
+                connect_args = {}
+                if settings.replica_database_url.startswith("postgresql"):
+                    # Fail over to the primary quickly instead of hanging on a dead replica
+                    connect_args["connect_timeout"] = 2
+                _replica_engine = create_engine(
+                    settings.replica_database_url,
+                    pool_pre_ping=True,
+                    pool_size=5,
+                    max_overflow=10,
+                    connect_args=connect_args
+                )
+                event.listen(_replica_engine, "handle_error", _on_replica_error)
+    return _replica_engine
+
+
+def _on_replica_error(context) -> None:
+    """Stop routing reads to the replica after a connection-level error until the next check."""
+    if context.is_disconnect:
+        logger.warning("Read replica connection lost, using primary: %s", context.original_exception)
+        _replica_state["usable"] = False
+        _replica_state["checked_at"] = time.monotonic()
+
+
+def _check_replica(replica: Engine) -> None:
+    """Probe the replica and record whether it is reachable and within the lag tolerance."""
+    try:
+        with replica.connect() as conn:
+            if replica.dialect.name == "postgresql":
+                lag = float(conn.execute(_REPLICA_LAG_SQL).scalar() or 0.0)
+            else:
+                conn.execute(text("SELECT 1"))
+                lag = 0.0
+    except Exception as e:
+        if _replica_state["usable"]:
+            logger.warning("Read replica unavailable, using primary: %s", e)
+        _replica_state.update(usable=False, lag=None)
+        return
+
+    usable = lag <= settings.replica_max_lag
+    if usable != _replica_state["usable"]:
+        if usable:
+            logger.info("Routing reads to replica (lag %.1fs)", lag)
+        else:
+            logger.warning(
+                "Read replica lag %.1fs exceeds %ss, using primary", lag, settings.replica_max_lag
+            )
+    _replica_state.update(usable=usable, lag=lag)
+
+
+def replica_usable() -> bool:
+    """
+    Check whether reads should go to the replica.
+
+    The replica is probed at most once per replica_check_interval; other
+    callers use the last result instead of waiting on the probe.
+
+    Returns:
+        True if a replica is configured, reachable and within replica_max_lag
+    """
+    replica = get_replica_engine()
+    if replica is None:
+        return False
+
+    now = time.monotonic()
+    if now - _replica_state["checked_at"] >= settings.replica_check_interval:
+        if _replica_lock.acquire(blocking=False):
+            try:
+                if now - _replica_state["checked_at"] >= settings.replica_check_interval:
+                    _check_replica(replica)
+                    _replica_state["checked_at"] = time.monotonic()
+            finally:
+                _replica_lock.release()
+    return _replica_state["usable"]
+
+
+def get_replica_status() -> Optional[dict]:
+    """Get the last replica check result, or None if no replica is configured."""
+    if not settings.replica_database_url:
+        return None
+    return {"usable": _replica_state["usable"], "lag": _replica_state["lag"]}
+
+
+class LazySession(Session):
+    """Session that binds to the (lazily created) engine on first use."""
+
+    def get_bind(self, mapper=None, **kw):
+        if self.bind is None:
+            self.bind = get_engine()
+        return super().get_bind(mapper, **kw)
+
 
 # Session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=LazySession, autocommit=False, autoflush=False)
+
+class ReplicaSession(Session):
+    """
+    Session on the read replica that falls back to the primary per statement.
+
+    A read failing on the replica with an OperationalError (connection lost,
+    query cancelled by WAL replay, ...) is retried once on the primary, where
+    the rest of the session then stays, so the request is still answered.
+    Rows already streamed from a replica result are not retried.
+    """
+
+    def _retry_on_primary(self, method: Callable, *args, **kw):
+        try:
+            return method(self, *args, **kw)
+        except OperationalError as e:
+            primary = get_engine()
+            if self.bind is primary:
+                raise
+            logger.warning("Read on replica failed, retrying on primary: %s", e)
+            self.rollback()
+            self.bind = primary
+            return method(self, *args, **kw)
+
+    def execute(self, *args, **kw):
+        return self._retry_on_primary(Session.execute, *args, **kw)
+
+    def scalar(self, *args, **kw):
+        return self._retry_on_primary(Session.scalar, *args, **kw)
+
+    def scalars(self, *args, **kw):
+        return self._retry_on_primary(Session.scalars, *args, **kw)
+
+
+# Session factory for the read replica (bound per session in open_read_session)
+ReplicaSessionLocal = sessionmaker(class_=ReplicaSession, autocommit=False, autoflush=False)
 
 # Base class for ORM models
 Base = declarative_base()
 
 
+def __getattr__(name: str):
+    # `from app.database import engine` keeps working, creating the engine on access
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def get_db() -> Generator[Session, None, None]:
     """
     Dependency that provides a database session.
@@ -38,6 +329,30 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+def open_read_session() -> Session:
+    """
+    Open a session for read-only queries that tolerate replication lag.
+
+    Returns:
+        Session on the replica if it is usable, otherwise on the primary
+    """
+    if replica_usable():
+        return ReplicaSessionLocal(bind=get_replica_engine())
+    return SessionLocal()
+
+
+def get_read_db() -> Generator[Session, None, None]:
+    """
+    Dependency that provides a read-only session (replica when usable).
+    Automatically closes the session after use.
+    """
+    db = open_read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def init_db() -> None:
     """Initialize database tables."""
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
@@ -0,0 +1,138 @@
+"""
+Logging setup.
+Records are handed to a queue on the calling thread and formatted and
+written by a background listener, so request handlers never block on
+stdout. Output is one JSON object per line (or plain text), and high-volume
+info messages can be sampled per event type.
+"""
+
+import atexit
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import orjson
+from .config import get_settings
+
+settings = get_settings()
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+# (uvicorn's color_message duplicates the message with ANSI codes)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "color_message"}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON with any `extra=` fields included."""
+
+    # Timestamps are written with a "Z" suffix, so format them in UTC
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of info/debug records for sampled event types.
+
+    Records opt in with `extra={"event": "<type>"}`; the keep rate comes from
+    log_sample_rates, which may also be keyed by logger name (e.g.
+    "uvicorn.access"). Warnings and errors are never dropped.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None), self.rates.get(record.name, 1.0))
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that defers formatting to the listener thread.
+
+    The stock handler formats each record on the calling thread so it can be
+    pickled; this queue never leaves the process, so records are enqueued as
+    is. When the queue is full, info/debug records are dropped rather than
+    blocking the caller; warnings and errors wait for space.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging() -> None:
+    """
+    Route all logging through a queue to a background stdout writer.
+
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if settings.log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(settings.log_sample_rates))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.log_level.upper())
+
+    # uvicorn installs its own synchronous handlers (including one line per
+    # request on uvicorn.access); send those through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
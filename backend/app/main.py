@@ -3,38 +3,125 @@ PushBunny Backend - FastAPI entrypoint.
 Main application setup and router registration.
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
 import logging
 from contextlib import asynccontextmanager
+from typing import Callable, Optional
 
 from .config import get_settings
-from .database import init_db
+from .logging_config import configure_logging
+from .database import init_db, get_engine, SessionLocal, get_replica_status, is_sqlite, close_writer
+from .services.invalidation import invalidation_bus
+from .services.shared_stats import get_shared_arm_stats, reconcile_shared_stats
+from .services.n8n_client import close_n8n_client
+from .services.journal import get_metric_journal
+from .services.posterior import refresh_posteriors
+from .services.variant_logic import warm_candidate_cache
 from .routers import resolve, metrics, variants, auth
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queued; JSON lines on stdout by default)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
 
+async def run_periodically(
+    name: str, func: Callable[[], object], interval: float, delay: Optional[float] = None
+) -> None:
+    """
+    Run a blocking function in a worker thread every `interval` seconds until cancelled.
+
+    The first run is after `delay` seconds (default: `interval`).
+    """
+    await asyncio.sleep(interval if delay is None else delay)
+    while True:
+        try:
+            await asyncio.to_thread(func)
+        except Exception as e:
+            logger.error("Background task %s failed: %s", name, e)
+        await asyncio.sleep(interval)
+
+
+def warm_up() -> dict:
+    """Preload the resolve cache for the hottest intents (see warm_candidate_cache)."""
+    if not settings.warmup_enabled or not settings.resolve_cache_enabled:
+        return {"status": "disabled"}
+
+    db = SessionLocal()
+    try:
+        result = warm_candidate_cache(db, settings.warmup_top_intents, settings.warmup_lookback_hours)
+    except Exception as e:
+        logger.error("Cache warm-up failed: %s", e)
+        return {"status": "failed", "error": str(e)}
+    finally:
+        db.close()
+
+    logger.info(
+        "Warmed resolve cache with %s intents (%s variants) in %sms",
+        result['intents'], result['variants'], result['duration_ms']
+    )
+    return {"status": "done", **result}
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     # Startup
     logger.info("Starting PushBunny Backend...")
-    logger.info("Initializing database...")
-    init_db()
-    logger.info("Database initialized successfully")
+    if settings.db_create_schema or is_sqlite():
+        # Opt-in: reflecting every table adds round trips to each cold start.
+        # Production runs scripts/init_db.py as a separate migration step;
+        # an embedded SQLite node has no such step and reflection is local.
+        logger.info("Initializing database...")
+        init_db()
+        logger.info("Database initialized successfully")
+    invalidation_bus.start(get_engine())
+
+    # Runs before startup completes, so the server only accepts requests
+    # (including /health readiness probes) once the cache is warm.
+    app.state.warmup = await asyncio.to_thread(warm_up)
+
+    background_tasks: list[asyncio.Task] = []
+    if get_shared_arm_stats() is not None:
+        try:
+            reconcile_shared_stats()
+        except Exception as e:
+            logger.error("Initial shared stats reconciliation failed: %s", e)
+        background_tasks.append(asyncio.create_task(run_periodically(
+            "shared-stats-reconcile", reconcile_shared_stats, settings.shared_stats_reconcile_interval
+        )))
+
+    if settings.posterior_enabled:
+        # First full computation runs in the background; summaries are None until it finishes
+        background_tasks.append(asyncio.create_task(run_periodically(
+            "posterior-refresh", refresh_posteriors, settings.posterior_refresh_interval, delay=0
+        )))
+
+    journal = get_metric_journal()
+    if journal is not None:
+        # Segments left by a previous run (e.g. written during a DB outage)
+        await asyncio.to_thread(metrics.replay_journal)
+        background_tasks.append(asyncio.create_task(run_periodically(
+            "metrics-journal-replay", metrics.replay_journal, settings.metrics_journal_replay_interval
+        )))
     
     yield
     
     # Shutdown
     logger.info("Shutting down PushBunny Backend...")
+    for task in background_tasks:
+        task.cancel()
+    if journal is not None:
+        # Best effort; whatever can't be inserted now is replayed on the next start
+        await asyncio.to_thread(metrics.replay_journal)
+        journal.close()
+    close_writer()
+    invalidation_bus.stop()
+    await close_n8n_client()
 
 
 # Create FastAPI app
@@ -42,6 +129,7 @@ app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     description="AI-optimized push notification backend powered by n8n and Gemini",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -73,9 +161,15 @@ def root():
 
 
 @app.get("/health")
-def health():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+def health(request: Request):
+    """Health check endpoint, including the cache warm-up result, read replica state and journal backlog."""
+    journal = get_metric_journal()
+    return {
+        "status": "healthy",
+        "warmup": getattr(request.app.state, "warmup", None),
+        "replica": get_replica_status(),
+        "journal": journal.status() if journal is not None else None
+    }
 
 
 if __name__ == "__main__":
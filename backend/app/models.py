@@ -1,14 +1,45 @@
 """
 SQLAlchemy ORM models for PushBunny database.
-Defines tables: variants, metrics, api_keys.
+Defines tables: variants, metrics, variant_segment_stats, api_keys.
 """
 
-from sqlalchemy import Column, String, Text, TIMESTAMP, ForeignKey
+from sqlalchemy import Column, String, Text, TIMESTAMP, ForeignKey, Index, BigInteger, CHAR
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 import uuid
 from .database import Base
 
+# Tenant of rows created without tenant isolation (and of rows that predate it)
+DEFAULT_TENANT = "default"
+
+
+class GUID(TypeDecorator):
+    """
+    Portable UUID column type.
+    Uses the native UUID type on Postgres and 32-character hex strings
+    elsewhere (e.g. SQLite); Python values are uuid.UUID either way.
+    """
+    impl = CHAR(32)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(UUID(as_uuid=True))
+        return dialect.type_descriptor(CHAR(32))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value.hex
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(value)
+
 
 class Variant(Base):
     """
@@ -16,9 +47,16 @@ class Variant(Base):
     Each variant represents a different message for a given intent.
     """
     __tablename__ = "variants"
+    __table_args__ = (
+        # Resolve selects per (tenant_id, intent_id, locale); the leading
+        # columns also serve per-tenant and per-intent dashboard lookups, so
+        # one tenant's queries never scan another tenant's variants.
+        Index("ix_variants_tenant_intent_locale", "tenant_id", "intent_id", "locale"),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    intent_id = Column(Text, nullable=False, index=True)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(Text, nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+    intent_id = Column(Text, nullable=False)
     message = Column(Text, nullable=False)
     locale = Column(Text, nullable=False, default="en-US")
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
@@ -33,26 +71,58 @@ class Metric(Base):
     Tracks sent and clicked events.
     """
     __tablename__ = "metrics"
+    __table_args__ = (
+        # Exports filter by time within a tenant. Per-variant counts use the
+        # variant_id index, which only touches that variant's rows.
+        Index("ix_metrics_tenant_timestamp", "tenant_id", "timestamp"),
+        # Warm-up ranks intents across tenants by recent events; covering the
+        # variant_id it joins on keeps that an index-only range scan.
+        Index("ix_metrics_timestamp_variant", "timestamp", "variant_id"),
+        # Idempotency keys are client-chosen, so they're only unique per tenant
+        Index("uq_metrics_tenant_event_id", "tenant_id", "event_id", unique=True),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    variant_id = Column(UUID(as_uuid=True), ForeignKey("variants.id"), nullable=False, index=True)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(Text, nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)  # Copied from the variant
+    variant_id = Column(GUID(), ForeignKey("variants.id"), nullable=False, index=True)
     event_type = Column(Text, nullable=False)  # sent, clicked
     timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
+    event_id = Column(String(128), nullable=True)  # Client idempotency key
     
     def __repr__(self):
         return f"<Metric {self.id} variant={self.variant_id} event={self.event_type}>"
 
 
+class VariantSegmentStats(Base):
+    """
+    Per-segment sent/clicked counters for a variant.
+    Incremented on metric ingest, so resolve reads segment-level counts by
+    primary key instead of aggregating the metrics table.
+    """
+    __tablename__ = "variant_segment_stats"
+
+    # Composite primary key: resolve joins on (variant_id, segment)
+    variant_id = Column(GUID(), ForeignKey("variants.id"), primary_key=True)
+    segment = Column(String(128), primary_key=True)
+    sent = Column(BigInteger, nullable=False, default=0)
+    clicked = Column(BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<VariantSegmentStats {self.variant_id} segment={self.segment}>"
+
+
 class ApiKey(Base):
     """
     Optional: Stores API keys for authentication.
-    Used for dashboard and backend access control.
+    Used for dashboard and backend access control. The owner is the
+    tenant of every variant and metric created with the key.
     """
     __tablename__ = "api_keys"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     key = Column(String(255), unique=True, nullable=False, index=True)
     owner = Column(Text, nullable=False)
+    password_hash = Column(Text, nullable=True)  # NULL until the first login since passwords were stored
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     
     def __repr__(self):
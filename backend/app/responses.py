@@ -0,0 +1,86 @@
+"""
+Response classes and content negotiation for hot endpoints.
+JSON is serialized with orjson; MessagePack is available to SDK clients
+that send batch traffic, when the msgpack package is installed.
+"""
+
+from typing import Any
+import orjson
+from fastapi import HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response
+
+try:
+    import msgpack
+except ImportError:  # MessagePack support is optional
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+
+
+class MsgPackResponse(Response):
+    """Response serialized as MessagePack."""
+
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, use_bin_type=True)
+
+
+def _media_type(header: str) -> str:
+    """Strip parameters from a Content-Type/Accept value."""
+    return header.split(";", 1)[0].strip().lower()
+
+
+def accepts_msgpack(request: Request) -> bool:
+    """Check whether the client asked for a MessagePack response."""
+    if msgpack is None:
+        return False
+    accept = request.headers.get("accept", "")
+    return any(_media_type(part) in MSGPACK_MEDIA_TYPES for part in accept.split(","))
+
+
+def negotiated_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """
+    Serialize content as MessagePack if the client accepts it, otherwise JSON.
+
+    Args:
+        request: Incoming request (for the Accept header)
+        content: JSON-compatible payload
+        status_code: HTTP status code
+
+    Returns:
+        MsgPackResponse or ORJSONResponse
+    """
+    if accepts_msgpack(request):
+        return MsgPackResponse(content, status_code=status_code)
+    return ORJSONResponse(content, status_code=status_code)
+
+
+async def read_body(request: Request) -> Any:
+    """
+    Decode a JSON or MessagePack request body according to its Content-Type.
+
+    Args:
+        request: Incoming request
+
+    Returns:
+        Decoded payload
+
+    Raises:
+        HTTPException: 415 for MessagePack without msgpack installed, 400 for malformed bodies
+    """
+    body = await request.body()
+    content_type = _media_type(request.headers.get("content-type", "application/json"))
+
+    if content_type in MSGPACK_MEDIA_TYPES:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail="MessagePack is not supported by this server")
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid MessagePack body: {e}")
+
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
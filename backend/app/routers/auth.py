@@ -3,16 +3,44 @@
 Optional authentication for dashboard and API access.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
+import hashlib
+import hmac
+import re
 import secrets
 import logging
+from typing import Optional
 from ..database import get_db
 from ..schemas import LoginRequest, LoginResponse
-from ..models import ApiKey
+from ..models import ApiKey, DEFAULT_TENANT
+from ..config import get_settings
+from ..services.cache import TTLCache
+from ..services.invalidation import invalidation_bus, API_KEY
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/v1/auth", tags=["auth"])
+settings = get_settings()
+
+# API key -> owner, or "" for keys known not to exist
+api_key_cache = TTLCache(max_size=10_000, ttl=settings.api_key_cache_ttl)
+
+_PASSWORD_HASH_ITERATIONS = 200_000
+
+# Owners are tenant IDs, so they must be emails; this also keeps
+# DEFAULT_TENANT (the shared pre-isolation tenant) from being claimed
+_EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+
+def _invalidate_api_key(key: str) -> None:
+    """Drop a cached API key lookup ("" drops everything)."""
+    if key:
+        api_key_cache.delete(key)
+    else:
+        api_key_cache.clear()
+
+
+invalidation_bus.subscribe(API_KEY, _invalidate_api_key)
 
 
 def generate_api_key() -> str:
@@ -20,6 +48,25 @@ def generate_api_key() -> str:
     return f"pbk_live_{secrets.token_urlsafe(32)}"
 
 
+def hash_password(password: str) -> str:
+    """Hash a password as `pbkdf2_sha256$<iterations>$<salt>$<hash>`."""
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), _PASSWORD_HASH_ITERATIONS)
+    return f"pbkdf2_sha256${_PASSWORD_HASH_ITERATIONS}${salt}${digest.hex()}"
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Check a password against a hash from hash_password."""
+    try:
+        algorithm, iterations, salt, expected = password_hash.split("$")
+    except ValueError:
+        return False
+    if algorithm != "pbkdf2_sha256":
+        return False
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), int(iterations))
+    return hmac.compare_digest(digest.hex(), expected)
+
+
 @router.post("/login", response_model=LoginResponse)
 def login(
     request: LoginRequest,
@@ -27,49 +74,89 @@ def login(
 ) -> LoginResponse:
     """
     Login endpoint that returns an API key.
-    
-    NOTE: This is a simplified implementation for MVP.
-    In production, implement proper password hashing and user management.
-    
+
+    The first login for an email registers it: a key is generated and the
+    password stored as a salted PBKDF2 hash. Later logins return that key only
+    if the password matches, since the key is also the email's tenant
+    credential. Keys issued before passwords were stored get the password of
+    their first login after the upgrade.
+
     Args:
         request: Login credentials
         db: Database session
-        
+
     Returns:
-        LoginResponse with generated API key
+        LoginResponse with the email's API key
+
+    Raises:
+        HTTPException: 400 if the email is not a valid address, 401 if the
+            email is registered and the password does not match
     """
-    # SIMPLIFIED: In production, validate against user table with hashed passwords
-    # For MVP, just generate an API key for any login
-    
+    if not _EMAIL_PATTERN.fullmatch(request.email):
+        raise HTTPException(status_code=400, detail="A valid email address is required")
+
+    # Check if user already has an API key
+    existing_key = db.query(ApiKey).filter(ApiKey.owner == request.email).first()
+
+    if existing_key:
+        if existing_key.password_hash is None:
+            # Issued before passwords were stored: this login sets it
+            existing_key.password_hash = hash_password(request.password)
+            db.commit()
+            logger.info("Stored password for legacy API key of %s", request.email)
+        elif not verify_password(request.password, existing_key.password_hash):
+            logger.warning("Rejected login for %s", request.email)
+            raise HTTPException(status_code=401, detail="Invalid email or password")
+        logger.info("Returning existing API key for %s", request.email)
+        return LoginResponse(api_key=existing_key.key)
+
     try:
-        # Check if user already has an API key
-        existing_key = db.query(ApiKey).filter(ApiKey.owner == request.email).first()
-        
-        if existing_key:
-            logger.info(f"Returning existing API key for {request.email}")
-            return LoginResponse(api_key=existing_key.key)
-        
         # Generate new API key
         api_key = generate_api_key()
         
         # Store in database
         db_api_key = ApiKey(
             key=api_key,
-            owner=request.email
+            owner=request.email,
+            password_hash=hash_password(request.password)
         )
         db.add(db_api_key)
+        invalidation_bus.publish(db, API_KEY, api_key)
         db.commit()
         
-        logger.info(f"Generated new API key for {request.email}")
+        logger.info("Generated new API key for %s", request.email)
         
         return LoginResponse(api_key=api_key)
         
     except Exception as e:
-        logger.error(f"Error during login: {e}")
+        logger.error("Error during login: %s", e)
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Login failed: {str(e)}")
 
 
+def get_api_key_owner(api_key: str, db: Session) -> Optional[str]:
+    """
+    Look up the owner of an API key, caching hits and misses.
+
+    Args:
+        api_key: API key to look up
+        db: Database session
+
+    Returns:
+        Owner of the key, or None if the key does not exist
+    """
+    if not api_key:
+        return None
+
+    owner = api_key_cache.get(api_key)
+    if owner is None:
+        key_record = db.query(ApiKey).filter(ApiKey.key == api_key).first()
+        owner = key_record.owner if key_record else ""
+        api_key_cache.set(api_key, owner)
+
+    return owner or None
+
+
 def verify_api_key(api_key: str, db: Session) -> bool:
     """
     Verify if an API key is valid.
@@ -81,8 +168,52 @@ def verify_api_key(api_key: str, db: Session) -> bool:
     Returns:
         True if valid, False otherwise
     """
+    return get_api_key_owner(api_key, db) is not None
+
+
+def get_request_api_key(
+    authorization: Optional[str] = Header(default=None),
+    x_api_key: Optional[str] = Header(default=None)
+) -> Optional[str]:
+    """Dependency that reads the API key from `Authorization: Bearer <key>` or `X-API-Key`."""
+    if authorization:
+        scheme, _, credentials = authorization.partition(" ")
+        if scheme.lower() == "bearer" and credentials.strip():
+            return credentials.strip()
+    return x_api_key or None
+
+
+def resolve_tenant(api_key: Optional[str], db: Session) -> str:
+    """
+    Map a request's API key to the tenant its data is scoped to.
+
+    Without tenant_isolation every request uses DEFAULT_TENANT, as before
+    tenants existed. With it, the key's owner is the tenant.
+
+    Args:
+        api_key: API key sent with the request, if any
+        db: Database session
+
+    Returns:
+        Tenant ID
+
+    Raises:
+        HTTPException: 401 if isolation is on and the key is missing, unknown
+            or owned by the reserved DEFAULT_TENANT
+    """
+    if not settings.tenant_isolation:
+        return DEFAULT_TENANT
     if not api_key:
-        return False
-    
-    key_record = db.query(ApiKey).filter(ApiKey.key == api_key).first()
-    return key_record is not None
+        raise HTTPException(status_code=401, detail="API key required", headers={"WWW-Authenticate": "Bearer"})
+    owner = get_api_key_owner(api_key, db)
+    if owner is None or owner == DEFAULT_TENANT:
+        raise HTTPException(status_code=401, detail="Invalid API key", headers={"WWW-Authenticate": "Bearer"})
+    return owner
+
+
+def get_tenant(
+    api_key: Optional[str] = Depends(get_request_api_key),
+    db: Session = Depends(get_db)
+) -> str:
+    """Dependency that provides the caller's tenant (see resolve_tenant)."""
+    return resolve_tenant(api_key, db)
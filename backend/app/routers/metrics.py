@@ -3,73 +3,541 @@
 Stores push notification events (sent, clicked).
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from uuid import UUID
+from sqlalchemy.exc import IntegrityError
+from uuid import UUID, uuid4
+from datetime import datetime
+from typing import Literal, Optional
 import logging
-from ..database import get_db
-from ..schemas import MetricRequest, MetricResponse
+from ..database import get_db, run_write, SessionLocal
+from ..schemas import MetricRequest, MetricResponse, MetricBatchRequest, MetricBatchResponse
+from ..responses import read_body, negotiated_response
 from ..models import Metric
+from ..services.cache import TTLCache
+from ..services.invalidation import invalidation_bus, STATS
+from ..services.shared_stats import get_shared_arm_stats
+from ..services.snapshot import snapshot_store
+from ..services.journal import get_metric_journal, read_segment, MetricJournal
+from ..services.segments import is_valid_segment
+from ..services.variant_logic import increment_segment_stats, get_variant_tenants
+from ..services import export
+from ..config import get_settings
+from .auth import get_tenant, get_request_api_key, resolve_tenant
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/v1", tags=["metrics"])
+settings = get_settings()
 
 
 ALLOWED_EVENT_TYPES = {"sent", "clicked"}
 
+# (tenant_id, event_id) pairs recently recorded by this worker. Lets SDK retries
+# be acknowledged without a DB round trip; the unique index on
+# metrics (tenant_id, event_id) catches the rest.
+recent_event_ids = TTLCache(max_size=settings.metrics_dedup_window, ttl=settings.metrics_dedup_ttl)
+
+# Variants whose stats invalidation was published recently. Coalesces NOTIFYs
+# for hot variants to one per invalidation_stats_min_interval per worker.
+_recent_stats_invalidations = TTLCache(max_size=10_000, ttl=settings.invalidation_stats_min_interval)
+
+
+# Pre-serialized body for the common acknowledgement
+_OK_BODY = b'{"status":"ok"}'
+
+
+def _ok() -> Response:
+    """Acknowledge an event without building and validating a MetricResponse."""
+    return Response(content=_OK_BODY, media_type="application/json")
+
+
+def _validate_event_type(event_type: str) -> None:
+    """Raise 400 for event types other than sent/clicked."""
+    if event_type not in ALLOWED_EVENT_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid event_type. Must be one of: {', '.join(ALLOWED_EVENT_TYPES)}"
+        )
+
+
+def _publish_stats_change(db: Session, variant_id: str) -> None:
+    """Publish a (coalesced) stats invalidation for a variant in the current transaction."""
+    if variant_id not in _recent_stats_invalidations:
+        invalidation_bus.publish(db, STATS, variant_id)
+        _recent_stats_invalidations.set(variant_id, True)
+
+
+def _segment_counts(events: list[tuple[UUID, MetricRequest]]) -> dict[tuple[UUID, str], tuple[int, int]]:
+    """
+    Sum per-segment counter increments for events about to be inserted.
+
+    Events without a segment, or with one outside the configured set, only
+    count globally.
+    """
+    counts: dict[tuple[UUID, str], tuple[int, int]] = {}
+    for variant_uuid, event in events:
+        if event.segment and is_valid_segment(event.segment):
+            key = (variant_uuid, event.segment)
+            sent, clicked = counts.get(key, (0, 0))
+            if event.event_type == "clicked":
+                counts[key] = (sent, clicked + 1)
+            else:
+                counts[key] = (sent + 1, clicked)
+    return counts
+
+
+def _after_recorded(variant_uuid: UUID, request: MetricRequest, tenant_id: str) -> None:
+    """Update per-worker and host-wide state once an event is committed."""
+    if request.event_id:
+        recent_event_ids.set((tenant_id, request.event_id), True)
+
+    shared_stats = get_shared_arm_stats()
+    if shared_stats is not None:
+        shared_stats.increment(variant_uuid, request.event_type)
+
+    snapshot_store.apply_event(request.variant_id, request.event_type)
+
+
+def _record_one(db: Session, request: MetricRequest) -> bool:
+    """
+    Store a single event.
+
+    Args:
+        db: Database session
+        request: Metric data (event type already validated)
+
+    Returns:
+        True if a row was inserted, False if the event was skipped as a
+        duplicate or for having a non-UUID (temporary) or unknown variant_id
+    """
+    # Parse variant_id as UUID
+    try:
+        variant_uuid = UUID(request.variant_id)
+    except ValueError:
+        logger.warning("Invalid variant_id format: %s, skipping metric", request.variant_id)
+        # Return OK even if variant_id is invalid (could be temp ID)
+        return False
+
+    tenant_id = get_variant_tenants(db, {variant_uuid}).get(variant_uuid)
+    if tenant_id is None:
+        logger.warning("Unknown variant_id %s, skipping metric", request.variant_id)
+        return False
+
+    if request.event_id and (tenant_id, request.event_id) in recent_event_ids:
+        logger.info("Skipping duplicate metric event %s", request.event_id)
+        return False
+    
+    # Create metric record
+    metric = Metric(
+        tenant_id=tenant_id,
+        variant_id=variant_uuid,
+        event_type=request.event_type,
+        timestamp=request.timestamp,
+        event_id=request.event_id
+    )
+    
+    db.add(metric)
+    increment_segment_stats(db, _segment_counts([(variant_uuid, request)]))
+    _publish_stats_change(db, request.variant_id)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        if not _is_recorded(db, tenant_id, request.event_id):
+            raise
+        logger.info("Skipping duplicate metric event %s", request.event_id)
+        recent_event_ids.set((tenant_id, request.event_id), True)
+        return False
+
+    _after_recorded(variant_uuid, request, tenant_id)
+    
+    logger.info(
+        "Recorded %s metric for variant %s", request.event_type, request.variant_id,
+        extra={"event": "metric.recorded"}
+    )
+    return True
+
+
+def _journal_events(journal: MetricJournal, events: list[MetricRequest], tenant_id: str) -> int:
+    """
+    Append events to the local journal instead of the database.
+
+    Events without an event_id get a server-generated one, so replaying a
+    segment that was partly inserted before a failure doesn't double count.
+
+    Args:
+        journal: This worker's metrics journal
+        events: Metric data (event types already validated)
+        tenant_id: Caller's tenant, for the recent-duplicate check (replay
+            deduplicates by the variant's tenant)
+
+    Returns:
+        Number of events journaled (recent duplicates and non-UUID
+        variant_ids are skipped)
+    """
+    entries = []
+    seen_ids: set[str] = set()
+    for event in events:
+        if event.event_id:
+            if event.event_id in seen_ids or (tenant_id, event.event_id) in recent_event_ids:
+                continue
+            seen_ids.add(event.event_id)
+        try:
+            variant_uuid = UUID(event.variant_id)
+        except ValueError:
+            continue  # Temporary variant IDs are not tracked
+        segment = event.segment if event.segment and is_valid_segment(event.segment) else None
+        entries.append((variant_uuid, event.event_type, event.timestamp, event.event_id or uuid4().hex, segment))
+
+    if entries:
+        journal.append(entries)
+    return len(entries)
+
+
+def _owned_events(db: Session, events: list[MetricRequest], tenant_id: str) -> list[MetricRequest]:
+    """Keep only events for variants of the caller's tenant."""
+    variant_uuids: dict[str, UUID] = {}
+    for event in events:
+        try:
+            variant_uuids[event.variant_id] = UUID(event.variant_id)
+        except ValueError:
+            continue  # Temporary variant IDs are not tracked
+    owners = get_variant_tenants(db, set(variant_uuids.values()))
+
+    owned = [
+        event for event in events
+        if event.variant_id in variant_uuids and owners.get(variant_uuids[event.variant_id]) == tenant_id
+    ]
+    if len(owned) < len(events):
+        logger.info("Skipping %s metrics for variants outside tenant %s", len(events) - len(owned), tenant_id)
+    return owned
+
+
+def _record(db: Session, events: list[MetricRequest], tenant_id: str) -> int:
+    """
+    Record events through the journal if enabled, otherwise directly.
+
+    Falls back to the database if the journal can't be written (e.g. disk full).
+    Database writes go through the single writer in SQLite mode. With tenant
+    isolation, events for other tenants' variants are dropped first.
+
+    Args:
+        db: Database session
+        events: Metric data (event types already validated)
+        tenant_id: Caller's tenant
+
+    Returns:
+        Number of events accepted
+    """
+    if settings.tenant_isolation:
+        events = _owned_events(db, events, tenant_id)
+        if not events:
+            return 0
+
+    journal = get_metric_journal()
+    if journal is not None:
+        try:
+            return _journal_events(journal, events, tenant_id)
+        except OSError as e:
+            logger.error("Metrics journal write failed, writing to the database: %s", e)
+
+    if len(events) == 1:
+        return int(run_write(db, lambda session: _record_one(session, events[0])))
+    return run_write(db, lambda session: _record_batch(session, events))
+
 
 @router.post("/metrics", response_model=MetricResponse)
 def record_metric(
     request: MetricRequest,
+    header_api_key: Optional[str] = Depends(get_request_api_key),
     db: Session = Depends(get_db)
-) -> MetricResponse:
+) -> Response:
     """
     Record a push notification event.
     
     Allowed event types:
     - sent: Notification was sent
     - clicked: Notification was clicked
+
+    Requests carrying an event_id already recorded are acknowledged
+    without inserting another row, so SDK retries don't inflate counts.
+    With the metrics journal enabled, the event is acknowledged once it is
+    durable on local disk and reaches the database on the next replay.
+
+    With tenant isolation, the API key is read from the Authorization or
+    X-API-Key header, or from the api_key field as in /v1/resolve.
     
     Args:
         request: Metric data
+        header_api_key: API key from the Authorization or X-API-Key header
         db: Database session
         
     Returns:
         MetricResponse with status "ok"
     """
-    # Validate event type
-    if request.event_type not in ALLOWED_EVENT_TYPES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid event_type. Must be one of: {', '.join(ALLOWED_EVENT_TYPES)}"
-        )
-    
+    _validate_event_type(request.event_type)
+    tenant_id = resolve_tenant(header_api_key or request.api_key, db)
+
+    try:
+        _record(db, [request], tenant_id)
+        return _ok()
+        
+    except Exception as e:
+        logger.error("Error recording metric: %s", e)
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to record metric: {str(e)}")
+
+
+@router.post("/metrics/batch", response_model=MetricBatchResponse)
+async def record_metrics_batch(
+    http_request: Request,
+    header_api_key: Optional[str] = Depends(get_request_api_key),
+    db: Session = Depends(get_db)
+) -> Response:
+    """
+    Record many push notification events in one request and one transaction.
+
+    Accepts {"events": [...]} as JSON, or as MessagePack with
+    Content-Type application/msgpack. The response uses MessagePack when the
+    Accept header asks for it. Duplicate event_ids (within the batch, recently
+    seen, or already stored) are skipped.
+
+    With tenant isolation, the API key is read from the Authorization or
+    X-API-Key header, the batch's api_key field, or the first event that
+    carries one; the whole batch is recorded for that key's tenant.
+
+    Args:
+        http_request: Raw request (body is decoded by Content-Type)
+        header_api_key: API key from the Authorization or X-API-Key header
+        db: Database session
+
+    Returns:
+        MetricBatchResponse with accepted and skipped counts
+    """
+    payload = await read_body(http_request)
     try:
-        # Parse variant_id as UUID
+        batch = MetricBatchRequest.model_validate(payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+    for event in batch.events:
+        _validate_event_type(event.event_type)
+
+    api_key = header_api_key or batch.api_key or next(
+        (event.api_key for event in batch.events if event.api_key), None
+    )
+    tenant_id = await run_in_threadpool(resolve_tenant, api_key, db)
+
+    try:
+        accepted = await run_in_threadpool(_record, db, batch.events, tenant_id)
+    except Exception as e:
+        logger.error("Error recording metric batch: %s", e)
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to record metrics: {str(e)}")
+
+    return negotiated_response(http_request, {
+        "status": "ok",
+        "accepted": accepted,
+        "skipped": len(batch.events) - accepted
+    })
+
+
+def _record_batch(db: Session, events: list[MetricRequest]) -> int:
+    """
+    Insert a batch of events with one duplicate lookup and one commit.
+
+    Falls back to inserting events one at a time if a concurrent request
+    stored one of the event_ids in the meantime.
+
+    Args:
+        db: Database session
+        events: Validated metric events
+
+    Returns:
+        Number of events inserted
+    """
+    parsed: list[tuple[UUID, MetricRequest]] = []
+    for event in events:
         try:
-            variant_uuid = UUID(request.variant_id)
+            parsed.append((UUID(event.variant_id), event))
         except ValueError:
-            logger.warning(f"Invalid variant_id format: {request.variant_id}, skipping metric")
-            # Return OK even if variant_id is invalid (could be temp ID)
-            return MetricResponse(status="ok")
-        
-        # Create metric record
-        metric = Metric(
+            continue  # Temporary variant IDs are not tracked
+    if not parsed:
+        return 0
+
+    # Event IDs are unique per tenant, so resolve each variant's tenant first
+    variant_uuids = {variant_uuid for variant_uuid, _ in parsed}
+    owners = get_variant_tenants(db, variant_uuids)
+    if len(owners) < len(variant_uuids):
+        logger.warning("Skipping metrics for %s unknown variants", len(variant_uuids) - len(owners))
+
+    pending: list[tuple[UUID, MetricRequest]] = []
+    seen_ids: set[tuple[str, str]] = set()
+    for variant_uuid, event in parsed:
+        if variant_uuid not in owners:
+            continue
+        if event.event_id:
+            key = (owners[variant_uuid], event.event_id)
+            if key in seen_ids or key in recent_event_ids:
+                continue
+            seen_ids.add(key)
+        pending.append((variant_uuid, event))
+
+    if seen_ids:
+        stored = {
+            (tenant_id, event_id) for tenant_id, event_id in
+            db.query(Metric.tenant_id, Metric.event_id)
+            .filter(Metric.event_id.in_({event_id for _, event_id in seen_ids}))
+            .all()
+        }
+        for key in stored:
+            recent_event_ids.set(key, True)
+        pending = [(v, e) for v, e in pending if (owners[v], e.event_id) not in stored]
+
+    if not pending:
+        return 0
+
+    db.add_all([
+        Metric(
+            tenant_id=owners[variant_uuid],
             variant_id=variant_uuid,
-            event_type=request.event_type,
-            timestamp=request.timestamp
+            event_type=event.event_type,
+            timestamp=event.timestamp,
+            event_id=event.event_id
         )
-        
-        db.add(metric)
+        for variant_uuid, event in pending
+    ])
+    increment_segment_stats(db, _segment_counts(pending))
+    for variant_id in {event.variant_id for _, event in pending}:
+        _publish_stats_change(db, variant_id)
+
+    try:
         db.commit()
-        
-        logger.info(
-            f"Recorded {request.event_type} metric for variant {request.variant_id}"
-        )
-        
-        return MetricResponse(status="ok")
-        
+    except IntegrityError:
+        db.rollback()
+        logger.warning("Duplicate event_id in metric batch, recording events individually")
+        return sum(_record_one(db, event) for _, event in pending)
+
+    for variant_uuid, event in pending:
+        _after_recorded(variant_uuid, event, owners[variant_uuid])
+
+    logger.info("Recorded %s metrics in batch", len(pending))
+    return len(pending)
+
+
+def replay_journal() -> int:
+    """
+    Insert journaled events into the database and delete their segments.
+
+    Seals the active segment first, so events reach the database within one
+    metrics_journal_replay_interval. Segments left by exited workers are
+    replayed too. Stops at the first failure (e.g. the database is down) and
+    resumes from that segment on the next call; replays are idempotent
+    because every journaled event has an event_id.
+
+    Returns:
+        Number of events inserted
+    """
+    journal = get_metric_journal()
+    if journal is None:
+        return 0
+
+    journal.rotate()
+    segments = journal.orphaned_segments() + journal.sealed_segments()
+    if not segments:
+        return 0
+
+    inserted = 0
+    db = SessionLocal()
+    try:
+        for index, path in enumerate(segments):
+            events = read_segment(path)
+            batch_size = settings.metrics_journal_replay_batch
+            for start in range(0, len(events), batch_size):
+                chunk = events[start:start + batch_size]
+                inserted += run_write(db, lambda session: _replay_chunk(session, chunk))
+            path.unlink()
     except Exception as e:
-        logger.error(f"Error recording metric: {e}")
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to record metric: {str(e)}")
+        logger.warning(
+            "Metrics journal replay stopped, %s segments pending: %s", len(segments) - index, e
+        )
+    finally:
+        db.close()
+
+    if inserted:
+        logger.info("Replayed %s journaled metrics", inserted)
+    return inserted
+
+
+def _replay_chunk(db: Session, events: list[tuple]) -> int:
+    """Insert decoded journal events (_record_batch drops any whose variant no longer exists)."""
+    return _record_batch(db, [
+        MetricRequest.model_construct(
+            variant_id=str(variant_id), event_type=event_type, timestamp=timestamp,
+            event_id=event_id, segment=segment
+        )
+        for variant_id, event_type, timestamp, event_id, segment in events
+    ])
+
+
+def _is_recorded(db: Session, tenant_id: str, event_id: Optional[str]) -> bool:
+    """Check whether a metric with this event ID is already stored for the tenant."""
+    if not event_id:
+        return False
+    return db.query(Metric.id).filter(
+        Metric.tenant_id == tenant_id, Metric.event_id == event_id
+    ).first() is not None
+
+
+@router.get("/metrics/export")
+def export_metrics(
+    format: Literal["ndjson", "csv", "parquet"] = Query(default="ndjson", description="Output format"),
+    intent_id: Optional[str] = Query(default=None, description="Only events for this intent"),
+    variant_id: Optional[str] = Query(default=None, description="Only events for this variant"),
+    since: Optional[datetime] = Query(default=None, description="Only events at or after this time"),
+    until: Optional[datetime] = Query(default=None, description="Only events before this time"),
+    tenant_id: str = Depends(get_tenant)
+) -> StreamingResponse:
+    """
+    Stream the caller's raw metric events for offline analysis.
+
+    Rows are read through a server-side cursor and streamed as they are
+    fetched, so memory use doesn't grow with the export size. Each row has
+    id, variant_id, intent_id, locale, event_type, timestamp and event_id;
+    rows are not ordered. Parquet output (one row group per fetched batch)
+    requires pyarrow.
+
+    Args:
+        format: ndjson, csv or parquet
+        intent_id: Intent filter
+        variant_id: Variant filter
+        since: Inclusive lower time bound
+        until: Exclusive upper time bound
+        tenant_id: Caller's tenant
+
+    Returns:
+        StreamingResponse with the encoded rows
+    """
+    if format == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server")
+
+    variant_uuid = None
+    if variant_id is not None:
+        try:
+            variant_uuid = UUID(variant_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid variant_id: {variant_id}")
+
+    query = export.build_export_query(tenant_id, intent_id, variant_uuid, since, until)
+    partitions = export.iter_partitions(query, settings.metrics_export_batch_size)
+
+    logger.info("Exporting metrics as %s (intent=%s, variant=%s)", format, intent_id, variant_id)
+    return StreamingResponse(
+        export.ENCODERS[format](partitions),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="metrics.{format}"'}
+    )
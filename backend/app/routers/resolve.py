@@ -3,21 +3,94 @@
 Returns optimized push notification message for a given intent.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response
 from sqlalchemy.orm import Session
+import asyncio
 import logging
+import math
 import random
-from ..database import get_db
+import time
+from typing import Optional
+from ..database import get_db, SessionLocal
 from ..schemas import ResolveRequest, ResolveResponse, N8nRequest
-from ..services.n8n_client import n8n_client
-from ..services.variant_logic import store_variant, get_variants_with_metrics, find_duplicate_variant
+from ..models import Variant
+from ..services.n8n_client import get_n8n_client
+from ..services.circuit_breaker import CircuitOpenError
+from ..services.variant_logic import (
+    store_variant, get_candidate_variants, load_existing_messages, normalize_message
+)
+from ..services.locale_fallback import normalize_locale
+from ..services.segments import extract_segment, is_valid_segment
+from ..services.shared_stats import get_shared_arm_stats
+from ..services.rate_limit import rate_limiter, RESOLVE, GENERATE
 from ..config import get_settings
+from .auth import get_request_api_key, resolve_tenant
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/v1", tags=["resolve"])
 settings = get_settings()
 
 
+def _posterior(variant: dict) -> tuple[float, float]:
+    """
+    Get the Beta posterior parameters for a variant.
+
+    Globally this is Beta(clicked + 1, failures + 1): the +1 is a prior
+    (assumes each variant has 1 success and 1 failure). For segmented
+    requests (segment_sent/segment_clicked present), the segment's counts
+    are added to a prior centered on the variant's global CTR and worth
+    segment_prior_weight sends, so a segment with little data backs off to
+    the global estimate and one with plenty of data overrides it.
+
+    Args:
+        variant: Variant dict with 'sent' and 'clicked' counts
+
+    Returns:
+        Tuple of (alpha, beta)
+    """
+    successes = variant['clicked']
+    failures = variant['sent'] - variant['clicked']
+    if "segment_sent" not in variant:
+        return successes + 1, failures + 1
+
+    global_ctr = (successes + 1) / (successes + failures + 2)
+    weight = settings.segment_prior_weight
+    segment_failures = max(0, variant['segment_sent'] - variant['segment_clicked'])
+    return variant['segment_clicked'] + weight * global_ctr, segment_failures + weight * (1 - global_ctr)
+
+
+def sample_best_variant(variants: list[dict]) -> Optional[dict]:
+    """
+    Pick the variant with the highest Thompson sample, without any exploration.
+
+    Used directly when generating a new variant is not an option (e.g. n8n's
+    circuit is open), regardless of how much data the variants have.
+
+    Args:
+        variants: List of variant dicts with 'sent' and 'clicked' counts
+
+    Returns:
+        The chosen variant dict, or None if variants is empty
+    """
+    if not variants:
+        return None
+
+    # Thompson Sampling: Sample from Beta distribution for each variant
+    samples = []
+    for variant in variants:
+        alpha, beta = _posterior(variant)
+
+        # Sample from the Beta distribution
+        sample = random.betavariate(alpha, beta)
+        samples.append((sample, variant))
+
+    # Select variant with highest sample
+    _, best_variant = max(samples, key=lambda x: x[0])
+    return best_variant
+
+
 def thompson_sample_variant(variants: list[dict]) -> tuple[dict, bool]:
     """
     Select variant using Thompson Sampling (Bayesian multi-armed bandit).
@@ -46,23 +119,7 @@ def thompson_sample_variant(variants: list[dict]) -> tuple[dict, bool]:
     if total_sent < settings.ab_exploration_threshold:
         return None, True
 
-    # Thompson Sampling: Sample from Beta distribution for each variant
-    samples = []
-    for variant in variants:
-        successes = variant['clicked']
-        failures = variant['sent'] - variant['clicked']
-
-        # Beta(alpha, beta) where alpha = successes + 1, beta = failures + 1
-        # The +1 is a prior (assumes each variant has 1 success and 1 failure)
-        alpha = successes + 1
-        beta = failures + 1
-
-        # Sample from the Beta distribution
-        sample = random.betavariate(alpha, beta)
-        samples.append((sample, variant))
-
-    # Select variant with highest sample
-    _, best_variant = max(samples, key=lambda x: x[0])
+    best_variant = sample_best_variant(variants)
 
     # Small probability to generate new variant (controlled exploration)
     # This ensures we occasionally try completely new messages
@@ -72,16 +129,351 @@ def thompson_sample_variant(variants: list[dict]) -> tuple[dict, bool]:
     return best_variant, False
 
 
+def _resolved(variant_id: str, message: str, segment: Optional[str] = None) -> Response:
+    """
+    Serialize a resolve result directly with orjson.
+
+    Returning a Response skips constructing and re-validating a
+    ResolveResponse on every call; the route's response_model still
+    documents the shape. The segment is only included when there is one.
+    """
+    body = {"variant_id": variant_id, "resolved_message": message}
+    if segment is not None:
+        body["segment"] = segment
+    return ORJSONResponse(body)
+
+
+def _deadline(request: ResolveRequest, header_ms: Optional[int]) -> Optional[float]:
+    """
+    Get the caller's deadline as a time.monotonic() value.
+
+    The budget may come from the X-Deadline-Ms header or the deadline_ms
+    field; if both are given the shorter one wins.
+
+    Args:
+        request: Intent request data
+        header_ms: X-Deadline-Ms header value
+
+    Returns:
+        Deadline, or None if the caller didn't send one
+    """
+    budgets = [ms for ms in (request.deadline_ms, header_ms) if ms is not None]
+    if not budgets:
+        return None
+    return time.monotonic() + min(budgets) / 1000
+
+
+def _generation_fits(deadline: Optional[float]) -> bool:
+    """
+    Check whether an n8n generation is likely to finish before the deadline.
+
+    Compares the remaining budget (minus deadline_margin) with the expected
+    n8n latency. Without enough latency samples any positive budget counts,
+    since the generation is still cut off at the deadline.
+
+    Args:
+        deadline: Caller's deadline from _deadline(), or None
+
+    Returns:
+        True if generation should be attempted
+    """
+    if deadline is None:
+        return True
+    remaining = deadline - time.monotonic() - settings.deadline_margin
+    if remaining <= 0:
+        return False
+    expected = get_n8n_client().expected_latency()
+    return expected is None or expected <= remaining
+
+
+def _fallback_response(db: Session, request: ResolveRequest, variants: list[dict], tenant_id: str) -> Response:
+    """
+    Resolve without generating a new variant.
+
+    Exploits the best known variant if there is one, otherwise stores and
+    returns the caller's base_message.
+
+    Args:
+        db: Database session
+        request: Intent request data
+        variants: Candidate variants for the request
+        tenant_id: Caller's tenant
+
+    Returns:
+        ResolveResponse for the exploited variant or base message
+    """
+    best = sample_best_variant(variants)
+    if best:
+        logger.info("Generation unavailable, exploiting variant %s", best['variant_id'])
+        return _resolved(best['variant_id'], best['message'], request.segment)
+
+    variant = store_variant(
+        db=db,
+        intent_id=request.intent_id,
+        message=request.base_message,
+        locale=request.locale,
+        check_duplicates=True,
+        tenant_id=tenant_id
+    )
+    return _resolved(str(variant.id), variant.message, request.segment)
+
+
+async def _load_existing_messages(request: ResolveRequest, tenant_id: str) -> dict[str, Variant]:
+    """
+    Load the intent's existing messages on a worker thread, with its own session.
+
+    A deadline can cancel the generation awaiting this, but not the thread;
+    the fallback then uses the request's session while the query may still
+    run, so the thread must not share it.
+
+    Args:
+        request: Intent request data
+        tenant_id: Caller's tenant
+
+    Returns:
+        Dict mapping normalized message to its (detached) Variant
+    """
+    def load() -> dict[str, Variant]:
+        session = SessionLocal()
+        try:
+            return load_existing_messages(session, request.intent_id, request.locale, tenant_id)
+        finally:
+            session.close()
+
+    return await run_in_threadpool(load)
+
+
+async def _generate_sequential(
+    db: Session,
+    request: ResolveRequest,
+    n8n_request: N8nRequest,
+    existing_variants: list[dict],
+    tenant_id: str,
+    deadline: Optional[float] = None
+) -> Response:
+    """
+    Generate a new variant, retrying one n8n call at a time on duplicates.
+
+    Args:
+        db: Database session
+        request: Intent request data
+        n8n_request: Payload for n8n
+        existing_variants: Candidate variants, used if generation fails
+        tenant_id: Caller's tenant
+        deadline: Caller's deadline; no retry is started that wouldn't fit
+
+    Returns:
+        ResolveResponse for the new, reused, or fallback variant
+    """
+    existing_messages = await _load_existing_messages(request, tenant_id)
+
+    # Try to generate a unique variant (with retries for duplicates)
+    max_retries = settings.ab_duplicate_retry_max
+    for attempt in range(max_retries):
+        try:
+            # Retries need a fresh generation; a cached one is only used if it isn't stored yet
+            n8n_response = await get_n8n_client().resolve_intent(
+                n8n_request, use_cache=(attempt == 0), tenant_id=tenant_id, known_messages=existing_messages
+            )
+        except CircuitOpenError as e:
+            logger.warning("n8n call skipped, falling back: %s", e)
+            return _fallback_response(db, request, existing_variants, tenant_id)
+        except Exception as e:
+            logger.error("n8n call failed, falling back: %s", e)
+            return _fallback_response(db, request, existing_variants, tenant_id)
+
+        # Check if this message is a duplicate
+        if n8n_response.should_store_variant:
+            duplicate = existing_messages.get(normalize_message(n8n_response.variant_message))
+            if duplicate:
+                logger.info("Found duplicate variant %s for intent %s", duplicate.id, request.intent_id)
+
+            if duplicate and attempt < max_retries - 1 and _generation_fits(deadline):
+                # Duplicate found and we have retries left
+                logger.info(
+                    "AI generated duplicate message (attempt %s/%s), retrying with enhanced context...",
+                    attempt + 1, max_retries
+                )
+                # Enhance context to encourage different variant
+                n8n_request.context = (
+                    f"{n8n_request.context or ''} "
+                    f"[Generate a DIFFERENT message, avoid: '{n8n_response.variant_message}']"
+                ).strip()
+                continue  # Retry
+            elif duplicate:
+                # Duplicate found but no retries (or time) left, reuse existing
+                logger.warning(
+                    "AI generated duplicate after %s attempts, reusing existing variant %s",
+                    attempt + 1, duplicate.id
+                )
+                return _resolved(str(duplicate.id), duplicate.message, request.segment)
+            else:
+                # Not a duplicate, store it
+                variant = store_variant(
+                    db=db,
+                    intent_id=request.intent_id,
+                    message=n8n_response.variant_message,
+                    locale=request.locale,
+                    check_duplicates=False,  # Already checked above
+                    tenant_id=tenant_id
+                )
+                logger.info("Resolved to new unique variant %s", variant.id)
+                return _resolved(str(variant.id), n8n_response.variant_message, request.segment)
+        else:
+            # Temporary variant (not stored)
+            variant_id = f"temp_{request.intent_id}"
+            logger.info("Resolved to temporary variant %s", variant_id)
+            return _resolved(variant_id, n8n_response.variant_message, request.segment)
+
+    # Should not reach here, but fallback just in case
+    logger.error("Unexpected state in variant generation loop")
+    raise HTTPException(status_code=500, detail="Failed to generate unique variant")
+
+
+async def _generate_concurrent(
+    db: Session,
+    request: ResolveRequest,
+    n8n_request: N8nRequest,
+    existing_variants: list[dict],
+    tenant_id: str
+) -> Response:
+    """
+    Generate several candidates at once and keep the first non-duplicate.
+
+    In "batch" mode one n8n call asks the workflow for K candidates
+    (N8nResponse.variant_messages); in "concurrent" mode K calls are made in
+    parallel and the remaining calls are cancelled as soon as a non-duplicate
+    arrives. Either way duplicates are checked against a single lookup of the
+    intent's existing messages, so exploration costs about one generation
+    instead of up to ab_duplicate_retry_max sequential ones.
+
+    Args:
+        db: Database session
+        request: Intent request data
+        n8n_request: Payload for n8n
+        existing_variants: Candidate variants, used if generation fails
+        tenant_id: Caller's tenant
+
+    Returns:
+        ResolveResponse for the new, reused, or fallback variant
+    """
+    num_candidates = max(1, settings.ab_generation_candidates)
+
+    existing_messages = None
+    if settings.ab_generation_mode == "batch":
+        # Needed up front so a cached batch whose candidates are all stored is skipped
+        existing_messages = await _load_existing_messages(request, tenant_id)
+        n8n_request.num_candidates = num_candidates
+        tasks = [asyncio.create_task(get_n8n_client().resolve_intent(
+            n8n_request, tenant_id=tenant_id, known_messages=existing_messages
+        ))]
+    else:
+        tasks = []
+        for i in range(num_candidates):
+            candidate_request = n8n_request.model_copy()
+            if i > 0:
+                candidate_request.context = (
+                    f"{n8n_request.context or ''} [Candidate {i + 1} of {num_candidates}, make it distinct]"
+                ).strip()
+            # Only the first candidate may come from the cache (a cached duplicate
+            # costs no n8n call, and the fresh candidates still run); the rest must be fresh
+            tasks.append(asyncio.create_task(get_n8n_client().resolve_intent(
+                candidate_request, use_cache=(i == 0), tenant_id=tenant_id
+            )))
+
+    try:
+        if existing_messages is None:
+            # The query runs on a worker thread, so the n8n calls are in flight meanwhile
+            existing_messages = await _load_existing_messages(request, tenant_id)
+
+        first_duplicate = None
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                n8n_response = await next_done
+            except Exception as e:
+                logger.warning("n8n candidate failed: %s", e)
+                continue
+
+            if not n8n_response.should_store_variant:
+                # Temporary variant (not stored)
+                variant_id = f"temp_{request.intent_id}"
+                logger.info("Resolved to temporary variant %s", variant_id)
+                return _resolved(variant_id, n8n_response.variant_message, request.segment)
+
+            for message in n8n_response.candidate_messages():
+                duplicate = existing_messages.get(normalize_message(message))
+                if duplicate:
+                    first_duplicate = first_duplicate or duplicate
+                    continue
+
+                variant = store_variant(
+                    db=db,
+                    intent_id=request.intent_id,
+                    message=message,
+                    locale=request.locale,
+                    check_duplicates=False,  # Already checked above
+                    tenant_id=tenant_id
+                )
+                logger.info("Resolved to new unique variant %s", variant.id)
+                return _resolved(str(variant.id), message, request.segment)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if first_duplicate:
+        logger.warning(
+            "All %s generated candidates were duplicates, reusing existing variant %s",
+            num_candidates, first_duplicate.id
+        )
+        return _resolved(str(first_duplicate.id), first_duplicate.message, request.segment)
+
+    logger.error("All n8n candidate calls failed, falling back")
+    return _fallback_response(db, request, existing_variants, tenant_id)
+
+
+def _client_key(api_key: Optional[str], http_request: Request) -> str:
+    """
+    Rate limiting key: the API key, or the client address for anonymous callers.
+
+    Behind settings.rate_limit_trusted_proxies proxies, the address is read
+    from X-Forwarded-For, counting that many entries from the right (each
+    proxy appends the address it received the request from), so anonymous
+    callers aren't all keyed by the proxy's address.
+    """
+    if api_key:
+        return api_key
+    hops = settings.rate_limit_trusted_proxies
+    forwarded = http_request.headers.get("x-forwarded-for")
+    if hops > 0 and forwarded:
+        addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+        if addresses:
+            return f"addr:{addresses[-min(hops, len(addresses))]}"
+    return f"addr:{http_request.client.host if http_request.client else 'unknown'}"
+
+
+def _rate_limited(retry_after: float) -> HTTPException:
+    """429 for a request over its resolve budget."""
+    return HTTPException(
+        status_code=429,
+        detail="Too many resolve requests",
+        headers={"Retry-After": str(max(1, math.ceil(min(retry_after, 3600))))}
+    )
+
+
 @router.post("/resolve", response_model=ResolveResponse)
 async def resolve_intent(
     request: ResolveRequest,
+    http_request: Request,
+    x_deadline_ms: Optional[int] = Header(default=None, ge=0),
+    header_api_key: Optional[str] = Depends(get_request_api_key),
     db: Session = Depends(get_db)
-) -> ResolveResponse:
+) -> Response:
     """
     Resolve a notification intent to an optimized message.
 
     Flow (with Thompson Sampling A/B testing):
-    1. Check existing variants for this intent
+    1. Check existing variants for this intent, using the variants of the most
+       specific locale in the fallback chain (e.g. pt-BR -> pt -> en-US)
     2. Use Thompson Sampling (Bayesian multi-armed bandit):
        - Models each variant's CTR as a Beta distribution
        - Samples from distributions and picks highest
@@ -89,19 +481,75 @@ async def resolve_intent(
        - Variants with less data get explored more
        - Converges to optimal variant faster than epsilon-greedy
     3. If not enough data, always explore (generate new variants)
-    4. Track all variants for continuous optimization
+    4. If n8n's circuit breaker is open, the caller's deadline is too close
+       for a generation at the observed n8n latency, or the caller's or
+       intent's generation budget is spent, skip generation and exploit the
+       best known variant (or fall back to base_message)
+    5. Track all variants for continuous optimization
+
+    With segmentation enabled, the request's segment (sent explicitly or
+    derived from context) is loaded in the same query as the candidates, and
+    sampling uses segment-level posteriors backed off to global ones. The
+    segment is returned so metric events can be attributed to it.
+
+    A generation still running when the deadline expires is cancelled
+    (together with its in-flight n8n calls) and the request falls back as in 4.
+
+    With tenant isolation, the API key (Authorization: Bearer, X-API-Key or
+    the api_key field) is required and variants are read and stored in its
+    owner's tenant. Requests over the per-key or per-intent (within the
+    tenant) resolve budget are rejected with 429 and Retry-After before any
+    variant query; the per-key budget is checked before the key lookup,
+    which is cached, misses included.
 
     Args:
         request: Intent request data
+        http_request: Raw request (client address for anonymous rate limiting)
+        x_deadline_ms: Caller's remaining latency budget in milliseconds
+        header_api_key: API key from the Authorization or X-API-Key header
         db: Database session
 
     Returns:
         ResolveResponse with variant_id and resolved_message
     """
+    deadline = _deadline(request, x_deadline_ms)
+    api_key = header_api_key or request.api_key
+    client_key = _client_key(api_key, http_request)
+    # The client's budget comes first, so invalid keys are throttled before
+    # their (cached) tenant lookup; intent budgets are per tenant
+    retry_after = rate_limiter.acquire_client(RESOLVE, client_key, api_key)
+    if retry_after:
+        logger.warning("Rate limited resolve for client of intent %s", request.intent_id)
+        raise _rate_limited(retry_after)
+    tenant_id = resolve_tenant(api_key, db)
+    retry_after = rate_limiter.acquire_intent(RESOLVE, client_key, tenant_id, request.intent_id, api_key)
+    if retry_after:
+        logger.warning("Rate limited resolve for intent %s", request.intent_id)
+        raise _rate_limited(retry_after)
+
     try:
-        logger.info(f"Resolving intent {request.intent_id}")
+        request.locale = normalize_locale(request.locale or "en-US")
+        if request.segment is not None and not is_valid_segment(request.segment):
+            request.segment = None
+        if request.segment is None:
+            request.segment = extract_segment(request.context)
+        logger.info(
+            "Resolving intent %s (%s)", request.intent_id, request.locale,
+            extra={"event": "resolve.request"}
+        )
+
+        matched_locale, existing_variants = get_candidate_variants(
+            db, request.intent_id, request.locale, request.segment, tenant_id
+        )
+        if matched_locale and matched_locale != request.locale:
+            logger.info(
+                "No %s variants for intent %s, using %s", request.locale, request.intent_id, matched_locale
+            )
 
-        existing_variants = get_variants_with_metrics(db, request.intent_id)
+        shared_stats = get_shared_arm_stats()
+        if shared_stats is not None:
+            # Host-wide counters are fresher than this worker's cached ones
+            existing_variants = shared_stats.overlay(existing_variants)
 
         # Use Thompson Sampling to select variant or decide to explore
         selected_variant, should_generate_new = thompson_sample_variant(existing_variants)
@@ -110,16 +558,28 @@ async def resolve_intent(
             # Thompson Sampling selected an existing variant
             ctr = selected_variant['clicked'] / selected_variant['sent'] if selected_variant['sent'] > 0 else 0
             logger.info(
-                f"Thompson Sampling: Selected variant {selected_variant['variant_id']} "
-                f"(CTR: {selected_variant['clicked']}/{selected_variant['sent']} = {ctr:.1%})"
-            )
-            return ResolveResponse(
-                variant_id=selected_variant['variant_id'],
-                resolved_message=selected_variant['message']
+                "Thompson Sampling: Selected variant %s (CTR: %s/%s = %.1f%%)",
+                selected_variant['variant_id'], selected_variant['clicked'], selected_variant['sent'], ctr * 100,
+                extra={"event": "resolve.selected"}
             )
+            return _resolved(selected_variant['variant_id'], selected_variant['message'], request.segment)
+
+        if not get_n8n_client().is_available():
+            logger.info("n8n circuit open, skipping generation for intent %s", request.intent_id)
+            return _fallback_response(db, request, existing_variants, tenant_id)
+
+        if not _generation_fits(deadline):
+            logger.info("Deadline too close for generation, exploiting for intent %s", request.intent_id)
+            return _fallback_response(db, request, existing_variants, tenant_id)
+
+        # Concurrent mode makes K n8n calls; batch and sequential start with one
+        generation_cost = settings.ab_generation_candidates if settings.ab_generation_mode == "concurrent" else 1
+        if rate_limiter.acquire(GENERATE, client_key, tenant_id, request.intent_id, api_key, cost=generation_cost):
+            logger.info("Generation budget spent, exploiting for intent %s", request.intent_id)
+            return _fallback_response(db, request, existing_variants, tenant_id)
 
         # Generate new variant (exploration)
-        logger.info(f"Thompson Sampling: Generating new variant for intent {request.intent_id}")
+        logger.info("Thompson Sampling: Generating new variant for intent %s", request.intent_id)
 
         n8n_request = N8nRequest(
             intent_id=request.intent_id,
@@ -129,83 +589,22 @@ async def resolve_intent(
             timestamp=request.timestamp
         )
 
-        # Try to generate a unique variant (with retries for duplicates)
-        max_retries = settings.ab_duplicate_retry_max
-        for attempt in range(max_retries):
-            try:
-                n8n_response = await n8n_client.resolve_intent(n8n_request)
-            except Exception as e:
-                logger.error(f"n8n call failed, falling back to base message: {e}")
-                variant = store_variant(
-                    db=db,
-                    intent_id=request.intent_id,
-                    message=request.base_message,
-                    locale=request.locale,
-                    check_duplicates=True
-                )
-                return ResolveResponse(
-                    variant_id=str(variant.id),
-                    resolved_message=variant.message
-                )
+        if settings.ab_generation_mode in ("concurrent", "batch"):
+            generation = _generate_concurrent(db, request, n8n_request, existing_variants, tenant_id)
+        else:
+            generation = _generate_sequential(db, request, n8n_request, existing_variants, tenant_id, deadline)
+        if deadline is None:
+            return await generation
 
-            # Check if this message is a duplicate
-            if n8n_response.should_store_variant:
-                duplicate = find_duplicate_variant(
-                    db=db,
-                    intent_id=request.intent_id,
-                    message=n8n_response.variant_message,
-                    locale=request.locale
-                )
-
-                if duplicate and attempt < max_retries - 1:
-                    # Duplicate found and we have retries left
-                    logger.info(
-                        f"AI generated duplicate message (attempt {attempt + 1}/{max_retries}), "
-                        f"retrying with enhanced context..."
-                    )
-                    # Enhance context to encourage different variant
-                    n8n_request.context = (
-                        f"{n8n_request.context or ''} "
-                        f"[Generate a DIFFERENT message, avoid: '{n8n_response.variant_message}']"
-                    ).strip()
-                    continue  # Retry
-                elif duplicate:
-                    # Duplicate found but no retries left, reuse existing
-                    logger.warning(
-                        f"AI generated duplicate after {max_retries} attempts, "
-                        f"reusing existing variant {duplicate.id}"
-                    )
-                    return ResolveResponse(
-                        variant_id=str(duplicate.id),
-                        resolved_message=duplicate.message
-                    )
-                else:
-                    # Not a duplicate, store it
-                    variant = store_variant(
-                        db=db,
-                        intent_id=request.intent_id,
-                        message=n8n_response.variant_message,
-                        locale=request.locale,
-                        check_duplicates=False  # Already checked above
-                    )
-                    logger.info(f"Resolved to new unique variant {variant.id}")
-                    return ResolveResponse(
-                        variant_id=str(variant.id),
-                        resolved_message=n8n_response.variant_message
-                    )
-            else:
-                # Temporary variant (not stored)
-                variant_id = f"temp_{request.intent_id}"
-                logger.info(f"Resolved to temporary variant {variant_id}")
-                return ResolveResponse(
-                    variant_id=variant_id,
-                    resolved_message=n8n_response.variant_message
-                )
-
-        # Should not reach here, but fallback just in case
-        logger.error("Unexpected state in variant generation loop")
-        raise HTTPException(status_code=500, detail="Failed to generate unique variant")
+        try:
+            # Cancelling the generation cancels its n8n calls; keep the margin for the fallback
+            return await asyncio.wait_for(
+                generation, timeout=max(0.0, deadline - time.monotonic() - settings.deadline_margin)
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Deadline expired during generation for intent %s, falling back", request.intent_id)
+            return _fallback_response(db, request, existing_variants, tenant_id)
 
     except Exception as e:
-        logger.error(f"Error resolving intent: {e}")
+        logger.error("Error resolving intent: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to resolve intent: {str(e)}")
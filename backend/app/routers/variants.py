@@ -3,51 +3,69 @@
 Retrieves variants with aggregated metrics for dashboard.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi.responses import ORJSONResponse, Response
+from typing import Optional
 from sqlalchemy.orm import Session
 import logging
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..schemas import VariantSummary
 from ..services.variant_logic import get_variants_with_metrics, get_all_variants_grouped
+from ..services.snapshot import snapshot_store
+from ..services.posterior import posterior_store
+from ..services.locale_fallback import normalize_locale
+from ..config import get_settings
+from .auth import get_tenant
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/v1", tags=["variants"])
+settings = get_settings()
 
 
 @router.get("/variants")
-def get_all_variants(db: Session = Depends(get_db)):
+def get_all_variants(
+    tenant_id: str = Depends(get_tenant),
+    db: Session = Depends(get_read_db)
+):
     """
-    Get all variants grouped by intent_id with aggregated metrics.
+    Get the caller's variants grouped by intent_id with aggregated metrics.
     
     Used by the dashboard to display all intents and their variants.
+    Served from the read replica when one is configured and fresh enough.
+    Each variant carries precomputed p_best, ctr_low and ctr_high.
     
     Args:
-        db: Database session
+        tenant_id: Caller's tenant
+        db: Read-only database session
         
     Returns:
         Dict mapping intent_id to list of variants with metrics
     """
     try:
-        variants_by_intent = get_all_variants_grouped(db)
+        variants_by_intent = get_all_variants_grouped(db, tenant_id)
         
         if not variants_by_intent:
             logger.info("No variants found in database")
-            return {}
+            return ORJSONResponse({})
         
-        logger.info(f"Retrieved variants for {len(variants_by_intent)} intents")
+        logger.info("Retrieved variants for %s intents", len(variants_by_intent))
+        for variants in variants_by_intent.values():
+            posterior_store.annotate(variants)
         
-        return variants_by_intent
+        # Serialize the nested dicts directly, without jsonable_encoder
+        return ORJSONResponse(variants_by_intent)
         
     except Exception as e:
-        logger.error(f"Error retrieving all variants: {e}")
+        logger.error("Error retrieving all variants: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to retrieve variants: {str(e)}")
 
 
 @router.get("/variants/{intent_id}", response_model=list[VariantSummary])
 def get_variants(
     intent_id: str,
-    db: Session = Depends(get_db)
-) -> list[VariantSummary]:
+    tenant_id: str = Depends(get_tenant),
+    db: Session = Depends(get_read_db)
+) -> Response:
     """
     Get all variants for a given intent with aggregated metrics.
     
@@ -55,22 +73,68 @@ def get_variants(
     
     Args:
         intent_id: Intent identifier
-        db: Database session
+        tenant_id: Caller's tenant
+        db: Read-only database session
         
     Returns:
         List of VariantSummary objects with metrics
     """
     try:
-        variants_data = get_variants_with_metrics(db, intent_id)
+        variants_data = get_variants_with_metrics(db, intent_id, tenant_id=tenant_id)
         
         if not variants_data:
-            logger.info(f"No variants found for intent {intent_id}")
-            return []
+            logger.info("No variants found for intent %s", intent_id)
+            return ORJSONResponse([])
         
-        logger.info(f"Retrieved {len(variants_data)} variants for intent {intent_id}")
+        logger.info("Retrieved %s variants for intent %s", len(variants_data), intent_id)
         
-        return [VariantSummary(**v) for v in variants_data]
+        # Same shape as VariantSummary, without building a model per variant
+        return ORJSONResponse(posterior_store.annotate([{**v, "opened": 0} for v in variants_data]))
         
     except Exception as e:
-        logger.error(f"Error retrieving variants: {e}")
+        logger.error("Error retrieving variants: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to retrieve variants: {str(e)}")
+
+
+
+@router.get("/variants/{intent_id}/snapshot")
+def get_arm_snapshot(
+    intent_id: str,
+    locale: str = Query(default="en-US", description="User locale (fallback chain applies)"),
+    if_none_match: Optional[str] = Header(default=None),
+    tenant_id: str = Depends(get_tenant),
+    db: Session = Depends(get_db)
+) -> Response:
+    """
+    Get a compact snapshot of an intent's arms for SDK-side Thompson Sampling.
+
+    Each arm is [variant_id, message, alpha, beta] for a Beta(alpha, beta)
+    posterior over its CTR. Responses carry an ETag and Cache-Control max-age;
+    clients should revalidate with If-None-Match after max-age and get a 304
+    when nothing changed.
+
+    Args:
+        intent_id: Intent identifier
+        locale: Requested locale
+        if_none_match: ETag of the client's cached snapshot
+        tenant_id: Caller's tenant
+        db: Database session
+
+    Returns:
+        Snapshot JSON, or 304 Not Modified
+    """
+    try:
+        snapshot = snapshot_store.get(db, intent_id, normalize_locale(locale), tenant_id)
+        body, etag = snapshot.render()
+    except Exception as e:
+        logger.error("Error building snapshot for %s: %s", intent_id, e)
+        raise HTTPException(status_code=500, detail=f"Failed to build snapshot: {str(e)}")
+
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"max-age={settings.snapshot_ttl}",
+    }
+    if if_none_match and etag in {tag.strip().strip('"').removeprefix('W/"') for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
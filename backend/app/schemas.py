@@ -19,28 +19,54 @@ class ResolveRequest(BaseModel):
     context: str = Field(default="", description="Additional context as string")
     base_message: str = Field(..., description="Fallback message if AI fails")
     timestamp: Optional[datetime] = None
+    deadline_ms: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="Caller's remaining latency budget in milliseconds; generation is skipped if it won't fit"
+    )
+    segment: Optional[str] = Field(
+        default=None,
+        max_length=128,
+        description="Segment key for segment-level arm statistics; derived from context when omitted"
+    )
 
 
 class ResolveResponse(BaseModel):
     """Response schema for /v1/resolve endpoint."""
     variant_id: str
     resolved_message: str
+    segment: Optional[str] = Field(
+        default=None,
+        description="Segment the variant was selected for; echo it in /v1/metrics events (omitted if none)"
+    )
 
 
 # /v1/metrics schemas
 
 class MetricRequest(BaseModel):
     """Request schema for /v1/metrics endpoint."""
+    api_key: Optional[str] = None
     variant_id: str
     event_type: str = Field(..., description="Event type: 'sent' or 'clicked'")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    event_id: Optional[str] = Field(
+        default=None,
+        max_length=128,
+        description="Client-generated idempotency key; retries with the same ID are recorded once"
+    )
+    segment: Optional[str] = Field(
+        default=None,
+        max_length=128,
+        description="Segment returned by /v1/resolve; also counts the event toward that segment"
+    )
     
     class Config:
         json_schema_extra = {
             "example": {
                 "variant_id": "a2f3c523-9240-4013-8e86-acf2600c6129",
                 "event_type": "clicked",
-                "timestamp": "2025-02-15T12:01:12Z"
+                "timestamp": "2025-02-15T12:01:12Z",
+                "event_id": "5b0c6a43-0f5e-4b43-9a51-6f5b2f0e1c7d"
             }
         }
 
@@ -50,6 +76,19 @@ class MetricResponse(BaseModel):
     status: str = "ok"
 
 
+class MetricBatchRequest(BaseModel):
+    """Request schema for /v1/metrics/batch endpoint (JSON or MessagePack)."""
+    api_key: Optional[str] = None
+    events: list[MetricRequest] = Field(..., max_length=1000)
+
+
+class MetricBatchResponse(BaseModel):
+    """Response schema for /v1/metrics/batch endpoint."""
+    status: str = "ok"
+    accepted: int
+    skipped: int
+
+
 # /v1/auth schemas
 
 class LoginRequest(BaseModel):
@@ -72,6 +111,10 @@ class VariantSummary(BaseModel):
     sent: int = 0
     opened: int = 0
     clicked: int = 0
+    # Posterior summaries from the last background refresh (None until computed)
+    p_best: Optional[float] = Field(default=None, description="Probability this variant is the best of its intent/locale")
+    ctr_low: Optional[float] = Field(default=None, description="Lower bound of the CTR credible interval")
+    ctr_high: Optional[float] = Field(default=None, description="Upper bound of the CTR credible interval")
     
     class Config:
         from_attributes = True
@@ -86,9 +129,18 @@ class N8nRequest(BaseModel):
     context: str
     base_message: str
     timestamp: Optional[datetime] = None
+    num_candidates: int = Field(default=1, description="Number of candidate messages requested")
 
 
 class N8nResponse(BaseModel):
     """Response schema from n8n webhook."""
     variant_message: str
     should_store_variant: bool = True
+    variant_messages: list[str] = Field(
+        default_factory=list,
+        description="All candidates when num_candidates > 1 (variant_message is the first)"
+    )
+
+    def candidate_messages(self) -> list[str]:
+        """Get all candidate messages in preference order."""
+        return self.variant_messages or [self.variant_message]
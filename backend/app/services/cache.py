@@ -0,0 +1,108 @@
+"""
+In-process caching primitives.
+Small, dependency-free building blocks shared by the service-level caches.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries expire after a fixed time-to-live.
+
+    Thread-safe, so it can be shared between the event loop and the threadpool
+    that runs sync endpoints. An optional on_evict(key, value) callback runs
+    (outside the lock) for every entry that leaves the cache: expired,
+    evicted, replaced, deleted or cleared. Callers use it to keep side
+    indexes bounded by the cache.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 60.0,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def _evicted(self, entries: list[tuple[Hashable, Any]]) -> None:
+        if self.on_evict is not None:
+            for key, value in entries:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value, treating expired entries as missing.
+
+        Args:
+            key: Cache key
+            default: Returned when the key is missing or expired
+
+        Returns:
+            Cached value or default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at >= time.monotonic():
+                self._data.move_to_end(key)
+                return value
+            del self._data[key]
+        self._evicted([(key, value)])
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value, evicting the least recently used entry if full.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Override the cache's default time-to-live (seconds)
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        evicted = []
+        with self._lock:
+            previous = self._data.get(key)
+            if previous is not None and previous[1] is not value:
+                evicted.append((key, previous[1]))
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+        self._evicted(evicted)
+
+    def delete(self, key: Hashable) -> None:
+        """Remove a key if present."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is not None:
+            self._evicted([(key, entry[1])])
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            entries = [(key, value) for key, (_, value) in self._data.items()] if self.on_evict else []
+            self._data.clear()
+        self._evicted(entries)
+
+    def keys(self) -> list[Hashable]:
+        """Snapshot of current keys (may include expired entries)."""
+        with self._lock:
+            return list(self._data.keys())
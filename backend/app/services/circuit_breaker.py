@@ -0,0 +1,139 @@
+"""
+Circuit breaker and latency tracking for outbound dependencies.
+Used by the n8n client to fail fast while n8n/Gemini is degraded.
+"""
+
+import logging
+import math
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Three-state circuit breaker (closed -> open -> half-open -> closed).
+
+    - closed: calls pass through; consecutive failures are counted
+    - open: calls are rejected until recovery_timeout has elapsed
+    - half-open: a limited number of probe calls are let through; a success
+      closes the circuit, a failure opens it again
+
+    Not thread-safe; each worker's event loop owns its own breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        """Current state, moving open -> half-open once the recovery timeout has elapsed."""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info("Circuit '%s' half-open, probing", self.name)
+        return self._state
+
+    def is_available(self) -> bool:
+        """Check whether a call would currently be allowed, without reserving a probe slot."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            return self._half_open_calls < self.half_open_max_calls
+        return False
+
+    def before_call(self) -> None:
+        """
+        Reserve permission for a call.
+
+        Raises:
+            CircuitOpenError: If the circuit is open or all half-open probes are in flight
+        """
+        state = self.state
+        if state == self.OPEN:
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        if state == self.HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                raise CircuitOpenError(f"Circuit '{self.name}' is half-open, probe in flight")
+            self._half_open_calls += 1
+
+    def release(self) -> None:
+        """Release a reserved call without recording an outcome (e.g. cancelled by the caller)."""
+        if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self) -> None:
+        """Record a successful call."""
+        if self._state != self.CLOSED:
+            logger.info("Circuit '%s' closed after successful probe", self.name)
+        self._state = self.CLOSED
+        self._failures = 0
+        self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        """Record a failed call, opening the circuit if the threshold is reached."""
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.warning(
+                    "Circuit '%s' opened after %s failures, retrying in %ss",
+                    self.name, self._failures, self.recovery_timeout
+                )
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._half_open_calls = 0
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies (seconds) with percentile lookup."""
+
+    def __init__(self, window: int = 100):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        """Add a latency sample."""
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Get the q-th percentile (0-1) of recorded latencies using nearest rank.
+
+        Args:
+            q: Percentile as a fraction, e.g. 0.99
+
+        Returns:
+            Latency in seconds, or None if no samples are recorded
+        """
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))
+        return ordered[rank]
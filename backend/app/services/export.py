@@ -0,0 +1,187 @@
+"""
+Streaming export of raw metric events.
+Rows are read from a server-side cursor in fixed-size partitions and encoded
+incrementally as NDJSON, CSV or (with pyarrow installed) Parquet row groups,
+so memory stays constant regardless of how many rows are exported.
+"""
+
+import csv
+import importlib.util
+import io
+import logging
+from datetime import datetime
+from typing import Iterator, Optional
+from uuid import UUID
+import orjson
+from sqlalchemy import select
+from ..database import open_read_session
+from ..models import Metric, Variant
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ("id", "variant_id", "intent_id", "locale", "event_type", "timestamp", "event_id")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def build_export_query(
+    tenant_id: str,
+    intent_id: Optional[str] = None,
+    variant_id: Optional[UUID] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Build the export SELECT with optional filters.
+
+    Args:
+        tenant_id: Tenant whose events to export
+        intent_id: Only events of this intent's variants
+        variant_id: Only events of this variant
+        since: Only events at or after this time
+        until: Only events before this time
+
+    Returns:
+        SQLAlchemy Select yielding rows in EXPORT_COLUMNS order
+    """
+    query = select(
+        Metric.id, Metric.variant_id, Variant.intent_id, Variant.locale,
+        Metric.event_type, Metric.timestamp, Metric.event_id
+    ).join(Variant, Variant.id == Metric.variant_id).where(Metric.tenant_id == tenant_id)
+
+    if intent_id is not None:
+        query = query.where(Variant.intent_id == intent_id)
+    if variant_id is not None:
+        query = query.where(Metric.variant_id == variant_id)
+    if since is not None:
+        query = query.where(Metric.timestamp >= since)
+    if until is not None:
+        query = query.where(Metric.timestamp < until)
+    return query
+
+
+def iter_partitions(query, batch_size: int) -> Iterator[list[tuple]]:
+    """
+    Stream query results in partitions of batch_size rows.
+
+    Opens its own short-lived session (on the read replica when usable)
+    rather than using the request's, so the pooled connection is held only
+    while rows are being read and is returned as soon as the export finishes
+    or the client disconnects.
+
+    Args:
+        query: Select to execute
+        batch_size: Rows fetched per round trip (server-side cursor yield_per)
+
+    Yields:
+        Lists of row tuples
+    """
+    db = open_read_session()
+    try:
+        result = db.execute(query.execution_options(yield_per=batch_size))
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+    finally:
+        db.close()
+
+
+def _ndjson_value(value):
+    return str(value) if isinstance(value, UUID) else value
+
+
+def encode_ndjson(partitions: Iterator[list[tuple]]) -> Iterator[bytes]:
+    """Encode partitions as newline-delimited JSON objects, one chunk per partition."""
+    for rows in partitions:
+        yield b"".join(
+            orjson.dumps(dict(zip(EXPORT_COLUMNS, map(_ndjson_value, row)))) + b"\n"
+            for row in rows
+        )
+
+
+def encode_csv(partitions: Iterator[list[tuple]]) -> Iterator[bytes]:
+    """Encode partitions as CSV with a header row, one chunk per partition."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in partitions:
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that collects bytes until drained."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parquet_available() -> bool:
+    """Check whether pyarrow (optional) is installed, without importing it."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def encode_parquet(partitions: Iterator[list[tuple]]) -> Iterator[bytes]:
+    """Encode partitions as a Parquet file, one row group per partition."""
+    # Imported on first use: pyarrow (and numpy) would add to every cold start
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("variant_id", pa.string()),
+        ("intent_id", pa.string()),
+        ("locale", pa.string()),
+        ("event_type", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("event_id", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in partitions:
+            columns = list(zip(*rows))
+            arrays = [
+                pa.array(columns[i], type=schema.field(i).type) if i == 5
+                else pa.array([None if v is None else str(v) for v in columns[i]], type=pa.string())
+                for i in range(len(EXPORT_COLUMNS))
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "parquet": encode_parquet,
+}
@@ -0,0 +1,168 @@
+"""
+Cross-worker cache invalidation bus.
+Writers publish invalidations inside their transaction; on Postgres they are
+sent with NOTIFY and every worker's LISTEN connection applies them to its
+local caches. Other databases only invalidate the local process.
+"""
+
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from typing import Callable, Optional
+from sqlalchemy import event, func, select as sa_select
+from sqlalchemy.orm import Session
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Invalidation kinds and the meaning of their key
+VARIANT = "variant"   # key: intent_id whose variants changed
+STATS = "stats"       # key: variant_id whose sent/clicked counts changed
+API_KEY = "api_key"   # key: API key that was created or changed
+ALL = "*"             # key unused; handlers must drop everything (e.g. after missed notifications)
+
+_PENDING_KEY = "pending_invalidations"
+
+Handler = Callable[[str], None]
+
+
+class InvalidationBus:
+    """
+    Fan-out of cache invalidations to local handlers and other workers.
+
+    Handlers are registered per kind with subscribe(). publish() attaches an
+    invalidation to the session's transaction: local handlers run after the
+    commit, and on Postgres a pg_notify is issued in the same transaction so
+    other workers only see it once the change is visible.
+    """
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._handlers: dict[str, list[Handler]] = defaultdict(list)
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def subscribe(self, kind: str, handler: Handler) -> None:
+        """
+        Register a handler for an invalidation kind.
+
+        Handlers subscribed to a specific kind also receive ALL with key "".
+
+        Args:
+            kind: One of VARIANT, STATS, API_KEY
+            handler: Callable taking the invalidated key
+        """
+        self._handlers[kind].append(handler)
+
+    def publish(self, db: Session, kind: str, key: str) -> None:
+        """
+        Publish an invalidation as part of the session's current transaction.
+
+        Must be called before db.commit(). Nothing is delivered if the
+        transaction rolls back.
+
+        Args:
+            db: Session performing the write
+            kind: Invalidation kind
+            key: Invalidated key
+        """
+        db.info.setdefault(_PENDING_KEY, []).append((kind, key))
+
+        if settings.invalidation_enabled and db.get_bind().dialect.name == "postgresql":
+            payload = json.dumps({"kind": kind, "key": key})
+            db.execute(sa_select(func.pg_notify(self.channel, payload)))
+
+    def apply(self, kind: str, key: str) -> None:
+        """Run local handlers for an invalidation."""
+        kinds = list(self._handlers) if kind == ALL else [kind]
+        for handler_kind in kinds:
+            for handler in self._handlers.get(handler_kind, []):
+                try:
+                    handler(key)
+                except Exception as e:
+                    logger.error("Invalidation handler for %s failed: %s", handler_kind, e)
+
+    def start(self, engine) -> None:
+        """
+        Start the background LISTEN thread (Postgres only).
+
+        Args:
+            engine: SQLAlchemy engine used to open the dedicated listener connection
+        """
+        if not settings.invalidation_enabled or engine.dialect.name != "postgresql":
+            return
+        if self._listener and self._listener.is_alive():
+            return
+
+        self._stop.clear()
+        self._listener = threading.Thread(
+            target=self._listen_forever, args=(engine,), name="invalidation-listener", daemon=True
+        )
+        self._listener.start()
+
+    def stop(self) -> None:
+        """Stop the listener thread."""
+        self._stop.set()
+        if self._listener:
+            self._listener.join(timeout=5)
+            self._listener = None
+
+    def _listen_forever(self, engine) -> None:
+        """Keep one LISTEN connection open, reconnecting with backoff on failure."""
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self._listen(engine)
+                backoff = 1.0
+            except Exception as e:
+                logger.error("Invalidation listener error, reconnecting in %.0fs: %s", backoff, e)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _listen(self, engine) -> None:
+        """Consume notifications until stopped or the connection fails."""
+        pooled = engine.raw_connection()
+        pooled.detach()  # Dedicated connection, never returned to the pool
+        conn = pooled.driver_connection
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+
+            # Notifications may have been missed while disconnected
+            self.apply(ALL, "")
+            logger.info("Listening for cache invalidations on '%s'", self.channel)
+
+            while not self._stop.is_set():
+                readable, _, _ = select.select([conn], [], [], 1.0)
+                if not readable:
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    try:
+                        message = json.loads(notification.payload)
+                        self.apply(message["kind"], message["key"])
+                    except (ValueError, KeyError) as e:
+                        logger.warning("Ignoring malformed invalidation %r: %s", notification.payload, e)
+        finally:
+            pooled.close()
+
+
+invalidation_bus = InvalidationBus(settings.invalidation_channel)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_invalidations(session: Session) -> None:
+    """Apply a session's published invalidations locally once its transaction commits."""
+    for kind, key in session.info.pop(_PENDING_KEY, []):
+        invalidation_bus.apply(kind, key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_invalidations(session: Session) -> None:
+    """Drop invalidations of a rolled-back transaction."""
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,326 @@
+"""
+Durable local journal for metric events.
+Ingestion appends events to segment files on local disk and acknowledges
+once they are fsync'd; a background replayer bulk-inserts sealed segments
+into the database and deletes them, so metric writes keep working (and
+counts stay complete) while Postgres is slow or down.
+"""
+
+import fcntl
+import logging
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Optional
+from uuid import UUID
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# The magic carries the frame format version; segments keep the version they
+# were written with, so bump it whenever _EVENT changes.
+_MAGIC = b"PBJRNL02"
+_SEGMENT_SUFFIX = ".seg"
+# payload length, CRC32 of payload
+_FRAME = struct.Struct("<II")
+# variant UUID bytes, event type code, timestamp (µs since epoch, UTC), event_id length, segment length
+_EVENT = struct.Struct("<16sBqHH")
+# Version 1 frames (written before segments were tracked) have no segment length
+_MAGIC_V1 = b"PBJRNL01"
+_EVENT_V1 = struct.Struct("<16sBqH")
+
+EVENT_CODES = {"sent": 0, "clicked": 1}
+EVENT_TYPES = {code: name for name, code in EVENT_CODES.items()}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = datetime.resolution
+
+
+def encode_event(
+    variant_id: UUID,
+    event_type: str,
+    timestamp: datetime,
+    event_id: str,
+    segment: Optional[str] = None
+) -> bytes:
+    """
+    Encode one event as a journal frame.
+
+    Args:
+        variant_id: Variant UUID
+        event_type: 'sent' or 'clicked'
+        timestamp: Event time (naive values are taken as UTC)
+        event_id: Idempotency key
+        segment: Segment key, if any
+
+    Returns:
+        Frame bytes (header + payload)
+    """
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    micros = (timestamp - _EPOCH) // _MICROSECOND
+    event_id_bytes = event_id.encode()
+    segment_bytes = (segment or "").encode()
+    payload = _EVENT.pack(
+        variant_id.bytes, EVENT_CODES[event_type], micros, len(event_id_bytes), len(segment_bytes)
+    ) + event_id_bytes + segment_bytes
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_events(data: bytes, source: str = "journal", version: int = 2) -> Iterator[tuple]:
+    """
+    Decode frames written by encode_event.
+
+    Stops at the first truncated or corrupt frame (e.g. a write torn by a
+    crash), which can only be at the end of a segment.
+
+    Args:
+        data: Segment contents after the magic header
+        source: Name used in the warning for a damaged tail
+        version: Frame format of the segment (1 has no segment field)
+
+    Yields:
+        (variant_id, event_type, timestamp, event_id, segment) tuples
+    """
+    event_struct = _EVENT if version >= 2 else _EVENT_V1
+    offset = 0
+    end = len(data)
+    while offset + _FRAME.size <= end:
+        length, crc = _FRAME.unpack_from(data, offset)
+        start = offset + _FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or length < event_struct.size or zlib.crc32(payload) != crc:
+            break
+        if version >= 2:
+            variant_bytes, code, micros, id_length, segment_length = _EVENT.unpack_from(payload)
+        else:
+            (variant_bytes, code, micros, id_length), segment_length = _EVENT_V1.unpack_from(payload), 0
+        event_id = payload[event_struct.size:event_struct.size + id_length].decode()
+        segment_start = event_struct.size + id_length
+        segment = payload[segment_start:segment_start + segment_length].decode() or None
+        yield UUID(bytes=variant_bytes), EVENT_TYPES[code], _EPOCH + micros * _MICROSECOND, event_id, segment
+        offset = start + length
+
+    if offset < end:
+        logger.warning("Discarding %s damaged bytes at the end of %s", end - offset, source)
+
+
+def read_segment(path: Path) -> list[tuple]:
+    """Read all intact events from a sealed segment file (any format version)."""
+    data = path.read_bytes()
+    if data.startswith(_MAGIC):
+        version = 2
+    elif data.startswith(_MAGIC_V1):
+        version = 1
+    else:
+        logger.warning("Skipping %s: not a metrics journal segment", path)
+        return []
+    return list(decode_events(data[len(_MAGIC):], source=str(path), version=version))
+
+
+def _try_lock(slot_dir: Path) -> Optional[int]:
+    """Take the slot's lock file without blocking; returns the fd or None if held elsewhere."""
+    fd = os.open(slot_dir / "lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class MetricJournal:
+    """
+    Append-only, segment-rotated journal of metric events.
+
+    Each worker process owns one slot directory under the journal root
+    (claimed with flock), so workers never share a file. Events are written
+    as length-prefixed, CRC-checked binary frames to the active segment.
+
+    Appends use group commit: a writer flushes and fsyncs everything written
+    so far, and writers that arrive during that fsync are covered by the next
+    one, so under load many events share one fsync.
+    """
+
+    def __init__(self, root: str, segment_bytes: int, fsync: bool = True):
+        self.root = Path(root)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self.slot_dir, self._lock_fd = self._claim_slot()
+        self._adopted: dict[Path, int] = {}
+
+        # _lock guards the active file; _sync_lock serializes fsyncs and rotation
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0  # Appends written (across segments)
+        self._synced = 0   # Appends known to be durable
+
+        existing = self._segments(self.slot_dir)
+        self._sequence = int(existing[-1].stem) if existing else 0
+        if existing:
+            logger.info("Metrics journal %s has %s segments to replay", self.slot_dir, len(existing))
+        self._open_segment()
+
+    def _claim_slot(self) -> tuple[Path, int]:
+        """Lock the first slot directory not held by another live process."""
+        index = 0
+        while True:
+            slot_dir = self.root / f"slot-{index}"
+            slot_dir.mkdir(exist_ok=True)
+            fd = _try_lock(slot_dir)
+            if fd is not None:
+                return slot_dir, fd
+            index += 1
+
+    @staticmethod
+    def _segments(slot_dir: Path) -> list[Path]:
+        return sorted(slot_dir.glob(f"*{_SEGMENT_SUFFIX}"))
+
+    def _open_segment(self) -> None:
+        self._sequence += 1
+        self._path = self.slot_dir / f"{self._sequence:012d}{_SEGMENT_SUFFIX}"
+        self._file = open(self._path, "ab")
+        self._file.write(_MAGIC)
+        self._size = len(_MAGIC)
+        if self.fsync:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            _fsync_dir(self.slot_dir)
+
+    def append(self, events: list[tuple]) -> None:
+        """
+        Append events and return once they are durable.
+
+        Args:
+            events: (variant_id, event_type, timestamp, event_id, segment) tuples
+        """
+        frames = b"".join(encode_event(*event) for event in events)
+        with self._lock:
+            self._file.write(frames)
+            self._size += len(frames)
+            self._written += 1
+            ticket = self._written
+            full = self._size >= self.segment_bytes
+
+        self._sync(ticket)
+        if full:
+            self.rotate(min_bytes=self.segment_bytes - len(_MAGIC))
+
+    def _sync(self, ticket: int) -> None:
+        """Make sure everything up to `ticket` is flushed (and fsync'd if enabled)."""
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return  # Covered by a group fsync that ran while we waited
+            with self._lock:
+                self._file.flush()
+                target = self._written
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._synced = target
+
+    def rotate(self, min_bytes: int = 1) -> bool:
+        """
+        Seal the active segment and start a new one.
+
+        Args:
+            min_bytes: Only rotate if at least this many event bytes are in
+                the active segment (default: if it has any events)
+
+        Returns:
+            True if a segment was sealed
+        """
+        with self._sync_lock, self._lock:
+            if self._size - len(_MAGIC) < min_bytes:
+                return False
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._synced = self._written
+            self._open_segment()
+            return True
+
+    def sealed_segments(self) -> list[Path]:
+        """Segments of this worker that are no longer written to, oldest first."""
+        with self._lock:
+            active = self._path
+        return [path for path in self._segments(self.slot_dir) if path != active]
+
+    def orphaned_segments(self) -> list[Path]:
+        """
+        Segments left in slots of workers that have exited.
+
+        Free slots are locked (and kept) by this worker until they are empty,
+        so no other worker replays them at the same time.
+        """
+        for slot_dir in self.root.glob("slot-*"):
+            if slot_dir == self.slot_dir or slot_dir in self._adopted:
+                continue
+            fd = _try_lock(slot_dir)
+            if fd is not None:
+                self._adopted[slot_dir] = fd
+
+        segments = []
+        for slot_dir, fd in list(self._adopted.items()):
+            found = self._segments(slot_dir)
+            if found:
+                segments.extend(found)
+            else:
+                os.close(fd)
+                del self._adopted[slot_dir]
+        return segments
+
+    def status(self) -> dict:
+        """Backlog waiting to be replayed, for /health."""
+        pending = self.sealed_segments()
+        with self._lock:
+            active_bytes = self._size - len(_MAGIC)
+        return {
+            "slot": self.slot_dir.name,
+            "pending_segments": len(pending),
+            "pending_bytes": sum(path.stat().st_size - len(_MAGIC) for path in pending) + active_bytes,
+        }
+
+    def close(self) -> None:
+        """Flush and close the active segment (it is replayed like any sealed one)."""
+        with self._sync_lock, self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._synced = self._written
+            if self._size == len(_MAGIC):
+                self._path.unlink(missing_ok=True)
+
+
+@lru_cache()
+def get_metric_journal() -> Optional[MetricJournal]:
+    """Get this process's metrics journal, or None if disabled or unavailable."""
+    if not settings.metrics_journal_enabled:
+        return None
+    try:
+        return MetricJournal(
+            settings.metrics_journal_dir,
+            segment_bytes=settings.metrics_journal_segment_bytes,
+            fsync=settings.metrics_journal_fsync
+        )
+    except OSError as e:
+        logger.error("Metrics journal disabled: %s", e)
+        return None
@@ -0,0 +1,55 @@
+"""
+Locale fallback resolution.
+Maps a requested locale to the ordered chain of locales whose variants may serve it.
+"""
+
+from functools import lru_cache
+from ..config import get_settings
+
+settings = get_settings()
+
+
+def normalize_locale(locale: str) -> str:
+    """
+    Normalize a locale tag to the form variants are stored under (e.g. 'pt_br' -> 'pt-BR').
+
+    Args:
+        locale: Raw locale tag from the SDK
+
+    Returns:
+        Normalized locale tag
+    """
+    parts = locale.strip().replace("_", "-").split("-")
+    language = parts[0].lower()
+    if len(parts) == 1:
+        return language
+    return "-".join([language] + [p.upper() if len(p) == 2 else p for p in parts[1:]])
+
+
+@lru_cache(maxsize=1024)
+def get_locale_chain(locale: str) -> tuple[str, ...]:
+    """
+    Get the fallback chain for a locale, most specific first.
+
+    For 'pt-BR' with default settings this is ('pt-BR', 'pt', 'en-US').
+    Chains are computed once per locale and cached for the process lifetime.
+
+    Args:
+        locale: Requested locale
+
+    Returns:
+        Tuple of distinct locales in lookup order
+    """
+    locale = normalize_locale(locale or "en-US")
+
+    if locale in settings.locale_fallback_overrides:
+        candidates = [locale] + list(settings.locale_fallback_overrides[locale])
+    else:
+        candidates = [locale]
+        language = locale.split("-")[0]
+        if language != locale:
+            candidates.append(language)
+        candidates.extend(settings.locale_fallback)
+
+    # Drop duplicates while preserving order
+    return tuple(dict.fromkeys(candidates))
@@ -0,0 +1,158 @@
+"""
+Content-addressed cache for n8n generation responses.
+Identical generation requests from the same tenant are answered from memory,
+or from an optional SQLite file so cached generations survive restarts.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from ..models import DEFAULT_TENANT
+from ..schemas import N8nRequest, N8nResponse
+from ..config import get_settings
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def generation_cache_key(request: N8nRequest, tenant_id: str = DEFAULT_TENANT) -> str:
+    """
+    Hash the fields of a request that determine the generated message.
+
+    The timestamp is excluded and text fields are whitespace-normalized, so
+    requests that only differ in those respects share a cache entry. The
+    tenant is part of the key, so generations are never shared across tenants.
+
+    Args:
+        request: n8n request payload
+        tenant_id: Tenant the generation is for
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    normalized = {
+        "tenant_id": tenant_id,
+        "intent_id": request.intent_id.strip(),
+        "locale": request.locale.strip(),
+        "context": " ".join(request.context.split()),
+        "base_message": " ".join(request.base_message.split()),
+        "num_candidates": request.num_candidates,
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SqliteCacheTier:
+    """Persistent key/value tier backed by a local SQLite file with wall-clock expiry."""
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS n8n_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_n8n_cache_expires ON n8n_cache (expires_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a non-expired value."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM n8n_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        """Store a value, then trim expired rows and anything over max_size (oldest expiry first)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO n8n_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._conn.execute("DELETE FROM n8n_cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.execute(
+                "DELETE FROM n8n_cache WHERE key IN ("
+                "SELECT key FROM n8n_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+
+    def close(self) -> None:
+        """Close the underlying connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class GenerationCache:
+    """
+    Two-tier (memory, optional SQLite) cache of N8nResponse keyed by request content.
+
+    The SQLite tier is accessed on the threadpool so its queries (and the
+    trimming DELETEs on writes) never block the event loop.
+    """
+
+    def __init__(self, max_size: int, ttl: float, path: Optional[str] = None):
+        self.ttl = ttl
+        self.memory = TTLCache(max_size=max_size, ttl=ttl)
+        self.disk: Optional[SqliteCacheTier] = None
+        if path:
+            try:
+                self.disk = SqliteCacheTier(path, max_size=max_size)
+            except sqlite3.Error as e:
+                logger.error("Could not open n8n cache at %s, using memory only: %s", path, e)
+
+    async def get(self, request: N8nRequest, tenant_id: str = DEFAULT_TENANT) -> Optional[N8nResponse]:
+        """
+        Look up a cached response for a request.
+
+        Args:
+            request: n8n request payload
+            tenant_id: Tenant the generation is for
+
+        Returns:
+            Cached N8nResponse or None
+        """
+        key = generation_cache_key(request, tenant_id)
+        cached = self.memory.get(key)
+        if cached is not None:
+            return cached
+
+        if self.disk is not None:
+            try:
+                raw = await run_in_threadpool(self.disk.get, key)
+            except sqlite3.Error as e:
+                logger.warning("Failed to read n8n cache entry: %s", e)
+                return None
+            if raw is not None:
+                response = N8nResponse.model_validate_json(raw)
+                self.memory.set(key, response)
+                return response
+
+        return None
+
+    async def set(self, request: N8nRequest, response: N8nResponse, tenant_id: str = DEFAULT_TENANT) -> None:
+        """
+        Cache a response for a request.
+
+        Args:
+            request: n8n request payload
+            response: Response returned by n8n
+            tenant_id: Tenant the generation is for
+        """
+        key = generation_cache_key(request, tenant_id)
+        self.memory.set(key, response)
+        if self.disk is not None:
+            try:
+                await run_in_threadpool(self.disk.set, key, response.model_dump_json(), self.ttl)
+            except sqlite3.Error as e:
+                logger.warning("Failed to persist n8n cache entry: %s", e)
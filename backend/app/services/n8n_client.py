@@ -3,57 +3,199 @@ n8n workflow client.
 Sends notification intents to n8n for AI processing via Gemini.
 """
 
+import asyncio
 import httpx
 import logging
-from typing import Optional
+import time
+from functools import lru_cache
+from typing import Collection, Optional
+from ..models import DEFAULT_TENANT
 from ..schemas import N8nRequest, N8nResponse
 from ..config import get_settings
+from .circuit_breaker import CircuitBreaker, LatencyTracker
+from .n8n_cache import GenerationCache
+from .variant_logic import normalize_message
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
 class N8nClient:
-    """Client for interacting with n8n workflow."""
-    
+    """
+    Client for interacting with n8n workflow.
+
+    Calls go through a circuit breaker so that a degraded n8n/Gemini fails fast
+    instead of holding every exploring request for the full timeout, and the
+    timeout itself adapts to recently observed latencies. Responses to
+    identical requests are served from a content-addressed cache. One pooled
+    httpx client is reused across calls so connections to n8n stay warm.
+    """
+
     def __init__(self, url: Optional[str] = None, timeout: Optional[int] = None):
         self.url = url or settings.n8n_url
         self.timeout = timeout or settings.n8n_timeout
-    
-    async def resolve_intent(self, request: N8nRequest) -> N8nResponse:
+        self.breaker = CircuitBreaker(
+            "n8n",
+            failure_threshold=settings.n8n_breaker_failure_threshold,
+            recovery_timeout=settings.n8n_breaker_recovery_timeout,
+            half_open_max_calls=settings.n8n_breaker_half_open_max_calls
+        )
+        self.latency = LatencyTracker(window=settings.n8n_latency_window)
+        self.cache: Optional[GenerationCache] = None
+        if settings.n8n_cache_enabled:
+            self.cache = GenerationCache(
+                max_size=settings.n8n_cache_max_entries,
+                ttl=settings.n8n_cache_ttl,
+                path=settings.n8n_cache_path
+            )
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def _client(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP client, creating it on first use."""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(headers={"Content-Type": "application/json"})
+        return self._http
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client (a new one is created on the next call)."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def is_available(self) -> bool:
+        """Check whether a generation call would currently be attempted."""
+        return self.breaker.is_available()
+
+    def current_timeout(self) -> float:
+        """
+        Get the timeout for the next call.
+
+        With adaptive timeouts enabled and enough samples, this is the configured
+        latency percentile times a headroom multiplier, clamped between
+        n8n_timeout_min and n8n_timeout. Half-open probes always get the full
+        n8n_timeout so a slower-but-healthy n8n can still close the circuit.
+
+        Returns:
+            Timeout in seconds
+        """
+        if (
+            not settings.n8n_adaptive_timeout
+            or len(self.latency) < settings.n8n_latency_min_samples
+            or self.breaker.state != CircuitBreaker.CLOSED
+        ):
+            return float(self.timeout)
+
+        observed = self.latency.percentile(settings.n8n_timeout_percentile)
+        adaptive = observed * settings.n8n_timeout_multiplier
+        return max(settings.n8n_timeout_min, min(float(self.timeout), adaptive))
+
+    def expected_latency(self) -> Optional[float]:
+        """
+        Estimate how long the next generation call will take.
+
+        Returns:
+            The deadline_latency_percentile of recent call latencies in
+            seconds, or None until n8n_latency_min_samples calls are recorded
+        """
+        if len(self.latency) < settings.n8n_latency_min_samples:
+            return None
+        return self.latency.percentile(settings.deadline_latency_percentile)
+
+    async def resolve_intent(
+        self,
+        request: N8nRequest,
+        use_cache: bool = True,
+        tenant_id: str = DEFAULT_TENANT,
+        known_messages: Optional[Collection[str]] = None
+    ) -> N8nResponse:
         """
         Send intent to n8n workflow for AI processing.
-        
+
         Args:
             request: Intent request data
-            
+            use_cache: If False, always call n8n (e.g. when a different
+                message than the cached one is needed); the result is still cached
+            tenant_id: Tenant the generation is for (part of the cache key)
+            known_messages: Normalized messages already stored as variants. A
+                cached response offering only these is ignored, since dedup
+                would reject it and exploration would never get a new message.
+
         Returns:
             N8nResponse with variant_message and should_store_variant flag
-            
+
         Raises:
+            CircuitOpenError: If the circuit is open and the call was not attempted
             httpx.HTTPError: If n8n request fails
         """
+        if use_cache and self.cache is not None:
+            cached = await self.cache.get(request, tenant_id)
+            if cached is not None and cached.should_store_variant and known_messages is not None and all(
+                normalize_message(message) in known_messages for message in cached.candidate_messages()
+            ):
+                logger.debug("Ignoring cached n8n response for intent %s: already stored", request.intent_id)
+                cached = None
+            if cached is not None:
+                logger.info("n8n cache hit for intent %s", request.intent_id, extra={"event": "n8n.cache_hit"})
+                return cached
+
+        self.breaker.before_call()
+
+        started = time.monotonic()
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.url,
-                    json=request.model_dump(mode='json'),
-                    headers={"Content-Type": "application/json"}
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                logger.info(f"n8n response for intent {request.intent_id}: {data}")
-                
-                return N8nResponse(**data)
-                
+            response = await self._client().post(
+                self.url,
+                json=request.model_dump(mode='json'),
+                timeout=self.current_timeout()
+            )
+            response.raise_for_status()
+
+            data = response.json()
+            logger.debug("n8n response body for intent %s: %s", request.intent_id, data)
+
+            result = N8nResponse(**data)
+
+        except asyncio.CancelledError:
+            # Caller gave up; says nothing about n8n health
+            self.breaker.release()
+            raise
         except httpx.HTTPError as e:
-            logger.error(f"n8n request failed: {e}")
+            if isinstance(e, httpx.TimeoutException):
+                # Count timeouts as observed latency so the adaptive timeout can grow
+                self.latency.record(time.monotonic() - started)
+            self.breaker.record_failure()
+            logger.error("n8n request failed: %s", e)
             raise
         except Exception as e:
-            logger.error(f"Unexpected error calling n8n: {e}")
+            self.breaker.record_failure()
+            logger.error("Unexpected error calling n8n: %s", e)
             raise
 
+        elapsed = time.monotonic() - started
+        self.latency.record(elapsed)
+        self.breaker.record_success()
+        logger.info(
+            "n8n responded for intent %s in %.0fms", request.intent_id, elapsed * 1000,
+            extra={"event": "n8n.response"}
+        )
+        if self.cache is not None:
+            await self.cache.set(request, result, tenant_id)
+        return result
+
+
+@lru_cache()
+def get_n8n_client() -> N8nClient:
+    """Get the process-wide n8n client, creating it on first use."""
+    return N8nClient()
+
+
+async def close_n8n_client() -> None:
+    """Close the pooled HTTP client if the n8n client was ever created."""
+    if get_n8n_client.cache_info().currsize:
+        await get_n8n_client().aclose()
+
 
-# Singleton instance
-n8n_client = N8nClient()
+def __getattr__(name: str):
+    # `from .n8n_client import n8n_client` keeps working, creating the client on access
+    if name == "n8n_client":
+        return get_n8n_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
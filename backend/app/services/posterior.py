@@ -0,0 +1,216 @@
+"""
+Precomputed posterior summaries for the dashboard.
+A background job computes, for each variant, the probability that it is the
+best arm of its (tenant_id, intent_id, locale) group and a credible interval for its
+CTR, under the same Beta(clicked + 1, sent - clicked + 1) posterior that
+Thompson Sampling uses. Only intents whose counts changed are recomputed,
+and the dashboard endpoints read the cached results.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Optional
+from sqlalchemy.orm import Session
+from ..config import get_settings
+from ..database import SessionLocal
+from .invalidation import invalidation_bus, VARIANT, STATS
+from .variant_logic import get_arm_counts
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Intents whose counts are reloaded per query
+_INTENTS_PER_QUERY = 1000
+
+
+def summarize_arms(
+    sent: "np.ndarray",
+    clicked: "np.ndarray",
+    draws: int,
+    level: float,
+    rng: "np.random.Generator"
+) -> tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    Monte Carlo summary of competing arms' Beta posteriors.
+
+    Draws `draws` samples from every arm's posterior at once; P(best) is the
+    share of draws in which an arm has the highest sample, and the credible
+    interval is the central `level` quantile range of its samples.
+
+    Args:
+        sent: Sends per arm
+        clicked: Clicks per arm
+        draws: Samples per arm
+        level: Credible interval mass, e.g. 0.95
+        rng: Random generator
+
+    Returns:
+        Tuple of (p_best, ctr_low, ctr_high) arrays, one entry per arm
+    """
+    # Imported on first use: numpy adds ~100ms to every worker's cold start
+    import numpy as np
+
+    alpha = clicked + 1.0
+    beta = np.maximum(sent - clicked, 0) + 1.0
+    samples = rng.beta(alpha[:, None], beta[:, None], size=(len(sent), draws))
+
+    p_best = np.bincount(samples.argmax(axis=0), minlength=len(sent)) / draws
+    tail = (1.0 - level) / 2
+    ctr_low, ctr_high = np.quantile(samples, [tail, 1.0 - tail], axis=1)
+    return p_best, ctr_low, ctr_high
+
+
+class PosteriorStore:
+    """
+    Per-worker cache of variant posterior summaries.
+
+    Intents are marked dirty by VARIANT and STATS invalidations. Because
+    stats invalidations are coalesced per invalidation_stats_min_interval,
+    an intent stays dirty until a refresh starts that long after its last
+    change, so events whose invalidation was coalesced away are still picked up.
+    """
+
+    def __init__(self):
+        self._summaries: dict[str, dict] = {}          # variant_id -> summary
+        self._intent_by_variant: dict[str, str] = {}
+        self._dirty: dict[str, float] = {}             # intent_id -> last change (monotonic)
+        self._all_dirty = True                         # Full refresh pending
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._rng: Optional["np.random.Generator"] = None  # Created with the first summary
+
+    def mark_intent(self, intent_id: str) -> None:
+        """Mark an intent for recomputation ("" marks everything)."""
+        with self._lock:
+            if not intent_id:
+                self._all_dirty = True
+            else:
+                self._dirty[intent_id] = time.monotonic()
+
+    def mark_variant(self, variant_id: str) -> None:
+        """Mark the intent of a variant whose counts changed for recomputation."""
+        if not variant_id:
+            self.mark_intent("")
+            return
+        intent_id = self._intent_by_variant.get(variant_id)
+        # Unknown variants are new; store_variant's VARIANT invalidation covers them
+        if intent_id is not None:
+            self.mark_intent(intent_id)
+
+    def refresh(self, db: Session) -> int:
+        """
+        Recompute summaries for dirty intents (all intents on the first call).
+
+        Args:
+            db: Database session
+
+        Returns:
+            Number of intents recomputed
+        """
+        with self._refresh_lock:
+            started = time.monotonic()
+            with self._lock:
+                full = self._all_dirty
+                self._all_dirty = False
+                intents = list(self._dirty)
+
+            if not full and not intents:
+                return 0
+            try:
+                if full:
+                    rows = get_arm_counts(db)
+                else:
+                    rows = []
+                    for i in range(0, len(intents), _INTENTS_PER_QUERY):
+                        rows.extend(get_arm_counts(db, intents[i:i + _INTENTS_PER_QUERY]))
+            except Exception:
+                # Dirty intents are still marked; make sure a pending full refresh is retried too
+                with self._lock:
+                    self._all_dirty = self._all_dirty or full
+                raise
+
+            groups: dict[tuple[str, str, str], list[tuple]] = defaultdict(list)
+            for variant_id, tenant_id, intent_id, locale, sent, clicked in rows:
+                groups[(tenant_id, intent_id, locale)].append((variant_id, sent, clicked))
+
+            summaries = {}
+            if groups:
+                import numpy as np
+                if self._rng is None:
+                    self._rng = np.random.default_rng()
+            for arms in groups.values():
+                sent = np.array([arm[1] for arm in arms], dtype=float)
+                clicked = np.array([arm[2] for arm in arms], dtype=float)
+                p_best, ctr_low, ctr_high = summarize_arms(
+                    sent, clicked, settings.posterior_draws, settings.posterior_interval, self._rng
+                )
+                for (variant_id, _, _), p, low, high in zip(arms, p_best, ctr_low, ctr_high):
+                    summaries[variant_id] = {
+                        "p_best": round(float(p), 4),
+                        "ctr_low": round(float(low), 5),
+                        "ctr_high": round(float(high), 5),
+                    }
+            intent_by_variant = {variant_id: intent_id for variant_id, _, intent_id, _, _, _ in rows}
+
+            settled_before = started - settings.invalidation_stats_min_interval
+            with self._lock:
+                if full:
+                    self._summaries = summaries
+                    self._intent_by_variant = intent_by_variant
+                else:
+                    refreshed = set(intents)
+                    stale = [v for v, i in self._intent_by_variant.items() if i in refreshed]
+                    for variant_id in stale:
+                        self._summaries.pop(variant_id, None)
+                        self._intent_by_variant.pop(variant_id, None)
+                    self._summaries.update(summaries)
+                    self._intent_by_variant.update(intent_by_variant)
+                for intent_id in (list(self._dirty) if full else intents):
+                    if self._dirty.get(intent_id, started) <= settled_before:
+                        del self._dirty[intent_id]
+
+            recomputed = len({(tenant_id, intent_id) for tenant_id, intent_id, _ in groups})
+            logger.info(
+                "Refreshed posteriors for %s intents in %.0fms",
+                recomputed, (time.monotonic() - started) * 1000
+            )
+            return recomputed
+
+    def annotate(self, variants: list[dict]) -> list[dict]:
+        """
+        Add p_best, ctr_low and ctr_high to variant dicts in place.
+
+        Values are None for variants not yet covered by a refresh.
+
+        Args:
+            variants: Variant dicts with a 'variant_id' key
+
+        Returns:
+            The same list
+        """
+        summaries = self._summaries
+        for variant in variants:
+            summary = summaries.get(variant["variant_id"])
+            variant["p_best"] = summary["p_best"] if summary else None
+            variant["ctr_low"] = summary["ctr_low"] if summary else None
+            variant["ctr_high"] = summary["ctr_high"] if summary else None
+        return variants
+
+
+posterior_store = PosteriorStore()
+invalidation_bus.subscribe(VARIANT, posterior_store.mark_intent)
+invalidation_bus.subscribe(STATS, posterior_store.mark_variant)
+
+
+def refresh_posteriors() -> int:
+    """Recompute posterior summaries for changed intents (background job entry point)."""
+    db = SessionLocal()
+    try:
+        return posterior_store.refresh(db)
+    finally:
+        db.close()
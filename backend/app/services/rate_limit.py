@@ -0,0 +1,184 @@
+"""
+In-process admission control for /v1/resolve.
+Token buckets keyed by API key (or client address) and by tenant and intent, with
+separate budgets for resolves and for n8n generations.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+from ..config import get_settings
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+RESOLVE = "resolve"
+GENERATE = "generate"
+
+# Buckets idle this long are dropped; they would have refilled to full anyway
+# as long as burst / rate is shorter than this.
+_BUCKET_IDLE_TTL = 600.0
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second up to `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, cost: float = 1.0) -> float:
+        """
+        Take `cost` tokens if available.
+
+        Args:
+            cost: Tokens to take
+
+        Returns:
+            0.0 if acquired, otherwise seconds until enough tokens are available
+        """
+        cost = min(cost, self.burst)
+        self._refill(time.monotonic())
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (cost - self.tokens) / self.rate
+
+    def refund(self, cost: float = 1.0) -> None:
+        """Return tokens taken by a request that was rejected by another bucket."""
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+class RateLimiter:
+    """
+    Per-worker token buckets for the resolve and generation budgets.
+
+    Limits come from Settings (rate_limit_*), with per-API-key overrides in
+    rate_limit_overrides. Checks are in-memory only, so rejections never touch
+    the database. With N workers the effective limit is N times the configured one.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self._buckets = TTLCache(max_size=max_keys, ttl=_BUCKET_IDLE_TTL)
+        self._lock = threading.Lock()
+
+    def _limits(self, budget: str, scope: str, api_key: Optional[str]) -> tuple[float, float]:
+        """Get (rate, burst) for a budget ('resolve'/'generate') and scope ('key'/'intent')."""
+        rate = getattr(settings, f"rate_limit_{budget}_per_{scope}")
+        burst = getattr(settings, f"rate_limit_{budget}_burst_per_{scope}")
+        if scope == "key" and api_key:
+            override = settings.rate_limit_overrides.get(api_key, {})
+            rate = override.get(f"{budget}_rate", rate)
+            burst = override.get(f"{budget}_burst", burst)
+        return rate, burst
+
+    def _bucket(self, budget: str, scope: str, key: tuple, api_key: Optional[str]) -> TokenBucket:
+        cache_key = (budget, scope, key)
+        bucket = self._buckets.get(cache_key)
+        if bucket is None:
+            bucket = TokenBucket(*self._limits(budget, scope, api_key))
+        # Re-set on every use so active buckets don't expire
+        self._buckets.set(cache_key, bucket)
+        return bucket
+
+    def acquire_client(self, budget: str, client_key: str, api_key: Optional[str], cost: float = 1.0) -> float:
+        """
+        Take tokens from the client's bucket for a budget.
+
+        Needs nothing but the request itself, so /v1/resolve calls it before
+        looking up the caller's tenant: floods with invalid keys are throttled
+        without a database lookup each.
+
+        Args:
+            budget: RESOLVE or GENERATE
+            client_key: API key, or client address for anonymous callers
+            api_key: API key used to look up per-key overrides (None if anonymous)
+            cost: Tokens to take
+
+        Returns:
+            0.0 if admitted, otherwise seconds until the request would be admitted
+        """
+        if not settings.rate_limit_enabled:
+            return 0.0
+        with self._lock:
+            return self._bucket(budget, "key", (client_key,), api_key).try_acquire(cost)
+
+    def acquire_intent(
+        self,
+        budget: str,
+        client_key: str,
+        tenant_id: str,
+        intent_id: str,
+        api_key: Optional[str],
+        cost: float = 1.0
+    ) -> float:
+        """
+        Take tokens from the intent's bucket, after acquire_client admitted the request.
+
+        On rejection the tokens acquire_client took are refunded, so either
+        both buckets are charged or neither is. Intent buckets are per tenant,
+        so one tenant's traffic can't spend another's intent budget.
+
+        Args:
+            budget: RESOLVE or GENERATE
+            client_key: Key the client's tokens were taken under
+            tenant_id: Tenant owning the intent
+            intent_id: Intent identifier
+            api_key: API key used to look up per-key overrides (None if anonymous)
+            cost: Tokens to take
+
+        Returns:
+            0.0 if admitted, otherwise seconds until the request would be admitted
+        """
+        if not settings.rate_limit_enabled:
+            return 0.0
+        with self._lock:
+            wait = self._bucket(budget, "intent", (tenant_id, intent_id), None).try_acquire(cost)
+            if wait:
+                self._bucket(budget, "key", (client_key,), api_key).refund(cost)
+            return wait
+
+    def acquire(
+        self,
+        budget: str,
+        client_key: str,
+        tenant_id: str,
+        intent_id: str,
+        api_key: Optional[str],
+        cost: float = 1.0
+    ) -> float:
+        """
+        Take tokens from both the client's and the intent's bucket for a budget.
+
+        Either both buckets are charged or neither is.
+
+        Args:
+            budget: RESOLVE or GENERATE
+            client_key: API key, or client address for anonymous callers
+            tenant_id: Tenant owning the intent
+            intent_id: Intent identifier
+            api_key: API key used to look up per-key overrides (None if anonymous)
+            cost: Tokens to take
+
+        Returns:
+            0.0 if admitted, otherwise seconds until the request would be admitted
+        """
+        wait = self.acquire_client(budget, client_key, api_key, cost)
+        if wait:
+            return wait
+        return self.acquire_intent(budget, client_key, tenant_id, intent_id, api_key, cost)
+
+
+rate_limiter = RateLimiter()
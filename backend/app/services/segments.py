@@ -0,0 +1,82 @@
+"""
+Context segmentation for the bandit.
+Maps a resolve request's free-form context to a segment key drawn from a
+bounded, configured set (e.g. "platform=ios;daypart=evening"), so arm
+statistics can be kept per segment as well as globally.
+"""
+
+import re
+from typing import Optional
+import orjson
+from ..config import get_settings
+
+settings = get_settings()
+
+# "key: value" / "key=value" pairs separated by commas, semicolons or newlines
+_PAIR = re.compile(r"([A-Za-z_][\w-]*)\s*[:=]\s*([^,;\n]+)")
+
+
+def _context_fields(context: str) -> dict[str, str]:
+    """Parse context as a JSON object or as key/value pairs, with lowercased keys and values."""
+    context = context.strip()
+    if context.startswith("{"):
+        try:
+            data = orjson.loads(context)
+        except orjson.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            return {str(k).lower(): str(v).strip().lower() for k, v in data.items()}
+    return {key.lower(): value.strip().lower() for key, value in _PAIR.findall(context)}
+
+
+def extract_segment(context: Optional[str]) -> Optional[str]:
+    """
+    Derive the segment key for a resolve request's context.
+
+    Only dimensions listed in segment_dimensions are used, and only with one
+    of their allowed values, so the number of segments stays bounded.
+    Dimensions appear in configuration order.
+
+    Args:
+        context: ResolveRequest.context
+
+    Returns:
+        Segment key such as "platform=ios;daypart=evening", or None if
+        segmentation is disabled or no dimension matched
+    """
+    if not settings.segment_enabled or not context:
+        return None
+
+    fields = _context_fields(context)
+    parts = [
+        f"{dimension}={fields[dimension]}"
+        for dimension, allowed in settings.segment_dimensions.items()
+        if fields.get(dimension) in allowed
+    ]
+    return ";".join(parts) or None
+
+
+def is_valid_segment(segment: str) -> bool:
+    """
+    Check that a segment key could have been produced by extract_segment.
+
+    Used to reject client-supplied keys outside the configured set.
+
+    Args:
+        segment: Segment key
+
+    Returns:
+        True if every dimension and value is configured, in configuration order
+    """
+    if not settings.segment_enabled:
+        return False
+
+    order = list(settings.segment_dimensions)
+    last = -1
+    for part in segment.split(";"):
+        dimension, _, value = part.partition("=")
+        allowed = settings.segment_dimensions.get(dimension)
+        if allowed is None or value not in allowed or order.index(dimension) <= last:
+            return False
+        last = order.index(dimension)
+    return True
@@ -0,0 +1,238 @@
+"""
+Host-wide shared-memory arm statistics.
+All worker processes on a host map the same file (by default under /dev/shm)
+holding per-variant sent/clicked counters, so Thompson Sampling reads one
+copy of state per host instead of one per worker.
+"""
+
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Optional
+from uuid import UUID
+from ..config import get_settings
+from ..database import SessionLocal
+from .variant_logic import get_all_variant_counts
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_MAGIC = b"PBSTATS1"
+# magic, slot count, reserved, last reconciliation (unix time)
+_HEADER = struct.Struct("<8sII d 8x")
+# variant UUID bytes, sent, clicked
+_SLOT = struct.Struct("<16s Q Q")
+_EMPTY = bytes(16)
+
+
+class SharedArmStats:
+    """
+    Fixed-size open-addressing table of (variant_id -> sent, clicked) in a shared mmap.
+
+    Writes (increments, reconciliation) hold an exclusive flock on the backing
+    file; reads are lock-free and may observe a count that is one event behind.
+    """
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        self._size = _HEADER.size + slots * _SLOT.size
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, self._size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, slots, 0, 0.0), 0)
+            self._mm = mmap.mmap(self._fd, self._size)
+
+        magic, existing_slots, _, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or existing_slots != slots:
+            self.close()
+            raise ValueError(
+                f"{path} holds a different stats table (slots={existing_slots}); "
+                f"remove it or set SHARED_STATS_SLOTS={existing_slots}"
+            )
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, index: int) -> int:
+        return _HEADER.size + index * _SLOT.size
+
+    def _find(self, key: bytes, insert: bool) -> Optional[int]:
+        """Find the slot offset for a key by linear probing, optionally claiming an empty slot."""
+        start = int.from_bytes(key[:8], "little") % self.slots
+        for probe in range(self.slots):
+            offset = self._offset((start + probe) % self.slots)
+            slot_key = self._mm[offset:offset + 16]
+            if slot_key == key:
+                return offset
+            if slot_key == _EMPTY:
+                if not insert:
+                    return None
+                _SLOT.pack_into(self._mm, offset, key, 0, 0)
+                return offset
+        return None
+
+    @property
+    def reconciled_at(self) -> float:
+        """Unix time of the last reconciliation with the database (0 if never)."""
+        return _HEADER.unpack_from(self._mm, 0)[3]
+
+    def get(self, variant_id: str) -> Optional[tuple[int, int]]:
+        """
+        Read counters for a variant.
+
+        Args:
+            variant_id: Variant UUID string
+
+        Returns:
+            Tuple of (sent, clicked), or None if the variant has no slot
+        """
+        try:
+            key = UUID(variant_id).bytes
+        except ValueError:
+            return None
+        offset = self._find(key, insert=False)
+        if offset is None:
+            return None
+        _, sent, clicked = _SLOT.unpack_from(self._mm, offset)
+        return sent, clicked
+
+    def increment(self, variant_id: UUID, event_type: str) -> bool:
+        """
+        Count one event for a variant.
+
+        Args:
+            variant_id: Variant UUID
+            event_type: 'sent' or 'clicked'
+
+        Returns:
+            False if the table is full and the event was not counted
+        """
+        with self._locked():
+            offset = self._find(variant_id.bytes, insert=True)
+            if offset is None:
+                logger.warning("Shared stats table full (%s slots), not counting %s", self.slots, variant_id)
+                return False
+            key, sent, clicked = _SLOT.unpack_from(self._mm, offset)
+            if event_type == "sent":
+                sent += 1
+            elif event_type == "clicked":
+                clicked += 1
+            _SLOT.pack_into(self._mm, offset, key, sent, clicked)
+            return True
+
+    def reconcile(self, counts: dict[str, tuple[int, int]], min_interval: float = 0.0) -> bool:
+        """
+        Overwrite counters with authoritative database counts.
+
+        Skipped if another process reconciled within min_interval seconds, so
+        only one worker per host does the work each period.
+
+        Args:
+            counts: Dict mapping variant_id to (sent, clicked)
+            min_interval: Seconds since the last reconciliation required to proceed
+
+        Returns:
+            True if the table was updated
+        """
+        with self._locked():
+            if time.time() - self.reconciled_at < min_interval:
+                return False
+            for variant_id, (sent, clicked) in counts.items():
+                key = UUID(variant_id).bytes
+                offset = self._find(key, insert=True)
+                if offset is None:
+                    logger.warning("Shared stats table full (%s slots) during reconciliation", self.slots)
+                    break
+                _SLOT.pack_into(self._mm, offset, key, sent, clicked)
+            _HEADER.pack_into(self._mm, 0, _MAGIC, self.slots, 0, time.time())
+            return True
+
+    def needs_reconcile(self, interval: float) -> bool:
+        """Check whether the table is older than the reconciliation interval."""
+        return time.time() - self.reconciled_at >= interval
+
+    def overlay(self, variants: list[dict]) -> list[dict]:
+        """
+        Replace sent/clicked in variant dicts with the shared counters.
+
+        Returns the input unchanged until the table has been reconciled once,
+        since counters are incomplete before that.
+
+        Args:
+            variants: Variant dicts with 'variant_id', 'sent' and 'clicked'
+
+        Returns:
+            New list of (copied) dicts with host-wide counts
+        """
+        if not self.reconciled_at:
+            return variants
+        result = []
+        for variant in variants:
+            counts = self.get(variant["variant_id"])
+            if counts is None:
+                result.append(variant)
+            else:
+                result.append({**variant, "sent": counts[0], "clicked": counts[1]})
+        return result
+
+    def close(self) -> None:
+        """Unmap and close the backing file (the file itself is kept for other workers)."""
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._mm = None
+        os.close(self._fd)
+
+
+@lru_cache()
+def get_shared_arm_stats() -> Optional[SharedArmStats]:
+    """Get this process's handle on the shared stats table, or None if disabled or unavailable."""
+    if not settings.shared_stats_enabled:
+        return None
+    try:
+        return SharedArmStats(settings.shared_stats_path, settings.shared_stats_slots)
+    except (OSError, ValueError) as e:
+        logger.error("Shared arm stats disabled: %s", e)
+        return None
+
+
+def reconcile_shared_stats(force: bool = False) -> bool:
+    """
+    Refresh the shared table from Postgres if it is due.
+
+    Args:
+        force: Reconcile even if another worker did so recently
+
+    Returns:
+        True if this process performed the reconciliation
+    """
+    stats = get_shared_arm_stats()
+    if stats is None:
+        return False
+
+    interval = settings.shared_stats_reconcile_interval
+    if not force and not stats.needs_reconcile(interval):
+        return False
+
+    db = SessionLocal()
+    try:
+        counts = get_all_variant_counts(db)
+    finally:
+        db.close()
+
+    updated = stats.reconcile(counts, min_interval=0.0 if force else interval)
+    if updated:
+        logger.info("Reconciled shared arm stats for %s variants", len(counts))
+    return updated
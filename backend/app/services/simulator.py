@@ -0,0 +1,359 @@
+"""
+Offline bandit simulator for tuning variant selection.
+Runs thousands of independent simulated intents in lockstep with NumPy and
+reports regret, convergence time and n8n generation count per policy, so
+changes to ab_exploration_threshold / ab_exploration_rate (or the policy
+itself) can be evaluated without production traffic.
+
+Each simulated intent has a pool of candidate messages with true CTRs. A
+policy either picks an existing variant or asks for a new one, which (like
+an n8n generation) reveals the next message from the pool. Pools come from
+a synthetic Beta prior or are bootstrapped from historical per-variant CTRs
+in the metrics table.
+"""
+
+import logging
+from typing import Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from ..config import get_settings
+from .variant_logic import get_arm_counts
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Chosen-arm value meaning "generate a new variant"
+GENERATE = -1
+
+# Messages per simulated pool. Above the ~245 generations an intent makes in
+# 2000 steps with the default settings; generations past the cap reuse the
+# best arm and are reported as capped. Larger pools cost memory and per-step
+# work in proportion and raise the oracle (the best message in the pool),
+# so don't tie this to the horizon.
+DEFAULT_MAX_ARMS = 256
+
+
+class Scenario:
+    """
+    Source of true CTRs for simulated intents.
+
+    Args:
+        ctrs: Observed CTRs to bootstrap pools from, or None for a synthetic prior
+        prior: (alpha, beta) of the synthetic Beta CTR prior
+        change_point: Step at which every message's CTR is redrawn (non-stationarity), or None
+    """
+
+    def __init__(
+        self,
+        ctrs: Optional[np.ndarray] = None,
+        prior: tuple[float, float] = (2.0, 40.0),
+        change_point: Optional[int] = None
+    ):
+        self.ctrs = ctrs
+        self.prior = prior
+        self.change_point = change_point
+
+    def draw(self, rng: np.random.Generator, trials: int, max_arms: int) -> np.ndarray:
+        """Draw a (trials, max_arms) pool of true CTRs, in generation order."""
+        if self.ctrs is not None and len(self.ctrs):
+            return rng.choice(self.ctrs, size=(trials, max_arms))
+        return rng.beta(*self.prior, size=(trials, max_arms))
+
+    def describe(self) -> str:
+        source = (
+            f"bootstrap of {len(self.ctrs)} historical CTRs (mean {self.ctrs.mean():.2%})"
+            if self.ctrs is not None else f"Beta{self.prior} CTRs (mean {self.prior[0] / sum(self.prior):.2%})"
+        )
+        if self.change_point is not None:
+            source += f", CTRs redrawn at step {self.change_point}"
+        return source
+
+
+def historical_scenario(db: Session, min_sent: int = 100, change_point: Optional[int] = None) -> Scenario:
+    """
+    Build a scenario from per-variant CTRs observed in the metrics table
+    (all tenants).
+
+    Args:
+        db: Database session
+        min_sent: Ignore variants with fewer sends (their CTR is mostly noise)
+        change_point: Optional step at which CTRs are redrawn
+
+    Returns:
+        Scenario bootstrapping from historical CTRs
+
+    Raises:
+        ValueError: If no variant has at least min_sent sends
+    """
+    ctrs = [
+        clicked / sent
+        for _, _, _, _, sent, clicked in get_arm_counts(db)
+        if sent >= min_sent
+    ]
+    if not ctrs:
+        raise ValueError(f"No variants with at least {min_sent} sends to build a scenario from")
+    return Scenario(ctrs=np.asarray(ctrs, dtype=float), change_point=change_point)
+
+
+class Policy:
+    """
+    Vectorized selection policy over `trials` simulated intents.
+
+    Mirrors the production generation rule: generate while the intent has
+    fewer than `threshold` sends in total, and with probability `explore_rate`
+    afterwards; otherwise pick an arm with `choose_arm`.
+    """
+
+    name = "policy"
+
+    def __init__(self, threshold: Optional[int] = None, explore_rate: Optional[float] = None):
+        self.threshold = settings.ab_exploration_threshold if threshold is None else threshold
+        self.explore_rate = settings.ab_exploration_rate if explore_rate is None else explore_rate
+
+    def reset(self, trials: int, max_arms: int) -> None:
+        """Reset per-run state."""
+
+    def choose_arm(self, sent: np.ndarray, clicked: np.ndarray, active: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Pick an existing arm per trial.
+
+        Arrays are (trials, width) views covering only the arms generated so
+        far in any trial; active marks the arms that exist in each trial.
+        """
+        raise NotImplementedError
+
+    def observe(self, rows: np.ndarray, arms: np.ndarray, clicks: np.ndarray) -> None:
+        """Update per-run state after each trial's notification."""
+
+    def select(self, sent: np.ndarray, clicked: np.ndarray, active: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Decide for every trial: an arm index, or GENERATE.
+
+        Returns:
+            (trials,) int array
+        """
+        trials = sent.shape[0]
+        arms = self.choose_arm(sent, clicked, active, rng)
+        generate = (
+            (~active.any(axis=1))
+            | (sent.sum(axis=1) < self.threshold)
+            | (rng.random(trials) < self.explore_rate)
+        )
+        return np.where(generate, GENERATE, arms)
+
+    def params(self) -> dict:
+        """Parameters shown in reports."""
+        return {"threshold": self.threshold, "explore_rate": self.explore_rate}
+
+    def describe(self) -> str:
+        return f"{self.name}({', '.join(f'{k}={v:g}' for k, v in self.params().items())})"
+
+
+def _masked_argmax(scores: np.ndarray, active: np.ndarray) -> np.ndarray:
+    return np.where(active, scores, -np.inf).argmax(axis=1)
+
+
+class ThompsonPolicy(Policy):
+    """The production policy: thompson_sample_variant with Beta(clicked + 1, failures + 1)."""
+
+    name = "thompson"
+
+    def choose_arm(self, sent, clicked, active, rng):
+        samples = rng.beta(clicked + 1, sent - clicked + 1)
+        return _masked_argmax(samples, active)
+
+
+class DiscountedThompsonPolicy(Policy):
+    """
+    Thompson Sampling on exponentially discounted counts.
+
+    Older events weigh gamma^age, so the posterior tracks CTRs that drift
+    (e.g. message fatigue) at the cost of never becoming fully certain.
+    """
+
+    name = "discounted_thompson"
+
+    def __init__(self, gamma: float = 0.999, **kwargs):
+        super().__init__(**kwargs)
+        self.gamma = gamma
+
+    def reset(self, trials, max_arms):
+        self.successes = np.zeros((trials, max_arms))
+        self.failures = np.zeros((trials, max_arms))
+
+    def choose_arm(self, sent, clicked, active, rng):
+        width = active.shape[1]
+        samples = rng.beta(self.successes[:, :width] + 1, self.failures[:, :width] + 1)
+        return _masked_argmax(samples, active)
+
+    def observe(self, rows, arms, clicks):
+        self.successes *= self.gamma
+        self.failures *= self.gamma
+        self.successes[rows, arms] += clicks
+        self.failures[rows, arms] += ~clicks
+
+    def params(self):
+        return {**super().params(), "gamma": self.gamma}
+
+
+class UCBPolicy(Policy):
+    """UCB1: empirical CTR plus an exploration bonus c * sqrt(ln N / n)."""
+
+    name = "ucb"
+
+    def __init__(self, c: float = 2 ** 0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.c = c
+
+    def choose_arm(self, sent, clicked, active, rng):
+        total = np.maximum(sent.sum(axis=1, keepdims=True), 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = clicked / sent + self.c * np.sqrt(np.log(total) / sent)
+        scores = np.where(sent == 0, np.inf, scores)
+        return _masked_argmax(scores, active)
+
+    def params(self):
+        return {**super().params(), "c": self.c}
+
+
+POLICIES = {
+    "thompson": ThompsonPolicy,
+    "discounted_thompson": DiscountedThompsonPolicy,
+    "ucb": UCBPolicy,
+}
+
+
+def simulate(
+    policy: Policy,
+    scenario: Scenario,
+    trials: int = 2000,
+    horizon: int = 2000,
+    max_arms: int = DEFAULT_MAX_ARMS,
+    convergence_window: int = 100,
+    convergence_share: float = 0.5,
+    seed: Optional[int] = None
+) -> dict:
+    """
+    Run a policy on `trials` independent simulated intents for `horizon` notifications each.
+
+    Regret is measured against always sending the best message in the
+    intent's pool, so it charges both over-exploring (generating and trying
+    weak messages) and under-exploring (never finding the best one).
+    Convergence time is the first step from which the best message
+    discovered by the end gets at least convergence_share of the
+    non-generation sends in the next convergence_window steps (counted from
+    the change point, if any).
+
+    Args:
+        policy: Policy to evaluate
+        scenario: Source of true CTRs
+        trials: Simulated intents, run in parallel
+        horizon: Notifications per intent
+        max_arms: Messages per pool; generations beyond this reuse the best arm
+        convergence_window: Window (sends) for the convergence criterion
+        convergence_share: Share of the window the best arm must get
+        seed: RNG seed
+
+    Returns:
+        Dict with mean/percentile regret, convergence time, generations and CTR
+    """
+    rng = np.random.default_rng(seed)
+    pool = scenario.draw(rng, trials, max_arms)
+    oracle = pool.max(axis=1)
+    rows = np.arange(trials)
+
+    sent = np.zeros((trials, max_arms), dtype=np.int64)
+    clicked = np.zeros((trials, max_arms), dtype=np.int64)
+    n_arms = np.zeros(trials, dtype=np.int64)
+    generations = np.zeros(trials, dtype=np.int64)
+    capped = np.zeros(trials, dtype=np.int64)
+    regret = np.zeros(trials)
+    total_clicks = np.zeros(trials, dtype=np.int64)
+    history = np.empty((trials, horizon), dtype=np.int32)
+    generated = np.empty((trials, horizon), dtype=bool)
+    arm_index = np.arange(max_arms)
+    policy.reset(trials, max_arms)
+
+    for step in range(horizon):
+        if step == scenario.change_point:
+            pool = scenario.draw(rng, trials, max_arms)
+            oracle = pool.max(axis=1)
+
+        # Only pass the columns of arms that exist in some trial
+        width = max(1, int(n_arms.max()))
+        active = arm_index[:width] < n_arms[:, None]
+        choice = policy.select(sent[:, :width], clicked[:, :width], active, rng)
+
+        generate = choice == GENERATE
+        generations += generate
+        can_generate = generate & (n_arms < max_arms)
+        exhausted = generate & ~can_generate
+        capped += exhausted
+        arms = np.where(can_generate, n_arms, choice)
+        if exhausted.any():
+            # Pool used up: send the empirically best variant instead
+            best = _masked_argmax((clicked[:, :width] + 1) / (sent[:, :width] + 2), active)
+            arms = np.where(exhausted, best, arms)
+        n_arms += can_generate
+
+        ctr = pool[rows, arms]
+        clicks = rng.random(trials) < ctr
+        sent[rows, arms] += 1
+        clicked[rows, arms] += clicks
+        total_clicks += clicks
+        regret += oracle - ctr
+        history[:, step] = arms
+        generated[:, step] = generate
+        policy.observe(rows, arms, clicks)
+
+    # Best message each intent discovered, and when it started getting most
+    # of the sends that weren't generations
+    discovered = arm_index < n_arms[:, None]
+    best_found = _masked_argmax(pool, discovered)
+    begin = scenario.change_point or 0
+    exploit = ~generated[:, begin:]
+    plays = (history[:, begin:] == best_found[:, None]) & exploit
+    window = min(convergence_window, plays.shape[1])
+
+    def windowed(counts: np.ndarray) -> np.ndarray:
+        cumulative = np.concatenate([np.zeros((trials, 1)), counts.cumsum(axis=1)], axis=1)
+        return cumulative[:, window:] - cumulative[:, :-window]
+
+    share = windowed(plays) / np.maximum(windowed(exploit), 1)
+    converged = share >= convergence_share
+    convergence = np.where(converged.any(axis=1), converged.argmax(axis=1), np.nan)
+
+    return {
+        "policy": policy.describe(),
+        "trials": trials,
+        "horizon": horizon,
+        "regret_mean": float(regret.mean()),
+        "regret_p50": float(np.percentile(regret, 50)),
+        "regret_p95": float(np.percentile(regret, 95)),
+        "ctr_mean": float(total_clicks.mean() / horizon),
+        "ctr_oracle": float(oracle.mean()),
+        "converged_share": float(converged.any(axis=1).mean()),
+        "convergence_p50": float(np.nanmedian(convergence)) if converged.any() else float("nan"),
+        "generations_mean": float(generations.mean()),
+        "generations_capped": int(capped.sum()),
+    }
+
+
+def compare_policies(policies: list[Policy], scenario: Scenario, **kwargs) -> list[dict]:
+    """
+    Simulate several policies on the same scenario and seed.
+
+    Args:
+        policies: Policies to evaluate
+        scenario: Source of true CTRs
+        **kwargs: Passed to simulate (trials, horizon, seed, ...)
+
+    Returns:
+        One result dict per policy, in order
+    """
+    results = []
+    for policy in policies:
+        result = simulate(policy, scenario, **kwargs)
+        logger.info("Simulated %s: mean regret %.1f", result['policy'], result['regret_mean'])
+        results.append(result)
+    return results
@@ -0,0 +1,171 @@
+"""
+Compact arm snapshots for SDK-side variant selection.
+A snapshot lists an intent's active arms with their Beta posterior
+parameters so high-volume senders can Thompson-sample locally and only
+refresh when the snapshot's ETag changes.
+"""
+
+import hashlib
+import logging
+import threading
+from typing import Optional
+import orjson
+from sqlalchemy.orm import Session
+from ..config import get_settings
+from ..models import DEFAULT_TENANT
+from .cache import TTLCache
+from .invalidation import invalidation_bus, VARIANT
+from .shared_stats import get_shared_arm_stats
+from .variant_logic import get_candidate_variants
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class ArmSnapshot:
+    """
+    Snapshot of one (intent_id, locale) arm set.
+
+    Arms are kept as [variant_id, message, alpha, beta] lists and patched in
+    place as events are recorded; the serialized body and ETag are rebuilt
+    lazily on the next read.
+    """
+
+    def __init__(self, intent_id: str, locale: str, matched_locale: Optional[str], arms: list[list]):
+        self.intent_id = intent_id
+        self.locale = locale
+        self.matched_locale = matched_locale
+        self.arms = arms
+        self._index = {arm[0]: arm for arm in arms}
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def apply_event(self, variant_id: str, event_type: str) -> None:
+        """Update one arm's posterior for a recorded event."""
+        arm = self._index.get(variant_id)
+        if arm is None:
+            return
+        with self._lock:
+            if event_type == "clicked":
+                # A click follows its send: move one failure to a success
+                arm[2] += 1
+                arm[3] = max(1, arm[3] - 1)
+            elif event_type == "sent":
+                arm[3] += 1
+            self._body = None
+
+    def render(self) -> tuple[bytes, str]:
+        """
+        Serialize the snapshot.
+
+        Returns:
+            Tuple of (JSON body, ETag)
+        """
+        with self._lock:
+            if self._body is None:
+                arms = [list(arm) for arm in self.arms]
+                self._etag = hashlib.sha1(orjson.dumps([self.matched_locale, arms])).hexdigest()[:16]
+                self._body = orjson.dumps({
+                    "v": SNAPSHOT_FORMAT_VERSION,
+                    "intent_id": self.intent_id,
+                    "locale": self.matched_locale or self.locale,
+                    "etag": self._etag,
+                    "ttl": settings.snapshot_ttl,
+                    # SDKs should call /v1/resolve instead of sampling locally
+                    # while the arms have fewer sends than min_samples, and
+                    # with probability explore_rate otherwise.
+                    "min_samples": settings.ab_exploration_threshold,
+                    "explore_rate": settings.ab_exploration_rate,
+                    "arms": arms,
+                })
+            return self._body, self._etag
+
+
+class SnapshotStore:
+    """Per-worker cache of ArmSnapshots keyed by (tenant_id, intent_id, requested locale)."""
+
+    def __init__(self):
+        # variant_id -> snapshot keys; entries leave it with their snapshot
+        self._keys_by_variant: dict[str, set[tuple[str, str, str]]] = {}
+        self._lock = threading.RLock()
+        self._cache = TTLCache(
+            max_size=settings.resolve_cache_max_entries, ttl=settings.snapshot_ttl, on_evict=self._unindex
+        )
+
+    def get(self, db: Session, intent_id: str, locale: str, tenant_id: str = DEFAULT_TENANT) -> ArmSnapshot:
+        """
+        Get the snapshot for an intent and locale, building it on a miss.
+
+        Args:
+            db: Database session
+            intent_id: Intent identifier
+            locale: Requested locale (the locale fallback chain applies)
+            tenant_id: Tenant owning the intent
+
+        Returns:
+            ArmSnapshot
+        """
+        key = (tenant_id, intent_id, locale)
+        snapshot = self._cache.get(key)
+        if snapshot is not None:
+            return snapshot
+
+        matched_locale, variants = get_candidate_variants(db, intent_id, locale, tenant_id=tenant_id)
+        shared_stats = get_shared_arm_stats()
+        if shared_stats is not None:
+            variants = shared_stats.overlay(variants)
+
+        arms = [
+            [v["variant_id"], v["message"], v["clicked"] + 1, v["sent"] - v["clicked"] + 1]
+            for v in variants
+        ]
+        snapshot = ArmSnapshot(intent_id, locale, matched_locale, arms)
+        self._cache.set(key, snapshot)
+
+        with self._lock:
+            # Skip a snapshot evicted in the meantime (its callback already ran)
+            if self._cache.get(key) is snapshot:
+                for arm in arms:
+                    self._keys_by_variant.setdefault(arm[0], set()).add(key)
+        return snapshot
+
+    def _unindex(self, key: tuple[str, str, str], snapshot: ArmSnapshot) -> None:
+        """Drop a snapshot that left the cache from the variant index."""
+        with self._lock:
+            for arm in snapshot.arms:
+                keys = self._keys_by_variant.get(arm[0])
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._keys_by_variant[arm[0]]
+
+    def apply_event(self, variant_id: str, event_type: str) -> None:
+        """
+        Incrementally update cached snapshots containing a variant.
+
+        Args:
+            variant_id: Variant the event was recorded for
+            event_type: 'sent' or 'clicked'
+        """
+        with self._lock:
+            keys = list(self._keys_by_variant.get(variant_id, ()))
+        for key in keys:
+            snapshot = self._cache.get(key)
+            if snapshot is not None:
+                snapshot.apply_event(variant_id, event_type)
+
+    def invalidate_intent(self, intent_id: str) -> None:
+        """Drop snapshots for an intent whose arm set changed, in every tenant ("" drops everything)."""
+        if not intent_id:
+            self._cache.clear()
+            return
+        for key in self._cache.keys():
+            if key[1] == intent_id:
+                self._cache.delete(key)
+
+
+snapshot_store = SnapshotStore()
+invalidation_bus.subscribe(VARIANT, snapshot_store.invalidate_intent)
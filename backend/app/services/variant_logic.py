@@ -4,49 +4,151 @@ Handles storage of new variants and retrieval of existing ones.
 """
 
 import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from uuid import UUID
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..models import Variant, Metric
+from sqlalchemy import func, case, and_
+from ..models import Variant, Metric, VariantSegmentStats, DEFAULT_TENANT
+from ..config import get_settings
+from .cache import TTLCache
+from .invalidation import invalidation_bus, VARIANT, STATS
+from .locale_fallback import get_locale_chain
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
+# variant_id -> candidate_cache keys, so stats invalidations (which only carry
+# a variant_id) can find the entries to drop. Keys leave it when their cache
+# entry does, so it never outgrows the cache.
+_cache_keys_by_variant: dict[str, set[tuple]] = {}
+_cache_keys_lock = threading.RLock()
 
-def find_duplicate_variant(
+
+def _index_candidates(key: tuple, variants: list[dict]) -> None:
+    """Record that a candidate_cache entry contains these variants."""
+    with _cache_keys_lock:
+        # Another thread may have evicted the entry since it was set; its
+        # eviction callback has already run, so indexing it now would leak
+        if candidate_cache.get(key) is not variants:
+            return
+        for variant in variants:
+            _cache_keys_by_variant.setdefault(variant["variant_id"], set()).add(key)
+
+
+def _unindex_candidates(key: tuple, variants: list[dict]) -> None:
+    """Drop a candidate_cache entry that left the cache from the variant index."""
+    with _cache_keys_lock:
+        for variant in variants:
+            keys = _cache_keys_by_variant.get(variant["variant_id"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del _cache_keys_by_variant[variant["variant_id"]]
+
+
+# Resolve-path cache of candidate variants with counts, keyed by
+# (tenant_id, intent_id, exact locale), or (tenant_id, intent_id, exact
+# locale, segment) for segmented requests. Empty lists are cached too, so
+# fallback chains don't re-query locales that have no variants.
+candidate_cache = TTLCache(
+    max_size=settings.resolve_cache_max_entries, ttl=settings.resolve_cache_ttl, on_evict=_unindex_candidates
+)
+
+# variant_id -> tenant_id. A variant never changes tenant, so entries only
+# expire to bound memory; filled whenever candidates are loaded.
+variant_tenants = TTLCache(max_size=100_000, ttl=3600.0)
+
+
+def _invalidate_intent(intent_id: str) -> None:
+    """Drop cached candidates for every locale of an intent, in every tenant ("" drops everything)."""
+    if not intent_id:
+        candidate_cache.clear()
+        return
+    for key in candidate_cache.keys():
+        if key[1] == intent_id:
+            candidate_cache.delete(key)
+
+
+def _invalidate_variant_stats(variant_id: str) -> None:
+    """Drop the cached candidates containing a variant whose counts changed."""
+    if not variant_id:
+        _invalidate_intent("")
+        return
+    with _cache_keys_lock:
+        keys = _cache_keys_by_variant.pop(variant_id, ())
+    for key in keys:
+        candidate_cache.delete(key)
+
+
+invalidation_bus.subscribe(VARIANT, _invalidate_intent)
+invalidation_bus.subscribe(STATS, _invalidate_variant_stats)
+
+
+def normalize_message(message: str) -> str:
+    """Normalize message text for duplicate comparison (strip whitespace, lowercase)."""
+    return message.strip().lower()
+
+
+def load_existing_messages(
     db: Session,
     intent_id: str,
-    message: str,
-    locale: str = "en-US"
-) -> Optional[Variant]:
+    locale: str = "en-US",
+    tenant_id: str = DEFAULT_TENANT
+) -> dict[str, Variant]:
     """
-    Check if a variant with the same message already exists for this intent.
+    Load all variants for an intent and locale keyed by normalized message.
+
+    Lets callers check many candidate messages for duplicates with one query.
 
     Args:
         db: Database session
         intent_id: Intent identifier
-        message: Message text to check
         locale: Message locale
+        tenant_id: Tenant owning the intent
 
     Returns:
-        Existing Variant instance if duplicate found, None otherwise
+        Dict mapping normalized message to its Variant
     """
-    # Normalize message for comparison (strip whitespace, lowercase)
-    normalized_message = message.strip().lower()
-
-    # Query all variants for this intent and locale
     variants = db.query(Variant).filter(
+        Variant.tenant_id == tenant_id,
         Variant.intent_id == intent_id,
         Variant.locale == locale
     ).all()
 
-    # Check for exact match (case-insensitive, whitespace-normalized)
+    existing: dict[str, Variant] = {}
     for variant in variants:
-        if variant.message.strip().lower() == normalized_message:
-            logger.info(f"Found duplicate variant {variant.id} for intent {intent_id}")
-            return variant
+        existing.setdefault(normalize_message(variant.message), variant)
+    return existing
 
-    return None
+
+def find_duplicate_variant(
+    db: Session,
+    intent_id: str,
+    message: str,
+    locale: str = "en-US",
+    tenant_id: str = DEFAULT_TENANT
+) -> Optional[Variant]:
+    """
+    Check if a variant with the same message already exists for this intent.
+
+    Args:
+        db: Database session
+        intent_id: Intent identifier
+        message: Message text to check
+        locale: Message locale
+        tenant_id: Tenant owning the intent
+
+    Returns:
+        Existing Variant instance if duplicate found, None otherwise
+    """
+    # Check for exact match (case-insensitive, whitespace-normalized)
+    variant = load_existing_messages(db, intent_id, locale, tenant_id).get(normalize_message(message))
+    if variant:
+        logger.info("Found duplicate variant %s for intent %s", variant.id, intent_id)
+    return variant
 
 
 def store_variant(
@@ -54,7 +156,8 @@ def store_variant(
     intent_id: str,
     message: str,
     locale: str = "en-US",
-    check_duplicates: bool = True
+    check_duplicates: bool = True,
+    tenant_id: str = DEFAULT_TENANT
 ) -> Variant:
     """
     Store a new variant in the database.
@@ -65,28 +168,32 @@ def store_variant(
         message: AI-generated message text
         locale: Message locale
         check_duplicates: If True, check for duplicates before storing
+        tenant_id: Tenant owning the intent
 
     Returns:
         Created Variant instance (or existing if duplicate found)
     """
     # Check for duplicates if enabled
     if check_duplicates:
-        existing = find_duplicate_variant(db, intent_id, message, locale)
+        existing = find_duplicate_variant(db, intent_id, message, locale, tenant_id)
         if existing:
-            logger.info(f"Reusing existing variant {existing.id} (duplicate message)")
+            logger.info("Reusing existing variant %s (duplicate message)", existing.id)
             return existing
 
     # Create new variant
     variant = Variant(
+        tenant_id=tenant_id,
         intent_id=intent_id,
         message=message,
         locale=locale
     )
     db.add(variant)
+    invalidation_bus.publish(db, VARIANT, intent_id)
     db.commit()
     db.refresh(variant)
+    variant_tenants.set(str(variant.id), tenant_id)
 
-    logger.info(f"Stored new variant {variant.id} for intent {intent_id}")
+    logger.info("Stored new variant %s for intent %s", variant.id, intent_id)
     return variant
 
 
@@ -104,66 +211,375 @@ def get_variant_by_id(db: Session, variant_id: UUID) -> Optional[Variant]:
     return db.query(Variant).filter(Variant.id == variant_id).first()
 
 
-def get_variants_with_metrics(db: Session, intent_id: str) -> list[dict]:
+def get_variant_tenants(db: Session, variant_ids: set[UUID]) -> dict[UUID, str]:
+    """
+    Look up which tenant each variant belongs to.
+
+    Served from variant_tenants where possible, with one query for the rest.
+
+    Args:
+        db: Database session
+        variant_ids: Variant UUIDs
+
+    Returns:
+        Dict mapping variant_id to tenant_id; variants that don't exist are omitted
+    """
+    tenants: dict[UUID, str] = {}
+    missing = []
+    for variant_id in variant_ids:
+        tenant_id = variant_tenants.get(str(variant_id))
+        if tenant_id is None:
+            missing.append(variant_id)
+        else:
+            tenants[variant_id] = tenant_id
+
+    if missing:
+        for variant_id, tenant_id in db.query(Variant.id, Variant.tenant_id).filter(Variant.id.in_(missing)):
+            variant_tenants.set(str(variant_id), tenant_id)
+            tenants[variant_id] = tenant_id
+    return tenants
+
+
+def _variants_with_counts_query(db: Session, segment: Optional[str] = None):
+    """
+    Build a query returning each variant with its sent/clicked counts.
+
+    Counts are aggregated in a single LEFT JOIN + GROUP BY instead of
+    issuing two COUNT queries per variant. With a segment, the variant's
+    counters for that segment are joined in by primary key as well, so
+    segmented requests still take one query.
+
+    Args:
+        db: Database session
+        segment: Also return counts for this segment
+
+    Returns:
+        Query yielding (Variant, sent, clicked) rows, or
+        (Variant, sent, clicked, segment_sent, segment_clicked) with a segment
+    """
+    sent = func.coalesce(func.sum(case((Metric.event_type == "sent", 1), else_=0)), 0)
+    clicked = func.coalesce(func.sum(case((Metric.event_type == "clicked", 1), else_=0)), 0)
+
+    query = (
+        db.query(Variant, sent.label("sent"), clicked.label("clicked"))
+        .outerjoin(Metric, Metric.variant_id == Variant.id)
+        .group_by(Variant.id)
+    )
+    if segment is not None:
+        # At most one counter row per variant, so max() just carries it through the GROUP BY
+        query = query.outerjoin(
+            VariantSegmentStats,
+            and_(VariantSegmentStats.variant_id == Variant.id, VariantSegmentStats.segment == segment)
+        ).add_columns(
+            func.coalesce(func.max(VariantSegmentStats.sent), 0),
+            func.coalesce(func.max(VariantSegmentStats.clicked), 0)
+        )
+    return query
+
+
+def _variant_row_to_dict(
+    variant: Variant,
+    sent: int,
+    clicked: int,
+    segment_sent: Optional[int] = None,
+    segment_clicked: Optional[int] = None
+) -> dict:
+    """Convert an aggregated row from _variants_with_counts_query to the variant dict format."""
+    result = {
+        "variant_id": str(variant.id),
+        "message": variant.message,
+        "sent": int(sent),
+        "clicked": int(clicked)
+    }
+    if segment_sent is not None:
+        result["segment_sent"] = int(segment_sent)
+        result["segment_clicked"] = int(segment_clicked)
+    return result
+
+
+def get_variants_with_metrics(
+    db: Session,
+    intent_id: str,
+    locale: Optional[str] = None,
+    tenant_id: str = DEFAULT_TENANT
+) -> list[dict]:
     """
     Get all variants for an intent with aggregated metrics.
     
     Args:
         db: Database session
         intent_id: Intent identifier
+        locale: If given, only variants stored for this exact locale
+        tenant_id: Tenant owning the intent
         
     Returns:
         List of dicts with variant info and metrics counts
     """
-    # Query variants
-    variants = db.query(Variant).filter(Variant.intent_id == intent_id).all()
-    
-    result = []
-    for variant in variants:
-        # Count metrics for each event type
-        sent = db.query(Metric).filter(
-            Metric.variant_id == variant.id,
-            Metric.event_type == "sent"
-        ).count()
-        
-        clicked = db.query(Metric).filter(
-            Metric.variant_id == variant.id,
-            Metric.event_type == "clicked"
-        ).count()
-        
-        result.append({
-            "variant_id": str(variant.id),
-            "message": variant.message,
-            "sent": sent,
-            "clicked": clicked
-        })
-    
-    return result
+    query = _variants_with_counts_query(db).filter(
+        Variant.tenant_id == tenant_id,
+        Variant.intent_id == intent_id
+    )
+    if locale is not None:
+        query = query.filter(Variant.locale == locale)
+
+    return [_variant_row_to_dict(*row) for row in query.all()]
+
+
+def get_candidate_variants(
+    db: Session,
+    intent_id: str,
+    locale: str,
+    segment: Optional[str] = None,
+    tenant_id: str = DEFAULT_TENANT
+) -> tuple[Optional[str], list[dict]]:
+    """
+    Get the variants Thompson Sampling should choose between for a request.
+
+    Walks the locale fallback chain (e.g. pt-BR -> pt -> en-US) and returns the
+    variants of the most specific locale that has any. All chain locales are
+    fetched in one query served by the (tenant_id, intent_id, locale) index, so
+    variants of unrelated locales or other tenants are never loaded or
+    sampled. Results are cached per (tenant_id, intent_id, locale[, segment])
+    and invalidated across workers via the invalidation bus. The returned
+    dicts are shared with the cache and must not be mutated.
+
+    Args:
+        db: Database session
+        intent_id: Intent identifier
+        locale: Requested locale
+        segment: Also load each variant's counts for this segment
+            (as segment_sent / segment_clicked)
+        tenant_id: Tenant owning the intent
+
+    Returns:
+        Tuple of (matched_locale, variants). matched_locale is None and
+        variants is empty when no locale in the chain has variants.
+    """
+    chain = get_locale_chain(locale)
+
+    def cache_key(candidate_locale: str) -> tuple:
+        if segment is None:
+            return (tenant_id, intent_id, candidate_locale)
+        return (tenant_id, intent_id, candidate_locale, segment)
+
+    by_locale: dict[str, list[dict]] = {}
+    missing = list(chain)
+    if settings.resolve_cache_enabled:
+        missing = []
+        for candidate_locale in chain:
+            cached = candidate_cache.get(cache_key(candidate_locale))
+            if cached is None:
+                missing.append(candidate_locale)
+            else:
+                by_locale[candidate_locale] = cached
+
+    if missing:
+        rows = _variants_with_counts_query(db, segment).filter(
+            Variant.tenant_id == tenant_id,
+            Variant.intent_id == intent_id,
+            Variant.locale.in_(missing)
+        ).all()
+
+        for candidate_locale in missing:
+            by_locale[candidate_locale] = []
+        for variant, *counts in rows:
+            by_locale[variant.locale].append(_variant_row_to_dict(variant, *counts))
+            variant_tenants.set(str(variant.id), tenant_id)
+
+        if settings.resolve_cache_enabled:
+            for candidate_locale in missing:
+                key = cache_key(candidate_locale)
+                candidate_cache.set(key, by_locale[candidate_locale])
+                _index_candidates(key, by_locale[candidate_locale])
+
+    for candidate_locale in chain:
+        if by_locale.get(candidate_locale):
+            return candidate_locale, by_locale[candidate_locale]
+
+    return None, []
+
+
+def warm_candidate_cache(db: Session, top_intents: int, lookback_hours: float) -> dict:
+    """
+    Preload the resolve cache with the variants of the most active intents.
+
+    Intents (across all tenants) are ranked by metric events within the
+    lookback window, and all their variants with counts are loaded in a
+    single query. Every locale in the fallback chains of those variants is
+    cached, with empty lists for locales an intent has no variants in, so the
+    first resolves after a deploy don't touch the database.
+
+    Args:
+        db: Database session
+        top_intents: Number of intents to preload
+        lookback_hours: Traffic window used to rank intents
+
+    Returns:
+        Dict with the number of preloaded intents, variants, cache entries
+        and the duration in milliseconds
+    """
+    started = time.monotonic()
+    since = datetime.now(timezone.utc) - timedelta(hours=lookback_hours)
+
+    hottest = (
+        db.query(Variant.tenant_id, Variant.intent_id)
+        .join(Metric, Metric.variant_id == Variant.id)
+        .filter(Metric.timestamp >= since)
+        .group_by(Variant.tenant_id, Variant.intent_id)
+        .order_by(func.count().desc())
+        .limit(top_intents)
+        .subquery()
+    )
+    rows = _variants_with_counts_query(db).join(
+        hottest, and_(hottest.c.tenant_id == Variant.tenant_id, hottest.c.intent_id == Variant.intent_id)
+    ).all()
 
+    by_intent: dict[tuple[str, str], dict[str, list[dict]]] = {}
+    for variant, sent, clicked in rows:
+        by_intent.setdefault((variant.tenant_id, variant.intent_id), {}).setdefault(variant.locale, []).append(
+            _variant_row_to_dict(variant, sent, clicked)
+        )
+        variant_tenants.set(str(variant.id), variant.tenant_id)
 
-def get_all_variants_grouped(db: Session) -> dict[str, list[dict]]:
+    entries = 0
+    for (tenant_id, intent_id), by_locale in by_intent.items():
+        locales = {chain_locale for locale in by_locale for chain_locale in get_locale_chain(locale)}
+        for locale in locales:
+            key = (tenant_id, intent_id, locale)
+            variants = by_locale.get(locale, [])
+            candidate_cache.set(key, variants)
+            _index_candidates(key, variants)
+            entries += 1
+
+    return {
+        "intents": len(by_intent),
+        "variants": len(rows),
+        "cache_entries": entries,
+        "duration_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+
+
+def get_all_variant_counts(db: Session) -> dict[str, tuple[int, int]]:
     """
-    Get all variants grouped by intent_id with aggregated metrics.
+    Get sent/clicked counts for every variant that has metrics.
+
+    Args:
+        db: Database session
+
+    Returns:
+        Dict mapping variant_id to (sent, clicked)
+    """
+    sent = func.coalesce(func.sum(case((Metric.event_type == "sent", 1), else_=0)), 0)
+    clicked = func.coalesce(func.sum(case((Metric.event_type == "clicked", 1), else_=0)), 0)
+
+    rows = db.query(Metric.variant_id, sent, clicked).group_by(Metric.variant_id).all()
+    return {str(variant_id): (int(s), int(c)) for variant_id, s, c in rows}
+
+
+def increment_segment_stats(db: Session, counts: dict[tuple[UUID, str], tuple[int, int]]) -> None:
+    """
+    Add to per-segment counters as part of the session's current transaction.
+
+    Uses a single INSERT ... ON CONFLICT DO UPDATE on Postgres and SQLite.
+
+    Args:
+        db: Database session (committed by the caller)
+        counts: (variant_id, segment) -> (sent, clicked) increments
+    """
+    if not counts:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for (variant_id, segment), (sent, clicked) in counts.items():
+            stats = db.get(VariantSegmentStats, (variant_id, segment))
+            if stats is None:
+                db.add(VariantSegmentStats(variant_id=variant_id, segment=segment, sent=sent, clicked=clicked))
+            else:
+                stats.sent += sent
+                stats.clicked += clicked
+        return
+
+    # Same row order in every transaction, so concurrent upserts can't deadlock
+    rows = sorted(counts.items(), key=lambda item: (str(item[0][0]), item[0][1]))
+    statement = insert(VariantSegmentStats).values([
+        {"variant_id": variant_id, "segment": segment, "sent": sent, "clicked": clicked}
+        for (variant_id, segment), (sent, clicked) in rows
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[VariantSegmentStats.variant_id, VariantSegmentStats.segment],
+        set_={
+            "sent": VariantSegmentStats.sent + statement.excluded.sent,
+            "clicked": VariantSegmentStats.clicked + statement.excluded.clicked,
+        }
+    ))
+
+
+def get_arm_counts(db: Session, intent_ids: Optional[list[str]] = None) -> list[tuple]:
+    """
+    Get sent/clicked counts for every variant, with its tenant, intent and locale.
+
+    Args:
+        db: Database session
+        intent_ids: Only variants of these intents, in any tenant (default: all)
+
+    Returns:
+        List of (variant_id, tenant_id, intent_id, locale, sent, clicked) tuples
+    """
+    sent = func.coalesce(func.sum(case((Metric.event_type == "sent", 1), else_=0)), 0)
+    clicked = func.coalesce(func.sum(case((Metric.event_type == "clicked", 1), else_=0)), 0)
+
+    query = (
+        db.query(Variant.id, Variant.tenant_id, Variant.intent_id, Variant.locale, sent, clicked)
+        .outerjoin(Metric, Metric.variant_id == Variant.id)
+        .group_by(Variant.id, Variant.tenant_id, Variant.intent_id, Variant.locale)
+    )
+    if intent_ids is not None:
+        query = query.filter(Variant.intent_id.in_(intent_ids))
+    return [
+        (str(variant_id), tenant_id, intent_id, locale, int(s), int(c))
+        for variant_id, tenant_id, intent_id, locale, s, c in query.all()
+    ]
+
+
+def get_all_variants_grouped(db: Session, tenant_id: str = DEFAULT_TENANT) -> dict[str, list[dict]]:
+    """
+    Get a tenant's variants grouped by intent_id with aggregated metrics.
+
+    Uses one aggregate query for all intents rather than one per intent,
+    reading only the tenant's slice of the (tenant_id, intent_id, locale) index.
     
     Args:
         db: Database session
+        tenant_id: Tenant whose variants to return
         
     Returns:
         Dict mapping intent_id to list of variant data with metrics
     """
-    # Get all unique intent_ids
-    intent_ids = db.query(Variant.intent_id).distinct().all()
-    
-    result = {}
-    for (intent_id,) in intent_ids:
-        variants_data = get_variants_with_metrics(db, intent_id)
-        if variants_data:
-            result[intent_id] = variants_data
+    rows = (
+        _variants_with_counts_query(db)
+        .filter(Variant.tenant_id == tenant_id)
+        .order_by(Variant.intent_id)
+        .all()
+    )
+
+    result: dict[str, list[dict]] = {}
+    for variant, sent, clicked in rows:
+        result.setdefault(variant.intent_id, []).append(_variant_row_to_dict(variant, sent, clicked))
     
     return result
 
 
-def get_best_variant(db: Session, intent_id: str, locale: str = "en-US") -> Optional[Variant]:
+def get_best_variant(
+    db: Session,
+    intent_id: str,
+    locale: str = "en-US",
+    tenant_id: str = DEFAULT_TENANT
+) -> Optional[Variant]:
     """
     Get the best-performing variant for an intent based on click-through rate.
     This is a simple implementation; can be enhanced with more sophisticated logic.
@@ -172,11 +588,13 @@ def get_best_variant(db: Session, intent_id: str, locale: str = "en-US") -> Opti
         db: Database session
         intent_id: Intent identifier
         locale: Preferred locale
+        tenant_id: Tenant owning the intent
         
     Returns:
         Best variant or None if no variants exist
     """
     variants = db.query(Variant).filter(
+        Variant.tenant_id == tenant_id,
         Variant.intent_id == intent_id,
         Variant.locale == locale
     ).all()
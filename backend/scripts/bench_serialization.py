@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of response serialization on the hot endpoints.
+Compares the previous path (Pydantic model + FastAPI's default JSON encoding)
+with the lean orjson / MessagePack paths now used by /v1/resolve,
+/v1/metrics, /v1/metrics/batch and /v1/variants.
+
+Usage: python scripts/bench_serialization.py [--number 20000]
+"""
+
+import argparse
+import json
+import sys
+import timeit
+import uuid
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+from app.schemas import ResolveResponse, MetricResponse, VariantSummary, MetricRequest, MetricBatchRequest
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _fastapi_default(model_or_content) -> bytes:
+    """What FastAPI does for a response_model route returning a model."""
+    return JSONResponse(jsonable_encoder(model_or_content)).body
+
+
+def build_cases() -> dict[str, tuple]:
+    """Build (before, after) callables for each payload."""
+    variant_id = str(uuid.uuid4())
+    message = "Still thinking it over? Your headphones are waiting for you 🎧"
+
+    variants_by_intent = {
+        f"intent_{i}": [
+            {"variant_id": str(uuid.uuid4()), "message": message, "sent": 1200 + j, "clicked": 40 + j}
+            for j in range(10)
+        ]
+        for i in range(200)
+    }
+
+    events = [
+        {"variant_id": variant_id, "event_type": "sent", "timestamp": "2025-02-15T12:01:12Z",
+         "event_id": str(uuid.uuid4())}
+        for _ in range(500)
+    ]
+    batch_json = json.dumps({"events": events}).encode()
+
+    cases = {
+        "resolve response": (
+            lambda: _fastapi_default(ResolveResponse(variant_id=variant_id, resolved_message=message)),
+            lambda: ORJSONResponse({"variant_id": variant_id, "resolved_message": message}).body,
+        ),
+        "metric ack": (
+            lambda: _fastapi_default(MetricResponse(status="ok")),
+            lambda: Response(content=b'{"status":"ok"}', media_type="application/json").body,
+        ),
+        "variants (200 intents x 10)": (
+            lambda: _fastapi_default({
+                k: [VariantSummary(**v) for v in vs] for k, vs in variants_by_intent.items()
+            }),
+            lambda: ORJSONResponse(variants_by_intent).body,
+        ),
+        "batch decode (500 events, JSON)": (
+            lambda: MetricBatchRequest(events=[MetricRequest(**e) for e in json.loads(batch_json)["events"]]),
+            lambda: MetricBatchRequest.model_validate(orjson.loads(batch_json)),
+        ),
+    }
+
+    if msgpack is not None:
+        batch_msgpack = msgpack.packb({"events": events})
+        cases["batch decode (500 events, old JSON -> MsgPack)"] = (
+            lambda: MetricBatchRequest(events=[MetricRequest(**e) for e in json.loads(batch_json)["events"]]),
+            lambda: MetricBatchRequest.model_validate(msgpack.unpackb(batch_msgpack)),
+        )
+
+    return cases
+
+
+def run(number: int) -> None:
+    """Time each case and print per-call latency and speedup."""
+    print(f"{'case':<42} {'before':>12} {'after':>12} {'speedup':>8}")
+    for name, (before, after) in build_cases().items():
+        # Large payloads get fewer iterations to keep the run short
+        n = number if "intents" not in name and "batch" not in name else max(1, number // 200)
+        before_us = min(timeit.repeat(before, number=n, repeat=3)) / n * 1e6
+        after_us = min(timeit.repeat(after, number=n, repeat=3)) / n * 1e6
+        print(f"{name:<42} {before_us:>10.1f}us {after_us:>10.1f}us {before_us / after_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000, help="Iterations for small payloads")
+    run(parser.parse_args().number)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: time from process launch to first served request.
+Starts uvicorn in a fresh process per run (as a scale-to-zero instance would),
+polls until the first request succeeds, and reports the median over runs.
+
+Usage: python scripts/bench_startup.py [--runs 5] [--path /v1/variants] [--create-schema]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import() -> float:
+    """Time `import app.main` in a fresh interpreter (seconds)."""
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=os.environ.copy(),
+        capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_first_request(path: str, env: dict, timeout: float) -> float:
+    """
+    Launch the server and time until `path` first answers with a non-5xx status.
+
+    Args:
+        path: Request path to poll
+        env: Environment for the server process
+        timeout: Give up after this many seconds
+
+    Returns:
+        Seconds from process launch to first response
+    """
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    url = f"http://127.0.0.1:{port}{path}"
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited: {proc.stderr.read().decode()[-2000:]}")
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read()
+                return time.perf_counter() - started
+            except urllib.error.HTTPError as e:
+                if e.code < 500:
+                    return time.perf_counter() - started
+                raise RuntimeError(f"{path} returned {e.code}")
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise TimeoutError(f"no response from {url} within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def run(runs: int, path: str, create_schema: bool, timeout: float) -> None:
+    """Run the benchmark and print median/min/max timings."""
+    env = os.environ.copy()
+    env["DB_CREATE_SCHEMA"] = "true" if create_schema else "false"
+
+    imports = [measure_import() for _ in range(runs)]
+    health = [measure_first_request("/health", env, timeout) for _ in range(runs)]
+    first = [measure_first_request(path, env, timeout) for _ in range(runs)]
+
+    print(f"DB_CREATE_SCHEMA={env['DB_CREATE_SCHEMA']}  runs={runs}")
+    print(f"{'measure':<28} {'median':>9} {'min':>9} {'max':>9}")
+    for name, samples in (
+        ("import app.main", imports),
+        ("first /health", health),
+        (f"first {path}", first),
+    ):
+        print(f"{name:<28} {statistics.median(samples) * 1000:>7.0f}ms "
+              f"{min(samples) * 1000:>7.0f}ms {max(samples) * 1000:>7.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="Server launches per measurement")
+    parser.add_argument("--path", default="/v1/variants", help="DB-backed path for the first real request")
+    parser.add_argument("--create-schema", action="store_true", help="Run create_all on startup (old behavior)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for each server")
+    args = parser.parse_args()
+    run(args.runs, args.path, args.create_schema, args.timeout)
@@ -10,15 +10,58 @@ from pathlib import Path
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from sqlalchemy import inspect
+
 from app.database import engine, Base
 from app.models import Variant, Metric, ApiKey
 
 
+def add_missing_columns():
+    """
+    Add nullable columns introduced after a table was first created.
+
+    create_all never alters existing tables, so new optional columns
+    (e.g. metrics.event_id) and NOT NULL columns with a server default
+    (e.g. tenant_id, which existing rows get as "default") are added here
+    with ALTER TABLE.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or (not column.nullable and column.server_default is None):
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                if column.server_default is not None:
+                    column_type += f" NOT NULL DEFAULT '{column.server_default.arg}'"
+                conn.exec_driver_sql(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                )
+                if column.unique:
+                    conn.exec_driver_sql(
+                        f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table.name}_{column.name} "
+                        f"ON {table.name} ({column.name})"
+                    )
+                print(f"  + {table.name}.{column.name}")
+
+
 def init_database():
     """Initialize database tables."""
     print("Creating database tables...")
     Base.metadata.create_all(bind=engine)
     print("✅ Database tables created successfully!")
+
+    add_missing_columns()
+
+    # create_all skips tables that already exist, so add any indexes
+    # introduced after those tables were first created.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    print("✅ Database indexes up to date!")
     
     print("\nCreated tables:")
     for table in Base.metadata.sorted_tables:
@@ -0,0 +1,52 @@
+"""Tests for API key login and tenant resolution."""
+
+import pytest
+from fastapi import HTTPException
+
+from app.models import ApiKey, DEFAULT_TENANT
+from app.routers import auth
+
+
+def test_login_returns_the_same_key_for_the_right_password(client):
+    credentials = {"email": "a@example.com", "password": "secret"}
+    first = client.post("/v1/auth/login", json=credentials)
+    second = client.post("/v1/auth/login", json=credentials)
+
+    assert first.status_code == 200
+    assert second.json()["api_key"] == first.json()["api_key"]
+
+
+def test_login_rejects_a_wrong_password(client):
+    client.post("/v1/auth/login", json={"email": "a@example.com", "password": "secret"})
+    response = client.post("/v1/auth/login", json={"email": "a@example.com", "password": "guess"})
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("email", [DEFAULT_TENANT, "not-an-email", "a@b", "two@at@example.com"])
+def test_login_requires_an_email(client, db, email):
+    response = client.post("/v1/auth/login", json={"email": email, "password": "secret"})
+    assert response.status_code == 400
+    assert db.query(ApiKey).count() == 0
+
+
+def test_reserved_tenant_keys_are_rejected(db, monkeypatch):
+    db.add(ApiKey(key="pbk_live_legacy", owner=DEFAULT_TENANT))
+    db.commit()
+    monkeypatch.setattr(auth.settings, "tenant_isolation", True)
+
+    with pytest.raises(HTTPException) as error:
+        auth.resolve_tenant("pbk_live_legacy", db)
+    assert error.value.status_code == 401
+
+
+def test_legacy_key_takes_the_first_password(client, db):
+    db.add(ApiKey(key="pbk_live_legacy", owner="legacy@example.com"))
+    db.commit()
+
+    first = client.post("/v1/auth/login", json={"email": "legacy@example.com", "password": "secret"})
+    assert first.json() == {"api_key": "pbk_live_legacy"}
+
+    db.expire_all()
+    assert db.query(ApiKey).filter(ApiKey.owner == "legacy@example.com").one().password_hash
+    response = client.post("/v1/auth/login", json={"email": "legacy@example.com", "password": "guess"})
+    assert response.status_code == 401
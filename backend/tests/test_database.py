@@ -0,0 +1,34 @@
+"""Tests for read replica routing."""
+
+from sqlalchemy import create_engine, select
+
+from app import database
+from app.models import Variant
+
+
+def _unreachable_replica(tmp_path):
+    # SQLite can't create a database in a missing directory: OperationalError on connect
+    return create_engine(f"sqlite:///{tmp_path}/missing/replica.db")
+
+
+def test_failed_replica_read_is_retried_on_primary(db, make_variant, tmp_path):
+    variant = make_variant()
+    session = database.ReplicaSessionLocal(bind=_unreachable_replica(tmp_path))
+    try:
+        assert session.scalars(select(Variant.id)).all() == [variant.id]
+        assert session.bind is database.get_engine()  # Later reads stay on the primary
+        assert session.query(Variant).count() == 1
+    finally:
+        session.close()
+
+
+def test_dashboard_survives_replica_failure(client, make_variant, tmp_path, monkeypatch):
+    make_variant(message="From primary")
+    replica = _unreachable_replica(tmp_path)
+    monkeypatch.setattr(database, "replica_usable", lambda: True)
+    monkeypatch.setattr(database, "get_replica_engine", lambda: replica)
+
+    response = client.get("/v1/variants/welcome")
+
+    assert response.status_code == 200
+    assert "From primary" in response.text
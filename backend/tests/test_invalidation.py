@@ -0,0 +1,153 @@
+"""
+Tests for cache invalidation.
+
+Local delivery runs on every backend; cross-worker delivery over
+LISTEN/NOTIFY only runs when TEST_DATABASE_URL points at Postgres.
+"""
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.services import variant_logic
+from app.services.cache import TTLCache
+from app.services.invalidation import InvalidationBus, invalidation_bus, VARIANT, STATS, ALL
+from app.services.snapshot import snapshot_store
+from app.services.variant_logic import candidate_cache, get_candidate_variants, store_variant
+
+settings = get_settings()
+
+
+@pytest.fixture
+def received():
+    """Keys of VARIANT invalidations delivered to this process."""
+    keys = []
+    invalidation_bus.subscribe(VARIANT, keys.append)
+    yield keys
+    invalidation_bus._handlers[VARIANT].remove(keys.append)
+
+
+def test_local_handlers_run_after_commit(db, received):
+    db.execute(text("SELECT 1"))
+    invalidation_bus.publish(db, VARIANT, "welcome")
+    assert received == []  # Nothing is delivered before the commit
+
+    db.commit()
+    assert received == ["welcome"]
+
+
+def test_rollback_discards_invalidations(db, received):
+    db.execute(text("SELECT 1"))
+    invalidation_bus.publish(db, VARIANT, "rolled-back")
+    db.rollback()
+
+    db.execute(text("SELECT 1"))
+    db.commit()
+    assert received == []
+
+
+def test_all_reaches_every_kind():
+    received = []
+    bus = InvalidationBus("test_channel")
+    bus.subscribe(VARIANT, lambda key: received.append((VARIANT, key)))
+    bus.subscribe(STATS, lambda key: received.append((STATS, key)))
+
+    bus.apply(ALL, "")
+    assert sorted(received) == [(STATS, ""), (VARIANT, "")]
+
+
+def test_new_variant_invalidates_candidates(db, make_variant):
+    make_variant(message="First")
+    _, variants = get_candidate_variants(db, "welcome", "en-US")
+    assert [variant["message"] for variant in variants] == ["First"]
+    assert candidate_cache.get(("default", "welcome", "en-US")) is not None
+
+    store_variant(db, "welcome", "Second", "en-US")
+    _, variants = get_candidate_variants(db, "welcome", "en-US")
+    assert sorted(variant["message"] for variant in variants) == ["First", "Second"]
+
+
+def test_cache_reports_every_removal():
+    removed = []
+    cache = TTLCache(max_size=2, ttl=60.0, on_evict=lambda key, value: removed.append((key, value)))
+
+    cache.set("a", 1)
+    cache.set("a", 2)  # Replaced
+    cache.set("b", 3)
+    cache.set("c", 4)  # Evicts "a"
+    cache.set("d", 5, ttl=-1.0)  # Evicts "b", then expires on read
+    assert cache.get("d") is None
+    cache.delete("c")
+    assert removed == [("a", 1), ("a", 2), ("b", 3), ("d", 5), ("c", 4)]
+
+    cache.set("e", 6)
+    cache.clear()
+    assert removed[-1] == ("e", 6)
+
+
+def test_variant_index_follows_the_cache(db, make_variant, monkeypatch):
+    welcome = make_variant()
+    other = make_variant(intent_id="other")
+    monkeypatch.setattr(candidate_cache, "max_size", 2)  # One intent's locale chain (en-US, en)
+
+    get_candidate_variants(db, "welcome", "en-US")
+    assert set(variant_logic._cache_keys_by_variant) == {str(welcome.id)}
+
+    get_candidate_variants(db, "other", "en-US")  # Evicts the welcome entries
+    assert set(variant_logic._cache_keys_by_variant) == {str(other.id)}
+
+    variant_logic._invalidate_intent("other")
+    assert variant_logic._cache_keys_by_variant == {}
+
+
+def test_snapshot_index_follows_the_cache(db, make_variant):
+    welcome = make_variant()
+    other = make_variant(intent_id="other")
+    snapshot_store.get(db, "welcome", "en-US")
+    snapshot_store.get(db, "other", "en-US")
+    assert set(snapshot_store._keys_by_variant) == {str(welcome.id), str(other.id)}
+
+    snapshot_store.invalidate_intent("welcome")
+    assert set(snapshot_store._keys_by_variant) == {str(other.id)}
+
+
+def test_metric_invalidates_counts(client, db, make_variant):
+    variant = make_variant()
+    _, variants = get_candidate_variants(db, "welcome", "en-US")
+    assert variants[0]["sent"] == 0
+
+    response = client.post("/v1/metrics", json={"variant_id": str(variant.id), "event_type": "sent"})
+    assert response.status_code == 200
+
+    _, variants = get_candidate_variants(db, "welcome", "en-US")
+    assert variants[0]["sent"] == 1
+
+
+def test_notify_reaches_other_workers(engine):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("LISTEN/NOTIFY needs Postgres (set TEST_DATABASE_URL)")
+
+    marker = f"test-{time.time_ns()}"
+    received = threading.Event()
+    listener = InvalidationBus(settings.invalidation_channel)
+    listener.subscribe(VARIANT, lambda key: key == marker and received.set())
+    listener.start(engine)
+    try:
+        time.sleep(0.5)  # Let the listener issue LISTEN
+
+        session = SessionLocal()
+        try:
+            invalidation_bus.publish(session, VARIANT, marker)
+            # Only observe the NOTIFY, not the local after_commit delivery
+            session.info.clear()
+            session.commit()
+        finally:
+            session.close()
+
+        assert received.wait(5.0)
+    finally:
+        listener.stop()
@@ -0,0 +1,144 @@
+"""Tests for the metrics journal and its replay into the database."""
+
+import struct
+import zlib
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.models import Metric
+from app.routers import metrics as metrics_router
+from app.services import journal as journal_module
+from app.services.journal import MetricJournal, encode_event, read_segment
+
+
+def _event(variant_id, event_type="sent", segment=None):
+    return (variant_id, event_type, datetime.now(timezone.utc), uuid4().hex, segment)
+
+
+def _stored(db) -> int:
+    db.expire_all()
+    return db.query(Metric).count()
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    """Journal in a temporary directory, used by the metrics router."""
+    metric_journal = MetricJournal(str(tmp_path), segment_bytes=1024 * 1024, fsync=False)
+    monkeypatch.setattr(metrics_router, "get_metric_journal", lambda: metric_journal)
+    yield metric_journal
+    metric_journal.close()
+
+
+def test_replay_after_database_outage(client, db, make_variant, journal, monkeypatch):
+    variant = make_variant()
+    events = [
+        {"variant_id": str(variant.id), "event_type": "sent", "event_id": f"sent-{i}"} for i in range(5)
+    ] + [{"variant_id": str(variant.id), "event_type": "clicked", "event_id": "clicked-0"}]
+
+    response = client.post("/v1/metrics/batch", json={"events": events})
+    assert response.json()["accepted"] == 6
+    assert _stored(db) == 0  # Acknowledged from the journal only
+
+    def database_down(session, func):
+        raise OperationalError("INSERT INTO metrics", {}, Exception("connection refused"))
+
+    with monkeypatch.context() as patched:
+        patched.setattr(metrics_router, "run_write", database_down)
+        assert metrics_router.replay_journal() == 0
+    assert len(journal.sealed_segments()) == 1  # Kept for the next replay
+    assert _stored(db) == 0
+
+    assert metrics_router.replay_journal() == 6
+    assert journal.sealed_segments() == []
+    assert _stored(db) == 6
+    assert db.query(Metric).filter(Metric.event_type == "clicked").count() == 1
+
+
+def test_replay_is_idempotent(db, make_variant, journal):
+    variant = make_variant()
+    journal.append([_event(variant.id) for _ in range(3)])
+    journal.rotate()
+    [segment] = journal.sealed_segments()
+    data = segment.read_bytes()
+
+    assert metrics_router.replay_journal() == 3
+
+    # A crash between the insert and the unlink leaves the segment behind
+    segment.write_bytes(data)
+    metrics_router.recent_event_ids.clear()
+    assert metrics_router.replay_journal() == 0
+    assert _stored(db) == 3
+    assert not segment.exists()
+
+
+def test_rotation_seals_full_segments(tmp_path):
+    variant_id = uuid4()
+    frame_size = len(encode_event(*_event(variant_id)))
+    metric_journal = MetricJournal(str(tmp_path), segment_bytes=3 * frame_size, fsync=False)
+    try:
+        events = [_event(variant_id) for _ in range(10)]
+        for event in events:
+            metric_journal.append([event])
+
+        sealed = metric_journal.sealed_segments()
+        assert len(sealed) == 3
+        assert all(len(read_segment(path)) == 3 for path in sealed)
+
+        assert metric_journal.rotate()
+        assert not metric_journal.rotate()  # Nothing written since
+        replayed = [event for path in metric_journal.sealed_segments() for event in read_segment(path)]
+        assert [event[3] for event in replayed] == [event[3] for event in events]
+    finally:
+        metric_journal.close()
+
+
+def test_torn_frame_is_discarded(tmp_path):
+    variant_id = uuid4()
+    metric_journal = MetricJournal(str(tmp_path), segment_bytes=1024 * 1024, fsync=False)
+    try:
+        metric_journal.append([_event(variant_id) for _ in range(3)])
+        metric_journal.rotate()
+        [segment] = metric_journal.sealed_segments()
+    finally:
+        metric_journal.close()
+
+    data = segment.read_bytes()
+    segment.write_bytes(data[:-5])  # Write torn by a crash
+    assert len(read_segment(segment)) == 2
+
+    corrupted = bytearray(data)
+    corrupted[-1] ^= 0xFF  # Payload no longer matches its CRC
+    segment.write_bytes(bytes(corrupted))
+    assert len(read_segment(segment)) == 2
+
+
+def test_segment_survives_round_trip(tmp_path):
+    variant_id = uuid4()
+    metric_journal = MetricJournal(str(tmp_path), segment_bytes=1024 * 1024, fsync=False)
+    try:
+        event = _event(variant_id, "clicked", segment="platform=ios")
+        metric_journal.append([event, _event(variant_id)])
+        metric_journal.rotate()
+        [segment] = metric_journal.sealed_segments()
+    finally:
+        metric_journal.close()
+
+    first, second = read_segment(segment)
+    assert first == (variant_id, "clicked", event[2], event[3], "platform=ios")
+    assert second[4] is None
+
+
+def test_reads_version_1_segments(tmp_path):
+    variant_id = uuid4()
+    timestamp = datetime(2025, 2, 15, 12, 1, 12, tzinfo=timezone.utc)
+    micros = int(timestamp.timestamp()) * 1_000_000
+    payload = struct.pack("<16sBqH", variant_id.bytes, 1, micros, 3) + b"abc"
+    segment = tmp_path / "000000000001.seg"
+    segment.write_bytes(
+        journal_module._MAGIC_V1 + struct.pack("<II", len(payload), zlib.crc32(payload)) + payload
+    )
+
+    assert read_segment(segment) == [(variant_id, "clicked", timestamp, "abc", None)]
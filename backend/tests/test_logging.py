@@ -0,0 +1,27 @@
+"""Tests for the JSON log formatter."""
+
+import logging
+from datetime import datetime, timezone
+
+import orjson
+
+from app.logging_config import JsonFormatter
+
+
+def test_timestamps_are_utc():
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "hello", (), None)
+    record.created = 1739620872.5  # 2025-02-15T12:01:12.5Z
+    record.msecs = 500
+
+    entry = orjson.loads(JsonFormatter().format(record))
+    assert entry["ts"] == "2025-02-15T12:01:12.500Z"
+    assert datetime.fromisoformat(entry["ts"]) == datetime.fromtimestamp(record.created, timezone.utc)
+
+
+def test_extra_fields_are_included():
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "hello %s", ("world",), None)
+    record.event = "resolve.request"
+
+    entry = orjson.loads(JsonFormatter().format(record))
+    assert entry["message"] == "hello world"
+    assert entry["event"] == "resolve.request"
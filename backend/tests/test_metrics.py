@@ -0,0 +1,118 @@
+"""
+Tests for metric ingestion and its storage.
+
+Run on embedded SQLite by default and on Postgres with TEST_DATABASE_URL, so
+the same behavior is checked on both backends.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+
+import pytest
+from sqlalchemy import text
+
+from app.database import SessionLocal, run_write
+from app.models import Metric, Variant
+from app.routers import metrics as metrics_router
+
+
+def _count(db, **filters) -> int:
+    db.expire_all()
+    return db.query(Metric).filter_by(**filters).count()
+
+
+def test_variant_ids_round_trip(db, make_variant):
+    variant = make_variant()
+    db.expire_all()
+    stored = db.query(Variant).filter(Variant.id == variant.id).one()
+    assert isinstance(stored.id, UUID)
+    assert stored.id == variant.id
+
+
+def test_record_metric(client, db, make_variant):
+    variant = make_variant()
+    response = client.post("/v1/metrics", json={"variant_id": str(variant.id), "event_type": "clicked"})
+
+    assert response.json() == {"status": "ok"}
+    assert _count(db, variant_id=variant.id, event_type="clicked") == 1
+
+
+def test_rejects_unknown_event_type(client, make_variant):
+    variant = make_variant()
+    response = client.post("/v1/metrics", json={"variant_id": str(variant.id), "event_type": "opened"})
+    assert response.status_code == 400
+
+
+def test_temporary_variant_ids_are_skipped(client, db):
+    response = client.post("/v1/metrics", json={"variant_id": "temp-123", "event_type": "sent"})
+    assert response.status_code == 200
+    assert _count(db) == 0
+
+
+def test_retries_are_recorded_once(client, db, make_variant):
+    variant = make_variant()
+    event = {"variant_id": str(variant.id), "event_type": "sent", "event_id": "retry-1"}
+
+    client.post("/v1/metrics", json=event)
+    client.post("/v1/metrics", json=event)
+    # Once the worker forgets it, the unique index still catches the retry
+    metrics_router.recent_event_ids.clear()
+    client.post("/v1/metrics", json=event)
+
+    assert _count(db, event_id="retry-1") == 1
+
+
+def test_batch_skips_duplicates(client, db, make_variant):
+    variant = make_variant()
+    client.post("/v1/metrics", json={"variant_id": str(variant.id), "event_type": "sent", "event_id": "a"})
+    metrics_router.recent_event_ids.clear()
+
+    events = [
+        {"variant_id": str(variant.id), "event_type": "sent", "event_id": "a"},  # Already stored
+        {"variant_id": str(variant.id), "event_type": "sent", "event_id": "b"},
+        {"variant_id": str(variant.id), "event_type": "sent", "event_id": "b"},  # Repeated in the batch
+        {"variant_id": str(variant.id), "event_type": "clicked"},
+        {"variant_id": "temp-123", "event_type": "sent"},
+    ]
+    response = client.post("/v1/metrics/batch", json={"events": events})
+
+    assert response.json() == {"status": "ok", "accepted": 2, "skipped": 3}
+    assert _count(db, variant_id=variant.id) == 3
+
+
+def test_event_ids_are_unique_per_tenant(client, db, make_variant):
+    ours = make_variant(tenant_id="a@example.com")
+    theirs = make_variant(tenant_id="b@example.com")
+
+    for variant in (ours, theirs):
+        event = {"variant_id": str(variant.id), "event_type": "sent", "event_id": "shared"}
+        assert client.post("/v1/metrics/batch", json={"events": [event]}).json()["accepted"] == 1
+
+    assert _count(db, event_id="shared", tenant_id="a@example.com") == 1
+    assert _count(db, event_id="shared", tenant_id="b@example.com") == 1
+
+
+def test_concurrent_writes_are_all_recorded(engine, db, make_variant):
+    variant = make_variant()
+
+    def record(index: int) -> int:
+        session = SessionLocal()
+        try:
+            event = metrics_router.MetricRequest(
+                variant_id=str(variant.id), event_type="sent", event_id=f"concurrent-{index}"
+            )
+            return run_write(session, lambda writer: metrics_router._record_batch(writer, [event]))
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert sum(pool.map(record, range(40))) == 40
+    assert _count(db, variant_id=variant.id) == 40
+
+
+def test_sqlite_uses_wal(engine):
+    if engine.dialect.name != "sqlite":
+        pytest.skip("SQLite only")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA foreign_keys")).scalar() == 1
@@ -0,0 +1,95 @@
+"""Tests for /v1/resolve: generation under caller deadlines and admission control."""
+
+import asyncio
+import threading
+
+import pytest
+from starlette.requests import Request
+
+from app.database import get_db
+from app.main import app
+from app.routers import auth as auth_router
+from app.routers import resolve as resolve_router
+from app.services.n8n_client import get_n8n_client
+from app.services.rate_limit import RateLimiter
+
+
+@pytest.fixture
+def request_session(db):
+    """Serve requests with the test's session, so tests can tell it apart."""
+    app.dependency_overrides[get_db] = lambda: db
+    yield db
+    app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.mark.parametrize("mode", ["sequential", "concurrent", "batch"])
+def test_deadline_fallback_does_not_share_the_session(client, request_session, monkeypatch, mode):
+    monkeypatch.setattr(resolve_router.settings, "ab_generation_mode", mode)
+
+    loader_sessions = []
+    release = threading.Event()
+
+    def slow_load(session, *args):
+        # Still running on its thread when the deadline expires
+        loader_sessions.append(session)
+        release.wait(5)
+        return {}
+
+    async def slow_generation(*args, **kwargs):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(resolve_router, "load_existing_messages", slow_load)
+    monkeypatch.setattr(get_n8n_client(), "resolve_intent", slow_generation)
+
+    try:
+        response = client.post("/v1/resolve", json={
+            "intent_id": "welcome", "base_message": "Base", "deadline_ms": 300
+        })
+    finally:
+        release.set()
+
+    assert response.status_code == 200
+    assert response.json()["resolved_message"] == "Base"
+    assert loader_sessions and all(session is not request_session for session in loader_sessions)
+
+
+@pytest.fixture
+def rate_limits(monkeypatch):
+    """Fresh rate limiter allowing a burst of 2 resolves per client, without refill."""
+    monkeypatch.setattr(resolve_router, "rate_limiter", RateLimiter())
+    monkeypatch.setattr(resolve_router.settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(resolve_router.settings, "rate_limit_resolve_per_key", 0.0)
+    monkeypatch.setattr(resolve_router.settings, "rate_limit_resolve_burst_per_key", 2.0)
+
+
+def test_invalid_keys_are_throttled_before_their_lookup(client, rate_limits, monkeypatch):
+    monkeypatch.setattr(auth_router.settings, "tenant_isolation", True)
+    lookups = []
+    monkeypatch.setattr(auth_router, "get_api_key_owner", lambda api_key, db: lookups.append(api_key))
+
+    statuses = [
+        client.post("/v1/resolve", json={"intent_id": "welcome", "base_message": "Base"},
+                    headers={"X-API-Key": "pbk_invalid"}).status_code
+        for _ in range(4)
+    ]
+
+    assert statuses == [401, 401, 429, 429]
+    assert len(lookups) == 2
+
+
+def _request(forwarded_for=None, client=("10.0.0.1", 443)) -> Request:
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request({"type": "http", "headers": headers, "client": client})
+
+
+@pytest.mark.parametrize("hops, forwarded_for, expected", [
+    (0, "203.0.113.7, 198.51.100.2", "addr:10.0.0.1"),  # Header not trusted
+    (1, "203.0.113.7, 198.51.100.2", "addr:198.51.100.2"),  # Appended by the one trusted proxy
+    (2, "203.0.113.7, 198.51.100.2", "addr:203.0.113.7"),
+    (3, "203.0.113.7", "addr:203.0.113.7"),
+    (1, None, "addr:10.0.0.1"),
+])
+def test_anonymous_callers_are_keyed_by_their_address(monkeypatch, hops, forwarded_for, expected):
+    monkeypatch.setattr(resolve_router.settings, "rate_limit_trusted_proxies", hops)
+    assert resolve_router._client_key(None, _request(forwarded_for)) == expected
+    assert resolve_router._client_key("pbk_live", _request(forwarded_for)) == "pbk_live"
@@ -66,7 +66,9 @@ class FluttersdkPlugin : FlutterPlugin, PushBunnyApi {
                 val response = recordMetric(
                     variantId = request.variantId,
                     eventType = request.eventType,
-                    timestamp = request.timestamp
+                    timestamp = request.timestamp,
+                    eventId = request.eventId,
+                    apiKey = request.apiKey
                 )
 
                 val pigeonResponse = com.inotter.pushbunnyflutter.fluttersdk.MetricResponse(
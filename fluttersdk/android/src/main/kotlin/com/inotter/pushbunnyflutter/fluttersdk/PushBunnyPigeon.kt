@@ -126,7 +126,11 @@ data class MetricRequest (
   /** The type of event: "sent" or "clicked" */
   val eventType: String,
   /** Optional ISO 8601 timestamp (defaults to current time if not provided) */
-  val timestamp: String? = null
+  val timestamp: String? = null,
+  /** API key used for generateNotificationBody (required by tenant-isolated backends) */
+  val apiKey: String? = null,
+  /** Idempotency key; the same value on every retry of one event records it once */
+  val eventId: String? = null
 )
  {
   companion object {
@@ -134,7 +138,9 @@ data class MetricRequest (
       val variantId = pigeonVar_list[0] as String
       val eventType = pigeonVar_list[1] as String
       val timestamp = pigeonVar_list[2] as String?
-      return MetricRequest(variantId, eventType, timestamp)
+      val apiKey = pigeonVar_list[3] as String?
+      val eventId = pigeonVar_list[4] as String?
+      return MetricRequest(variantId, eventType, timestamp, apiKey, eventId)
     }
   }
   fun toList(): List<Any?> {
@@ -142,6 +148,8 @@ data class MetricRequest (
       variantId,
       eventType,
       timestamp,
+      apiKey,
+      eventId,
     )
   }
 }
@@ -48,7 +48,9 @@ public class FluttersdkPlugin: NSObject, FlutterPlugin, PushBunnyApi {
         let response = try await MetricsApiKt.recordMetric(
           variantId: request.variantId,
           eventType: request.eventType,
-          timestamp: request.timestamp
+          timestamp: request.timestamp,
+          eventId: request.eventId,
+          apiKey: request.apiKey
         )
 
         let pigeonResponse = MetricResponse(
@@ -148,6 +148,10 @@ struct MetricRequest {
   var eventType: String
   /// Optional ISO 8601 timestamp (defaults to current time if not provided)
   var timestamp: String? = nil
+  /// API key used for generateNotificationBody (required by tenant-isolated backends)
+  var apiKey: String? = nil
+  /// Idempotency key; the same value on every retry of one event records it once
+  var eventId: String? = nil
 
 
   // swift-format-ignore: AlwaysUseLowerCamelCase
@@ -155,11 +159,15 @@ struct MetricRequest {
     let variantId = pigeonVar_list[0] as! String
     let eventType = pigeonVar_list[1] as! String
     let timestamp: String? = nilOrValue(pigeonVar_list[2])
+    let apiKey: String? = nilOrValue(pigeonVar_list[3])
+    let eventId: String? = nilOrValue(pigeonVar_list[4])
 
     return MetricRequest(
       variantId: variantId,
       eventType: eventType,
-      timestamp: timestamp
+      timestamp: timestamp,
+      apiKey: apiKey,
+      eventId: eventId
     )
   }
   func toList() -> [Any?] {
@@ -167,6 +175,8 @@ struct MetricRequest {
       variantId,
       eventType,
       timestamp,
+      apiKey,
+      eventId,
     ]
   }
 }
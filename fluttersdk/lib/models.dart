@@ -4,6 +4,8 @@
 /// a stable public API that won't break when Pigeon is updated.
 library;
 
+import 'dart:math';
+
 /// Request data for generating a notification.
 class PushBunnyNotificationRequest {
   const PushBunnyNotificationRequest({
@@ -45,12 +47,17 @@ class PushBunnyNotificationResponse {
 }
 
 /// Request data for recording a metric event.
+///
+/// Create one request per event and pass that same instance on retries: its
+/// [eventId] lets the backend record the event only once.
 class PushBunnyMetricRequest {
-  const PushBunnyMetricRequest({
+  PushBunnyMetricRequest({
     required this.variantId,
     required this.eventType,
     this.timestamp,
-  });
+    this.apiKey,
+    String? eventId,
+  }) : eventId = eventId ?? newEventId();
 
   /// The variant ID returned from generateNotification
   final String variantId;
@@ -60,6 +67,23 @@ class PushBunnyMetricRequest {
 
   /// Optional ISO 8601 timestamp (defaults to current time if not provided)
   final String? timestamp;
+
+  /// API key used for generateNotification (required by tenant-isolated backends)
+  final String? apiKey;
+
+  /// Idempotency key (a random UUID unless given, e.g. to rebuild a stored event)
+  final String eventId;
+
+  /// Creates a random (version 4) UUID for [eventId].
+  static String newEventId() {
+    final random = Random.secure();
+    final bytes = List<int>.generate(16, (_) => random.nextInt(256));
+    bytes[6] = (bytes[6] & 0x0f) | 0x40;
+    bytes[8] = (bytes[8] & 0x3f) | 0x80;
+    final hex = bytes.map((b) => b.toRadixString(16).padLeft(2, '0')).join();
+    return '${hex.substring(0, 8)}-${hex.substring(8, 12)}-${hex.substring(12, 16)}-'
+        '${hex.substring(16, 20)}-${hex.substring(20)}';
+  }
 }
 
 /// Response data from metric recording.
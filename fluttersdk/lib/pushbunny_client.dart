@@ -135,6 +135,8 @@ class PushBunnyClient {
         variantId: request.variantId,
         eventType: request.eventType,
         timestamp: request.timestamp,
+        apiKey: request.apiKey,
+        eventId: request.eventId,
       );
 
       final pigeonResponse = await _api.recordMetric(pigeonRequest);
@@ -100,6 +100,8 @@ class MetricRequest {
     required this.variantId,
     required this.eventType,
     this.timestamp,
+    this.apiKey,
+    this.eventId,
   });
 
   /// The variant ID returned from generateNotificationBody
@@ -111,11 +113,19 @@ class MetricRequest {
   /// Optional ISO 8601 timestamp (defaults to current time if not provided)
   String? timestamp;
 
+  /// API key used for generateNotificationBody (required by tenant-isolated backends)
+  String? apiKey;
+
+  /// Idempotency key; the same value on every retry of one event records it once
+  String? eventId;
+
   Object encode() {
     return <Object?>[
       variantId,
       eventType,
       timestamp,
+      apiKey,
+      eventId,
     ];
   }
 
@@ -125,6 +135,8 @@ class MetricRequest {
       variantId: result[0]! as String,
       eventType: result[1]! as String,
       timestamp: result[2] as String?,
+      apiKey: result[3] as String?,
+      eventId: result[4] as String?,
     );
   }
 }
@@ -66,6 +66,8 @@ class MetricRequest {
     required this.variantId,
     required this.eventType,
     this.timestamp,
+    this.apiKey,
+    this.eventId,
   });
 
   /// The variant ID returned from generateNotificationBody
@@ -76,6 +78,12 @@ class MetricRequest {
 
   /// Optional ISO 8601 timestamp (defaults to current time if not provided)
   final String? timestamp;
+
+  /// API key used for generateNotificationBody (required by tenant-isolated backends)
+  final String? apiKey;
+
+  /// Idempotency key; the same value on every retry of one event records it once
+  final String? eventId;
 }
 
 /// Response data from metric recording.
@@ -39,6 +39,30 @@ void main() {
       expect(response.resolvedMessage, 'Optimized message');
     });
 
+    test('PushBunnyMetricRequest keeps one eventId per event', () {
+      final request = PushBunnyMetricRequest(
+        variantId: 'variant-123',
+        eventType: 'sent',
+      );
+      final other = PushBunnyMetricRequest(
+        variantId: 'variant-123',
+        eventType: 'sent',
+      );
+
+      expect(request.eventId, matches(RegExp(r'^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$')));
+      expect(other.eventId, isNot(request.eventId));
+    });
+
+    test('PushBunnyMetricRequest accepts a stored eventId', () {
+      final request = PushBunnyMetricRequest(
+        variantId: 'variant-123',
+        eventType: 'clicked',
+        eventId: 'stored-id',
+      );
+
+      expect(request.eventId, 'stored-id');
+    });
+
     test('PushBunnyException formats correctly', () {
       final exception = PushBunnyException(
         code: 'TEST_ERROR',
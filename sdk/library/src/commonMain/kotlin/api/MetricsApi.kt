@@ -4,6 +4,8 @@ import io.ktor.client.call.*
 import io.ktor.client.request.*
 import io.ktor.http.*
 import kotlinx.datetime.Clock
+import kotlin.uuid.ExperimentalUuidApi
+import kotlin.uuid.Uuid
 import models.MetricEventType
 import models.MetricRequest
 import models.MetricResponse
@@ -20,6 +22,11 @@ import network.HttpClientProvider
  * @param variantId The variant ID returned from generateNotificationBody
  * @param eventType The type of event (use MetricEventType.SENT or MetricEventType.CLICKED)
  * @param timestamp Optional ISO 8601 timestamp (defaults to current time)
+ * @param eventId Idempotency key for this event. Create it once per event with [newEventId]
+ *   and pass the same value on every retry, so the backend records the event only once.
+ *   Events sent without one can't be told apart from their retries.
+ * @param apiKey The API key used for generateNotificationBody. Required when the backend
+ *   scopes data per tenant (TENANT_ISOLATION); events without it are then rejected.
  * @return MetricResponse with status "ok" if successful
  * @throws IllegalArgumentException if eventType is not "sent" or "clicked"
  * @throws Exception if the request fails (network error, server error, etc.)
@@ -38,13 +45,23 @@ import network.HttpClientProvider
  *     eventType = MetricEventType.CLICKED.value,
  *     timestamp = "2025-02-15T12:01:12Z"
  * )
+ *
+ * // Record a "sent" metric that may be retried; pass the same eventId on every attempt
+ * val eventId = newEventId()
+ * val response = recordMetric(
+ *     variantId = "a2f3c523-9240-4013-8e86-acf2600c6129",
+ *     eventType = MetricEventType.SENT.value,
+ *     eventId = eventId
+ * )
  * ```
  */
 @Throws(Exception::class)
 suspend fun recordMetric(
     variantId: String,
     eventType: String,
-    timestamp: String? = null
+    timestamp: String? = null,
+    eventId: String? = null,
+    apiKey: String? = null
 ): MetricResponse {
     // Validate event type
     val validEventTypes = setOf(MetricEventType.SENT.value, MetricEventType.CLICKED.value)
@@ -60,7 +77,9 @@ suspend fun recordMetric(
             MetricRequest(
                 variantId = variantId,
                 eventType = eventType,
-                timestamp = timestamp ?: Clock.System.now().toString()
+                timestamp = timestamp ?: Clock.System.now().toString(),
+                eventId = eventId,
+                apiKey = apiKey
             )
         )
     }
@@ -68,3 +87,13 @@ suspend fun recordMetric(
     return response.body<MetricResponse>()
 }
 
+/**
+ * Creates an idempotency key for [recordMetric].
+ *
+ * Call it once per logical event (e.g. when the notification is shown) and pass the
+ * result on every attempt to record that event.
+ *
+ * @return A random UUID string
+ */
+@OptIn(ExperimentalUuidApi::class)
+fun newEventId(): String = Uuid.random().toString()
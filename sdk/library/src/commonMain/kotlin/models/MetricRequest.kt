@@ -13,6 +13,10 @@ internal data class MetricRequest(
     val variantId: String,
     @SerialName("event_type")
     val eventType: String,
-    val timestamp: String
+    val timestamp: String,
+    @SerialName("event_id")
+    val eventId: String? = null,
+    @SerialName("api_key")
+    val apiKey: String? = null
 )
 